@@ -0,0 +1,150 @@
+import os
+import re
+from datetime import date
+from collections import defaultdict, OrderedDict
+
+# --- 本地預先彙總 ---
+# FINANCE / HEALTH 問題先在本地算好合計、分組與期間差異，Gemini 只拿彙總表 + 少量原始樣本
+AGG_DOMAINS = {"FINANCE", "HEALTH"}
+AGG_MIN_ROWS = int(os.getenv("AGG_MIN_ROWS", "20"))          # 筆數太少的資料庫直接給原始資料
+AGG_SAMPLE_ROWS = int(os.getenv("AGG_SAMPLE_ROWS", "15"))    # 附帶的原始樣本筆數 (最新在前)
+AGG_MAX_GROUPS = 20                                          # 分組超過此數量時其餘併為「其他」
+
+# 日期欄位 (依序嘗試)；流水帳為「日期」、飲食紀錄為「用餐時間」
+DATE_PROPS = ["日期", "用餐時間", "Date", "date"]
+# 優先作為分組的欄位，找不到時改用「重複值多的文字欄位」
+GROUP_PROPS = ["餐別", "類別", "分類", "類型", "預算類別", "帳戶", "Category", "Type"]
+MAX_GROUP_CARDINALITY = 30
+
+DATE_RE = re.compile(r"^\d{4}-\d{2}-\d{2}")
+
+
+def _is_number(v):
+    return isinstance(v, (int, float)) and not isinstance(v, bool)
+
+
+def _num(x):
+    x = round(x, 2)
+    return int(x) if x == int(x) else x
+
+
+def _find_date_prop(rows):
+    for prop in DATE_PROPS:
+        if any(isinstance(r.get(prop), str) and DATE_RE.match(r[prop]) for r in rows): return prop
+    # 沒有慣用名稱時，取第一個大多為日期格式的欄位
+    counts = defaultdict(int)
+    for r in rows:
+        for k, v in r.items():
+            if isinstance(v, str) and DATE_RE.match(v): counts[k] += 1
+    best = max(counts, key=counts.get, default=None)
+    return best if best and counts[best] >= len(rows) / 2 else None
+
+
+def _numeric_props(rows):
+    counts = defaultdict(int)
+    for r in rows:
+        for k, v in r.items():
+            if _is_number(v): counts[k] += 1
+    return [k for k in counts if counts[k] >= len(rows) / 2]
+
+
+def _group_props(rows, exclude):
+    values = defaultdict(set); counts = defaultdict(int)
+    for r in rows:
+        for k, v in r.items():
+            if k in exclude or not isinstance(v, str) or not v or DATE_RE.match(v): continue
+            values[k].add(v); counts[k] += 1
+    candidates = [k for k in values if len(values[k]) <= MAX_GROUP_CARDINALITY and len(values[k]) < counts[k] / 2]
+    preferred = [k for k in GROUP_PROPS if k in candidates]
+    return preferred or candidates[:1]
+
+
+def _sum_row(rows, numeric):
+    out = {"筆數": len(rows)}
+    for col in numeric:
+        out[f"{col}合計"] = _num(sum(r[col] for r in rows if _is_number(r.get(col))))
+    return out
+
+
+# ==========================================
+# 彙總表
+# ==========================================
+def summarize_rows(rows):
+    """
+    回傳 OrderedDict {表名: [row dict]}：總計 / 依期間 (含與前期差異) / 依分組
+    rows 沒有數值欄位時回傳空 dict
+    """
+    numeric = _numeric_props(rows)
+    if not numeric: return OrderedDict()
+    date_prop = _find_date_prop(rows)
+    tables = OrderedDict()
+
+    totals = []
+    for col in numeric:
+        values = [r[col] for r in rows if _is_number(r.get(col))]
+        totals.append({
+            "欄位": col, "合計": _num(sum(values)), "平均": _num(sum(values) / len(values)),
+            "最小": _num(min(values)), "最大": _num(max(values)), "筆數": len(values)
+        })
+    tables["總計"] = totals
+
+    if date_prop:
+        dates = sorted(r[date_prop][:10] for r in rows if isinstance(r.get(date_prop), str) and DATE_RE.match(r[date_prop]))
+        # 一個月內逐日彙總 (例如每日攝取量)，更長的範圍逐月彙總
+        by_day = bool(dates) and (date.fromisoformat(dates[-1]) - date.fromisoformat(dates[0])).days <= 31
+        width, label = (10, "日") if by_day else (7, "月")
+        periods = defaultdict(list)
+        for r in rows:
+            v = r.get(date_prop)
+            if isinstance(v, str) and DATE_RE.match(v): periods[v[:width]].append(r)
+        period_rows, prev = [], None
+        for period in sorted(periods):
+            row = {f"期間({label})": period, **_sum_row(periods[period], numeric)}
+            if prev:
+                for col in numeric:
+                    row[f"{col}較前期"] = _num(row[f"{col}合計"] - prev[f"{col}合計"])
+            period_rows.append(row); prev = row
+        tables[f"依{label}"] = period_rows
+
+    for group in _group_props(rows, exclude={date_prop}):
+        groups = defaultdict(list)
+        for r in rows: groups[r.get(group) or "(未填)"].append(r)
+        group_rows = sorted(({group: k, **_sum_row(v, numeric)} for k, v in groups.items()),
+                            key=lambda x: -abs(x[f"{numeric[0]}合計"]))
+        if len(group_rows) > AGG_MAX_GROUPS:
+            rest = group_rows[AGG_MAX_GROUPS:]
+            other = {group: f"其他 ({len(rest)} 類)", "筆數": sum(g["筆數"] for g in rest)}
+            for col in numeric: other[f"{col}合計"] = _num(sum(g[f"{col}合計"] for g in rest))
+            group_rows = group_rows[:AGG_MAX_GROUPS] + [other]
+        tables[f"依{group}"] = group_rows
+    return tables
+
+
+def _partial_note(rows, info):
+    """查詢因筆數上限而沒撈完：說明只涵蓋最新幾筆、還有多少筆未納入 (線上查詢時只知道還有更多)"""
+    matched = info.get("matched")
+    rest = f"另有 {matched - len(rows)} 筆未納入" if matched is not None else "尚有更多紀錄未納入"
+    return f"部分樣本：僅最新 {len(rows)} 筆，{rest}"
+
+
+def aggregate_raw_data(raw_data, domain, truncated=None):
+    """
+    將 raw_data 中筆數夠多的資料庫換成彙總表 + 原始樣本 (給 pack_context 使用)
+    其他資料庫維持原樣
+    truncated: {資料庫: fetch stats}，列出的資料庫因筆數上限沒撈完，彙總表標為部分樣本而非精確總計
+    """
+    if domain not in AGG_DOMAINS: return raw_data
+    truncated = truncated or {}
+    out = OrderedDict()
+    for name, rows in raw_data.items():
+        tables = summarize_rows(rows) if len(rows) >= AGG_MIN_ROWS else {}
+        if not tables:
+            out[name] = rows
+            continue
+        partial = _partial_note(rows, truncated[name]) if name in truncated else None
+        for title, table in tables.items():
+            if partial: out[f"{name} {title} ({partial})"] = table
+            else: out[f"{name} {title} (本地精確計算，共 {len(rows)} 筆)" if title == "總計" else f"{name} {title}"] = table
+        out[f"{name} 原始樣本 (最新 {min(AGG_SAMPLE_ROWS, len(rows))} 筆)"] = rows[:AGG_SAMPLE_ROWS]
+        print(f"🧮 Aggregate [{name}]: {len(rows)} 筆 → {', '.join(f'{t} {len(v)}' for t, v in tables.items())}")
+    return out
@@ -1,19 +1,46 @@
 import os
 import json
-import requests
 import urllib3
 import traceback
-import numpy as np
+import threading
 from datetime import datetime
-from flask import Flask, request, abort
+from flask import Flask, request, abort, send_file, jsonify, Response
 from linebot import LineBotApi, WebhookHandler
 from linebot.exceptions import InvalidSignatureError, LineBotApiError
 from linebot.models import MessageEvent, TextMessage, ImageMessage, FlexSendMessage, TextSendMessage
 
 # 匯入飲食小幫手模組
-from diet_helper_v1_1 import handle_diet_image, trigger_single_image_analysis
+from diet_helper_v1_1 import handle_diet_image, trigger_single_image_analysis, SESSION_STORE, DIET_QUEUE
 # 匯入 RAG 逆向查詢模組
-from rag_helper_v1_1 import handle_rag_query
+from rag_helper_v1_1 import handle_rag_query, DOMAIN_MAP, GLOBAL_DBS, INTENT_CACHE
+from intent_classifier_v1_0 import accuracy_report
+# 匯入 Notion 本地鏡像 (過期才增量同步)
+from notion_mirror_v1_0 import mirror_query, sync_all
+from notion_helper_v1_0 import extract_number, QUERY_FLIGHT
+from gemini_helper_v1_0 import GEMINI_FLIGHT
+# 匯入每月預算彙總 (已結束月份封存快取)
+from budget_helper_v1_0 import monthly_totals, month_window, budget_cache_status
+# 匯入筆記全文索引 (BM25)
+from knowledge_index_v1_0 import refresh_index, index_status
+# 匯入共用連線池 (keep-alive + 重試)
+from http_helper_v1_0 import http_post, PooledLineHttpClient
+# 匯入向量化蒙地卡羅模擬
+from forecast_helper_v1_0 import yearly_percentiles, MC_YEARS
+# 匯入本地圖表渲染 (取代 QuickChart 外部呼叫)
+from chart_helper_v1_0 import render_chart_url, touch_chart, chart_path, chart_hash, CHART_HASH_RE
+from cache_helper_v1_0 import TTLCache
+# 匯入背景工作佇列與 Reply/Push 自動切換
+from job_helper_v1_0 import JobQueue
+from line_helper_v1_0 import deliver_line_message, LINE_API_ENDPOINT, LINE_DATA_API_ENDPOINT
+from image_helper_v1_0 import image_stats
+# 匯入 Notion 寫入佇列 (write-behind)
+from write_queue_v1_0 import start_drainer, write_queue_status, retry_dead
+# 匯入關鍵字儀表板預先計算
+from dashboard_cache_v1_0 import DashboardCache, DASHBOARD_INTERVAL, DASHBOARD_MAX_STALE
+# 匯入分段計時與 Prometheus 指標
+from metrics_helper_v1_0 import request_trace, span, render_metrics
+# 匯入每日營養帳本
+from nutrition_ledger_v1_0 import claim_rebuild as claim_ledger_rebuild, rebuild as rebuild_ledger
 
 # 關閉 SSL 警告
 urllib3.disable_warnings(urllib3.exceptions.InsecureRequestWarning)
@@ -30,8 +57,12 @@ NOTION_TOKEN = os.getenv("NOTION_TOKEN")
 DB_MORTGAGE = os.getenv("DB_MORTGAGE")
 DB_SNAPSHOT = os.getenv("DB_SNAPSHOT")
 DB_BUDGET = os.getenv("BUDGET_DB_ID")
+# 可改指向本地 stub (壓測用)
+QUICKCHART_URL = os.getenv("QUICKCHART_URL", "https://quickchart.io/chart/create")
+# 管理用 route (例如重送 dead-letter) 需帶 X-Admin-Token；未設定時停用
+ADMIN_TOKEN = os.getenv("ADMIN_TOKEN")
 
-line_bot_api = LineBotApi(LINE_CHANNEL_ACCESS_TOKEN)
+line_bot_api = LineBotApi(LINE_CHANNEL_ACCESS_TOKEN, endpoint=LINE_API_ENDPOINT, data_endpoint=LINE_DATA_API_ENDPOINT, http_client=PooledLineHttpClient)
 handler = WebhookHandler(LINE_CHANNEL_SECRET)
 
 NOTION_HEADERS = {
@@ -44,10 +75,40 @@ NOTION_HEADERS = {
 LOAN_TOTAL_PRINCIPAL = 5330000
 BTC_GOAL = 1.0
 
+# Webhook 背景處理：/callback 驗證簽章後立即回 200，事件交給 worker 執行
+WEBHOOK_QUEUE = JobQueue("webhook", workers=int(os.getenv("WEBHOOK_WORKERS", "4")), max_depth=int(os.getenv("WEBHOOK_QUEUE_DEPTH", "100")))
+
+# 圖表網址快取 (key = 最終 config + 尺寸 + 背景色 的 hash)，資料沒變就不重打 QuickChart
+CHART_URL_CACHE = TTLCache("chart_url", ttl=int(os.getenv("CHART_URL_CACHE_TTL", "21600")), maxsize=int(os.getenv("CHART_URL_CACHE_SIZE", "256")))
+
+# 啟動時於背景預先同步所有資料庫鏡像 (DOMAIN_MAP 已涵蓋 DB_MORTGAGE / DB_SNAPSHOT / BUDGET_DB_ID)，再建立筆記索引
+MIRROR_DB_KEYS = sorted({key for keys in DOMAIN_MAP.values() for key in keys})
+
+# 關鍵字儀表板：背景定期重建卡片 (builder 於第 4 節定義，lambda 在執行時才查找)
+DASHBOARDS = DashboardCache("dashboard", DASHBOARD_INTERVAL, DASHBOARD_MAX_STALE)
+DASHBOARDS.register("mortgage", lambda: build_mortgage_cards(), ["房貸"])
+DASHBOARDS.register("snapshot", lambda: build_snapshot_cards(), ["BTC", "總資產", "預測"])
+DASHBOARDS.register("budget", lambda: build_budget_cards(), ["消費比較"])
+
+# 第一次部署時由飲食資料庫補上營養帳本的歷史紀錄；要在開始接收 webhook 前認領 (帳本內的標記，多個 worker 只認領一次)，
+# 之後新記錄的餐點會即時累加，rebuild 只補認領時間點之前建立的頁面
+LEDGER_REBUILD_BEFORE = claim_ledger_rebuild() if os.getenv("DIET_DB_ID") else None
+
+def warm_up():
+    sync_all(MIRROR_DB_KEYS)
+    DASHBOARDS.start()
+    refresh_index(GLOBAL_DBS)
+    if LEDGER_REBUILD_BEFORE:
+        rebuild_ledger(mirror_query(os.getenv("DIET_DB_ID"), label="ledger"), LEDGER_REBUILD_BEFORE)
+
 # ==========================================
 # 1. 錯誤處理 Flex Message (新增)
 # ==========================================
-def send_error_flex(reply_token, error_msg):
+def reply_event(event, message):
+    """回覆事件：Reply Token 仍有效時 Reply，排隊太久已過期則改用 Push"""
+    return deliver_line_message(event.reply_token, event.source.user_id, message, event.timestamp)
+
+def send_error_flex(event, error_msg):
     """當系統發生錯誤或超時，發送這個 Flex Message"""
     flex_content = {
         "type": "bubble",
@@ -74,45 +135,24 @@ def send_error_flex(reply_token, error_msg):
             ]
         }
     }
-    try:
-        line_bot_api.reply_message(reply_token, FlexSendMessage(alt_text="系統忙碌中", contents=flex_content))
-    except Exception as e:
-        print(f"❌ 無法發送錯誤訊息: {e}")
+    if not reply_event(event, FlexSendMessage(alt_text="系統忙碌中", contents=flex_content)):
+        print("❌ 無法發送錯誤訊息")
 
 # ==========================================
 # 2. 資料讀取函式 (Finance)
 # ==========================================
-def extract_number(prop):
-    if not prop: return 0
-    p_type = prop.get("type")
-    if p_type == "number": return prop.get("number", 0) or 0
-    elif p_type == "formula": return prop.get("formula", {}).get("number", 0) or 0
-    elif p_type == "rollup":
-        rollup = prop.get("rollup", {})
-        r_type = rollup.get("type")
-        if r_type == "number": return rollup.get("number", 0) or 0
-        elif r_type == "array":
-            total = 0
-            for item in rollup.get("array", []):
-                if item.get("type") == "number": total += item.get("number", 0) or 0
-                elif item.get("type") == "formula": total += item.get("formula", {}).get("number", 0) or 0
-            return total
-    return 0
-
 def get_current_mortgage():
     try:
-        res = requests.post(f"https://api.notion.com/v1/databases/{DB_MORTGAGE}/query", headers=NOTION_HEADERS, json={"page_size": 1}, verify=False)
-        data = res.json()
-        if data["results"]: return extract_number(data["results"][0]["properties"].get("剩餘本金", {}))
+        results = mirror_query(DB_MORTGAGE, {"page_size": 1}, max_rows=1, label="DB_MORTGAGE")
+        if results: return extract_number(results[0]["properties"].get("剩餘本金", {}))
     except: pass
     return LOAN_TOTAL_PRINCIPAL
 
 def get_asset_history(days=120):
-    query = {"page_size": days, "sorts": [{"property": "日期", "direction": "descending"}]}
+    query = {"sorts": [{"property": "日期", "direction": "descending"}]}
     try:
-        res = requests.post(f"https://api.notion.com/v1/databases/{DB_SNAPSHOT}/query", headers=NOTION_HEADERS, json=query, verify=False)
-        data = res.json()
-        results = data.get("results", [])
+        # 超過 100 天時自動翻頁，撈滿 days 筆即停止
+        results = mirror_query(DB_SNAPSHOT, query, max_rows=days, label="DB_SNAPSHOT")
         history = {"dates": [], "crypto": [], "us_stock": [], "tw_stock": [], "gold": [], "cash": [], "btc_holdings": [], "total_assets": []}
         for p in reversed(results):
             props = p["properties"]
@@ -130,50 +170,34 @@ def get_asset_history(days=120):
         return history
     except: return None
 
-def get_budget_monthly_6m():
-    query = {"page_size": 100, "sorts": [{"property": "預算類別", "direction": "descending"}]}
+def get_budget_monthly(months=6):
+    """最近 months 個月各類別的消費趨勢 + 上月最大類別 (已結束的月份讀封存快取)"""
     try:
-        res = requests.post(f"https://api.notion.com/v1/databases/{DB_BUDGET}/query", headers=NOTION_HEADERS, json=query, verify=False)
-        data = res.json()
-        monthly_data = {}
-        all_cats = set()
-        now = datetime.now()
-        current_ym_str = now.strftime("%Y%m")
-        if now.month == 1: last_month_date = datetime(now.year - 1, 12, 1)
-        else: last_month_date = datetime(now.year, now.month - 1, 1)
-        target_last_m_fmt = last_month_date.strftime("%y-%m")
-
-        for p in data.get("results", []):
-            props = p["properties"]
-            title_list = props.get("預算類別", {}).get("title", [])
-            if not title_list: continue
-            full_title = title_list[0]["plain_text"]
-            spent = abs(extract_number(props.get("實際花費", {})))
-            if len(full_title) > 6 and full_title[:6].isdigit():
-                ym_raw = full_title[:6]
-                if ym_raw > current_ym_str: continue 
-                cat = full_title[6:]
-                m_fmt = f"{ym_raw[2:4]}-{ym_raw[4:]}"
-                if m_fmt not in monthly_data: monthly_data[m_fmt] = {}
-                monthly_data[m_fmt][cat] = monthly_data[m_fmt].get(cat, 0) + spent
-                all_cats.add(cat)
-
-        sorted_months = sorted(list(monthly_data.keys()))[-6:] 
+        window = month_window(months)
+        monthly_data = monthly_totals(DB_BUDGET, window)
+        last_month = monthly_data.get(window[-2], {}) if len(window) > 1 else {}
+        sorted_months = [ym for ym in window if monthly_data[ym]]
+        all_cats = sorted({cat for ym in sorted_months for cat in monthly_data[ym]})
         datasets = []
         colors = ["#ff6384", "#36a2eb", "#cc65fe", "#ffce56", "#4bc0c0", "#9966ff", "#ff9f40", "#c9cbcf"]
-        
+
         top_cat_name, top_cat_amount = "N/A", 0
-        if target_last_m_fmt in monthly_data:
-            for cat, val in monthly_data[target_last_m_fmt].items():
-                if val > top_cat_amount: top_cat_amount = val; top_cat_name = cat
+        for cat, val in last_month.items():
+            if val > top_cat_amount: top_cat_amount = val; top_cat_name = cat
 
         for i, cat in enumerate(all_cats):
             data_points = []
             for m in sorted_months: data_points.append(int(monthly_data[m].get(cat, 0) / 1000))
             if sum(data_points) > 0:
                 datasets.append({"label": cat, "data": data_points, "borderColor": colors[i % len(colors)], "fill": False, "pointRadius": 3})
-        return sorted_months, datasets, top_cat_name, top_cat_amount
-    except: return [], [], "N/A", 0
+        labels = [f"{ym[2:4]}-{ym[4:]}" for ym in sorted_months]
+        return labels, datasets, top_cat_name, top_cat_amount
+    except Exception as e:
+        print(f"❌ Budget Error: {e}")
+        return [], [], "N/A", 0
+
+def get_budget_monthly_6m():
+    return get_budget_monthly(6)
 
 
 # ==========================================
@@ -186,35 +210,34 @@ def get_chart_url_post(config):
         for axis in ["xAxes", "yAxes"]:
             for scale in config["options"]["scales"].get(axis, []):
                 scale["gridLines"] = {"color": "#333"}; scale["ticks"] = {"fontColor": "#bbb", "fontSize": 10}
-    try:
-        res = requests.post("https://quickchart.io/chart/create", json={"chart": config, "width": 500, "height": 300, "backgroundColor": "#121212"}, verify=False)
-        if res.status_code == 200: return res.json().get('url')
-    except: pass
-    return "https://via.placeholder.com/500x300?text=Error"
+    width, height, background = 500, 300, "#121212"
+    cache_key = chart_hash(config, width, height, background)
+    cached_url = CHART_URL_CACHE.get(cache_key)
+    # 本地圖檔可能已被 LRU 淘汰：命中時順便 touch，檔案不在就重新渲染
+    if cached_url and (f"/charts/{cache_key}.png" not in cached_url or touch_chart(cache_key)): return cached_url
+    # 優先本地渲染 (由 /charts/<hash>.png 提供)，未設定 PUBLIC_BASE_URL 時才走 QuickChart
+    url = render_chart_url(config, width, height, background)
+    if not url:
+        try:
+            res = http_post(QUICKCHART_URL, json={"chart": config, "width": width, "height": height, "backgroundColor": background}, idempotent=True)
+            if res.status_code == 200: url = res.json().get('url')
+        except: pass
+    # 失敗的 placeholder 不快取，下次仍會重試
+    if not url: return "https://via.placeholder.com/500x300?text=Error"
+    CHART_URL_CACHE.set(cache_key, url)
+    return url
 
 def gen_monte_carlo(history_totals):
     if not history_totals or len(history_totals) < 5: return "", 0
-    arr = np.array(history_totals); arr[arr == 0] = 1 
-    daily_returns = np.diff(arr) / arr[:-1]
-    cagr = (1 + np.mean(daily_returns)) ** 365 - 1
-    vol = np.std(daily_returns) * np.sqrt(365)
-    cagr = max(min(cagr, 0.30), 0.02); vol = max(min(vol, 0.40), 0.05)
-    current_assets = arr[-1]
-    
-    years = 10; sims = 500
-    labels = [str(datetime.now().year + i) for i in range(1, years + 1)]
-    results = []
-    for _ in range(sims):
-        p = [current_assets]
-        for _ in range(years): p.append(p[-1] * (1 + np.random.normal(cagr, vol)))
-        results.append(p[1:])
-    res = np.array(results)
+    # 路徑數 / 年限 / 步長 / 模型 由 MC_* 環境變數設定 (見 forecast_helper)
+    cagr, pct = yearly_percentiles(history_totals)
+    labels = [str(datetime.now().year + i) for i in range(1, MC_YEARS + 1)]
     
-    def to_m(arr): return [round(x / 1000000, 1) for x in arr]
-    d90 = to_m(np.percentile(res, 90, axis=0))
-    d50 = to_m(np.percentile(res, 50, axis=0))
-    d10 = to_m(np.percentile(res, 10, axis=0))
-    median_val = int(np.percentile(res, 50, axis=0)[-1])
+    def to_m(arr): return [round(float(x) / 1000000, 1) for x in arr]
+    d90 = to_m(pct[90])
+    d50 = to_m(pct[50])
+    d10 = to_m(pct[10])
+    median_val = int(pct[50][-1])
 
     config = {
         "type": "line",
@@ -266,6 +289,27 @@ def card_chart_giga(title, url, val_text, sub_text=""):
 def card_spending_giga(title, url, cat_name, cat_amount):
     return {"type": "bubble", "size": "giga", "header": {"type": "box", "layout": "vertical", "backgroundColor": "#1e1e1e", "contents": [{"type": "text", "text": "SPENDING TREND", "color": "#42a5f5", "size": "xs", "weight": "bold"}, {"type": "text", "text": title, "weight": "bold", "size": "xl", "color": "#ffffff"}]}, "hero": {"type": "image", "url": url, "size": "full", "aspectRatio": "20:13", "aspectMode": "cover"}, "body": {"type": "box", "layout": "horizontal", "backgroundColor": "#1e1e1e", "contents": [{"type": "text", "text": f"上月最大: {cat_name}", "size": "sm", "color": "#aaaaaa", "flex": 1, "gravity": "center"}, {"type": "text", "text": f"${cat_amount:,.0f}", "size": "xl", "weight": "bold", "color": "#ef5350", "align": "end", "flex": 1}]}}
 
+# --- 儀表板卡片 (由 DASHBOARDS 背景重建) ---
+def build_mortgage_cards():
+    return {"房貸": card_mortgage(get_current_mortgage())}
+
+def build_snapshot_cards():
+    # BTC / 總資產 / 預測 共用同一份 120 天快照，只讀一次
+    hist = get_asset_history(120)
+    if hist is None: raise RuntimeError("無法讀取資產快照")
+    if not hist["total_assets"]: return {"BTC": card_btc(0), "總資產": None, "預測": None}
+    url_mc, med = gen_monte_carlo(hist["total_assets"])
+    return {
+        "BTC": card_btc(hist["btc_holdings"][-1] if hist["btc_holdings"] else 0),
+        "總資產": card_assets_v1(hist, gen_total_asset_url(hist)),
+        "預測": card_chart_giga("未來資產 (10Y)", url_mc, f"${med:,.0f}", "MONTE CARLO"),
+    }
+
+def build_budget_cards():
+    ml, md, top_cat, top_val = get_budget_monthly_6m()
+    if not ml: return {"消費比較": None}
+    return {"消費比較": card_spending_giga("每月消費變化 (6M)", gen_budget_chart_url(ml, md), top_cat, top_val)}
+
 
 # ==========================================
 # 5. Webhook 監聽
@@ -274,82 +318,125 @@ def card_spending_giga(title, url, cat_name, cat_amount):
 def callback():
     signature = request.headers['X-Line-Signature']
     body = request.get_data(as_text=True)
+    # 先同步驗證簽章，事件處理 (Gemini / Notion) 丟到背景，避免佔住 gthread 與 LINE 重送
+    if not handler.parser.signature_validator.validate(body, signature):
+        abort(400)
+    if not WEBHOOK_QUEUE.submit(handle_webhook_body, body, signature):
+        # 佇列已滿：退回同步處理，寧可慢也不要掉訊息
+        handle_webhook_body(body, signature)
+    return 'OK'
+
+def handle_webhook_body(body, signature):
     try:
         handler.handle(body, signature)
     except InvalidSignatureError:
-        abort(400)
-    return 'OK'
+        print("❌ Invalid Signature")
+
+@app.route("/status", methods=['GET'])
+def status():
+    return jsonify({
+        "webhook_queue": WEBHOOK_QUEUE.stats(),
+        "chart_url_cache": CHART_URL_CACHE.stats(),
+        "intent_cache": INTENT_CACHE.stats(),
+        "intent_classifier": accuracy_report(),
+        "knowledge_index": index_status(),
+        "budget_cache": budget_cache_status(),
+        "dashboards": DASHBOARDS.stats(),
+        "single_flight": [QUERY_FLIGHT.stats(), GEMINI_FLIGHT.stats()],
+        "image_preprocess": image_stats(),
+        "diet_sessions": SESSION_STORE.stats(),
+        "diet_queue": {**DIET_QUEUE.stats(), "recent_jobs": DIET_QUEUE.recent_jobs()},
+        "notion_writes": write_queue_status()
+    })
+
+@app.route("/status/notion-writes/retry", methods=['POST'])
+def retry_notion_writes():
+    """將 dead-letter 重新排入寫入佇列 (?id= 指定單筆，不指定時全部)"""
+    if not ADMIN_TOKEN or request.headers.get("X-Admin-Token") != ADMIN_TOKEN: abort(403)
+    write_id = request.args.get("id", type=int)
+    return jsonify({"requeued": retry_dead(write_id), "notion_writes": write_queue_status()})
+
+@app.route("/metrics", methods=['GET'])
+def metrics():
+    return Response(render_metrics(), mimetype="text/plain; version=0.0.4")
 
 @app.route("/", methods=['GET'])
 def home():
     return "Bot is awake!", 200
 
+@app.route("/charts/<chart_hash>.png", methods=['GET'])
+def serve_chart(chart_hash):
+    # 檔名即內容 hash，內容永不改變，可讓 LINE / CDN 長期快取
+    if not CHART_HASH_RE.match(chart_hash) or not touch_chart(chart_hash): abort(404)
+    response = send_file(os.path.abspath(chart_path(chart_hash)), mimetype="image/png")
+    response.headers["Cache-Control"] = "public, max-age=31536000, immutable"
+    return response
+
 # --- 🔥 文字訊息處理 ---
+# 指標的 command 標籤 (其餘文字一律視為 RAG)
+COMMAND_LABELS = {"房貸": "mortgage", "BTC": "btc", "總資產": "assets", "預測": "forecast", "消費比較": "spending", "完食": "diet_trigger"}
+
 @handler.add(MessageEvent, message=TextMessage)
 def handle_message(event):
+    text = event.message.text.strip()
+    command = COMMAND_LABELS.get("BTC" if text.upper() == "BTC" else text, "rag")
+    with request_trace(command, user=event.source.user_id):
+        handle_text_event(event)
+
+def handle_text_event(event):
     msg_original = event.message.text.strip()
     msg_upper = msg_original.upper()
     user_id = event.source.user_id 
     
     # --- 0. 先檢查是否為 "完食" (觸發單圖分析) ---
     if msg_original == "完食":
-        is_triggered = trigger_single_image_analysis(user_id, event.reply_token, line_bot_api)
+        is_triggered = trigger_single_image_analysis(user_id, event.reply_token, line_bot_api, event.timestamp)
         if is_triggered: return 
 
     # --- 1. 處理關鍵字指令 ---
     try:
-        if msg_original == "房貸":
-            rem = get_current_mortgage()
-            line_bot_api.reply_message(event.reply_token, FlexSendMessage(alt_text="房貸", contents=card_mortgage(rem)))
-        
-        elif msg_upper == "BTC":
-            hist = get_asset_history(1) 
-            if hist:
-                btc = hist["btc_holdings"][0] if hist["btc_holdings"] else 0
-                line_bot_api.reply_message(event.reply_token, FlexSendMessage(alt_text="BTC", contents=card_btc(btc)))
-                
-        elif msg_original == "總資產":
-            hist = get_asset_history(120)
-            if hist and hist["total_assets"]:
-                url_total = gen_total_asset_url(hist)
-                line_bot_api.reply_message(event.reply_token, FlexSendMessage(alt_text="總資產", contents=card_assets_v1(hist, url_total)))
-                
-        elif msg_original == "預測":
-            hist = get_asset_history(120)
-            if hist and hist["total_assets"]:
-                url_mc, med = gen_monte_carlo(hist["total_assets"])
-                line_bot_api.reply_message(event.reply_token, FlexSendMessage(alt_text="預測", contents=card_chart_giga("未來資產 (10Y)", url_mc, f"${med:,.0f}", "MONTE CARLO")))
-                
-        elif msg_original == "消費比較":
-            ml, md, top_cat, top_val = get_budget_monthly_6m()
-            if ml:
-                url_budget = gen_budget_chart_url(ml, md)
-                line_bot_api.reply_message(event.reply_token, FlexSendMessage(alt_text="消費比較", contents=card_spending_giga("每月消費變化 (6M)", url_budget, top_cat, top_val)))
-            else:
-                line_bot_api.reply_message(event.reply_token, TextSendMessage(text="⚠️ 無法取得消費數據 (請檢查 BUDGET_DB_ID)"))
+        # 房貸 / BTC / 總資產 / 預測 / 消費比較：讀背景算好的卡片，快取冷時才即時查詢
+        if msg_original in ("房貸", "總資產", "預測", "消費比較") or msg_upper == "BTC":
+            key = "BTC" if msg_upper == "BTC" else msg_original
+            with span("dashboard"):
+                card = DASHBOARDS.get(key)
+            if card:
+                reply_event(event, FlexSendMessage(alt_text=key, contents=card))
+            elif key == "消費比較":
+                reply_event(event, TextSendMessage(text="⚠️ 無法取得消費數據 (請檢查 BUDGET_DB_ID)"))
 
         # --- 🔥 2. RAG (AI 逆向查詢) [加上了錯誤攔截] ---
         else:
             if len(msg_original) > 1:
                 try:
-                    handle_rag_query(msg_original, event.reply_token, line_bot_api)
+                    handle_rag_query(msg_original, event.reply_token, line_bot_api, user_id, event.timestamp)
                 except Exception as e:
                     print(f"❌ RAG Error: {e}")
                     traceback.print_exc()
-                    send_error_flex(event.reply_token, str(e))
+                    send_error_flex(event, str(e))
 
     except Exception as e:
         print(f"❌ General Error: {e}")
-        send_error_flex(event.reply_token, "系統發生未預期錯誤")
+        send_error_flex(event, "系統發生未預期錯誤")
 
 # --- 圖片訊息處理 (Diet) ---
 @handler.add(MessageEvent, message=ImageMessage)
 def handle_image_message(event):
     user_id = event.source.user_id
     msg_id = event.message.id
-    message_content = line_bot_api.get_message_content(msg_id)
-    image_bytes = message_content.content
-    handle_diet_image(user_id, image_bytes, event.reply_token, line_bot_api)
+    with request_trace("diet_image", user=user_id):
+        with span("line_content") as info:
+            message_content = line_bot_api.get_message_content(msg_id)
+            image_bytes = message_content.content
+            info["bytes"] = len(image_bytes)
+        handle_diet_image(user_id, image_bytes, event.reply_token, line_bot_api, event.timestamp)
+
+# ==========================================
+# 啟動背景工作 (放在模組最後：儀表板 builder 等函式都已定義)
+# ==========================================
+threading.Thread(target=warm_up, daemon=True).start()
+# 送出上次關機前尚未完成的 Notion 寫入
+start_drainer()
 
 if __name__ == "__main__":
     app.run()
@@ -0,0 +1,490 @@
+import os
+import io
+import re
+import sys
+import json
+import hmac
+import time
+import uuid
+import base64
+import random
+import hashlib
+import argparse
+import tempfile
+import unicodedata
+import threading
+import contextlib
+import concurrent.futures
+from datetime import datetime, timedelta, timezone
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+# --- 端到端壓測 ---
+# 啟動本地 stub server 模擬 Notion / Gemini / LINE / QuickChart (延遲、回應大小、錯誤率可調)，
+# 把各模組的 API 位址指向 stub 後，以簽章過的 webhook 打 /callback，
+# 從送出事件到 stub 收到最後一則 LINE 訊息為止計時，輸出各指令的 p50 / p95 / p99 與吞吐量
+#
+#   python benchmark_v1_0.py --requests 200 --concurrency 8
+#   python benchmark_v1_0.py --scenarios 房貸,RAG:FINANCE --gemini-latency 800 --error-rate 0.02
+#   python benchmark_v1_0.py --save baseline.json
+#   python benchmark_v1_0.py --compare baseline.json --max-regression 0.2   # 任一情境 p95 變慢超過 20% 時 exit 1
+
+REPO_DIR = os.path.dirname(os.path.abspath(__file__))
+TW_TZ = timezone(timedelta(hours=8))
+LINE_SECRET = "bench-secret"
+
+# ==========================================
+# 0. 壓測情境
+# ==========================================
+KEYWORDS = ["房貸", "BTC", "總資產", "預測", "消費比較"]
+RAG_QUESTIONS = {
+    "INVESTMENT": "我的台股和美股庫存現在損益如何",
+    "FINANCE": "這個月的消費花費跟預算比起來如何",
+    "HEALTH": "這週的飲食熱量和蛋白質夠嗎",
+    "KNOWLEDGE": "我的筆記裡關於複利的重點是什麼",
+}
+
+# 每個情境依序送出的事件 (text / image)；同一個情境內下一步會等上一步收到回覆後才送
+SCENARIOS = {kw: [("text", kw)] for kw in KEYWORDS}
+SCENARIOS.update({f"RAG:{domain}": [("text", q)] for domain, q in RAG_QUESTIONS.items()})
+SCENARIOS["飲食:單圖"] = [("image", None), ("text", "完食")]
+SCENARIOS["飲食:雙圖"] = [("image", None), ("image", None)]
+
+SERVICES = {"notion": 150, "gemini": 1500, "line": 60, "quickchart": 300}   # 預設延遲 (ms)
+
+
+def is_final(scenario, messages):
+    """最後一步送出後收到的訊息中，是否已包含該情境的最終回覆"""
+    for m in messages:
+        alt, text = m.get("altText", ""), m.get("text", "")
+        if scenario.startswith("RAG:"):
+            if alt.endswith("詳細分析") or text.startswith(("⚠️", "🤖")): return True
+        elif scenario.startswith("飲食:"):
+            if alt.startswith("營養分析") or text.startswith(("⚠️", "💸")): return True
+        else:
+            return True
+    return False
+
+
+def pad(text, width):
+    """補空白到指定顯示寬度 (中文字佔兩格)"""
+    shown = sum(2 if unicodedata.east_asian_width(ch) in "WF" else 1 for ch in text)
+    return text + " " * max(0, width - shown)
+
+
+def percentile(values, pct):
+    if not values: return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))]
+
+
+# ==========================================
+# 1. Notion 假資料
+# ==========================================
+def _rt(text):
+    return [{"type": "text", "plain_text": text, "text": {"content": text}}]
+
+
+def _props(**values):
+    """name=(type, value) → Notion properties"""
+    props = {}
+    for name, (p_type, value) in values.items():
+        if p_type in ("title", "rich_text"): props[name] = {"type": p_type, p_type: _rt(value)}
+        elif p_type == "date": props[name] = {"type": "date", "date": {"start": value}}
+        elif p_type == "select": props[name] = {"type": "select", "select": {"name": value}}
+        else: props[name] = {"type": "number", "number": value}
+    return props
+
+
+def build_notion_data(rows, payload_bytes):
+    """依資料庫環境變數名稱產生假資料，回傳 {db_id: [page]} (依 created_time 新到舊)"""
+    now = datetime.now(TW_TZ)
+    rng = random.Random(42)
+    memo = ("備註" * payload_bytes)[:payload_bytes]
+    dbs = {}
+
+    def page(key, i, created, **values):
+        values.setdefault("備註", ("rich_text", memo))
+        ts = created.astimezone(timezone.utc).strftime("%Y-%m-%dT%H:%M:00.000Z")
+        return {"object": "page", "id": f"{key.lower()}-{i:05d}", "created_time": ts, "last_edited_time": ts, "properties": _props(**values)}
+
+    dbs["DB_SNAPSHOT"] = [page("DB_SNAPSHOT", i, now - timedelta(days=i),
+                               名稱=("title", f"快照 {i}"), 日期=("date", (now - timedelta(days=i)).strftime("%Y-%m-%d")),
+                               總資產=("number", 8_000_000 - i * 9_000 + rng.randint(-50_000, 50_000)),
+                               Crypto=("number", 1_500_000 - i * 2_000), 美股複委託=("number", 2_500_000 - i * 3_000),
+                               台股證券戶=("number", 2_000_000 - i * 2_000), Gold=("number", 500_000), 活存=("number", 1_500_000),
+                               BTC持有量=("number", round(0.5 - i * 0.001, 4))) for i in range(rows)]
+    dbs["DB_MORTGAGE"] = [page("DB_MORTGAGE", i, now - timedelta(days=30 * i),
+                               名稱=("title", f"房貸 {i}"), 日期=("date", (now - timedelta(days=30 * i)).strftime("%Y-%m-%d")),
+                               剩餘本金=("number", 4_000_000 + i * 20_000)) for i in range(min(rows, 60))]
+    budget, cats = [], ["餐飲", "交通", "娛樂", "居家", "醫療"]
+    for m in range(max(1, rows // len(cats))):
+        index = now.year * 12 + now.month - 1 - m
+        ym = f"{index // 12:04d}{index % 12 + 1:02d}"
+        for cat in cats:
+            budget.append(page("BUDGET_DB_ID", len(budget), now - timedelta(days=30 * m),
+                               預算類別=("title", f"{ym}{cat}"), 實際花費=("number", -rng.randint(2_000, 20_000)), 預算=("number", 15_000)))
+    dbs["BUDGET_DB_ID"] = budget
+    dbs["DIET_DB_ID"] = [page("DIET_DB_ID", i, now - timedelta(hours=8 * i),
+                              食物名稱=("title", rng.choice(["雞腿便當", "牛肉麵", "沙拉", "燕麥"])), 用餐時間=("date", (now - timedelta(hours=8 * i)).isoformat()),
+                              **{"USER ID": ("rich_text", "Ubench-history")}, 熱量=("number", rng.randint(300, 900)),
+                              蛋白質=("number", rng.randint(10, 50)), 碳水化合物=("number", rng.randint(30, 120)), 脂肪=("number", rng.randint(5, 40)))
+                         for i in range(rows)]
+    for key in ["FLASH_DB_ID", "LITERATURE_DB_ID", "PERMAMENT_DB_ID"]:
+        dbs[key] = [page(key, i, now - timedelta(days=i), 名稱=("title", f"{key[:4]} 筆記 {i} 複利與資產配置")) for i in range(rows)]
+    for key in ["DB_TW_STOCK", "DB_US_STOCK", "DB_CRYPTO", "DB_GOLD", "PAY_LOSS_DB_ID",
+                "TRANSACTIONS_DB_ID", "INCOME_DB_ID", "DB_ACCOUNT"]:
+        dbs[key] = [page(key, i, now - timedelta(hours=12 * i),
+                         名稱=("title", f"{key} {i}"), 日期=("date", (now - timedelta(hours=12 * i)).strftime("%Y-%m-%d")),
+                         金額=("number", rng.randint(-5_000, 5_000)), 分類=("select", rng.choice(cats))) for i in range(rows)]
+    return {f"bench-{key.lower()}": pages for key, pages in dbs.items()}
+
+
+# ==========================================
+# 2. Gemini 假回應
+# ==========================================
+def gemini_answer(body):
+    parts = body.get("contents", [{}])[0].get("parts", [])
+    if any("inline_data" in p for p in parts):
+        return json.dumps({"food_name": "雞腿便當", "percentage": 0.9, "calories": 720, "protein": 35,
+                           "carbs": 80, "fat": 24, "advice": "蛋白質充足，建議多補充蔬菜與膳食纖維。"}, ensure_ascii=False)
+    text = "".join(p.get("text", "") for p in parts)
+    if "Classify intent" in text:
+        match = re.search(r'User Query: "(.*)"', text)
+        query = match.group(1) if match else ""
+        domain = next((d for d, q in RAG_QUESTIONS.items() if q == query), "FINANCE")
+        return json.dumps({"domain": domain, "date_filter": {"start": "", "end": ""}})
+    return json.dumps({
+        "card_data": {"title": "本月摘要", "main_stat": "NT$52,597",
+                      "details": [{"label": f"項目 {i}", "value": f"{1000 * i:,}"} for i in range(1, 6)]},
+        "detailed_analysis": [{"title": f"重點 {i}", "content": "與上月相比支出略增，主要來自餐飲與交通，建議設定每週上限。"} for i in range(1, 5)],
+    }, ensure_ascii=False)
+
+
+# ==========================================
+# 3. Stub server
+# ==========================================
+class StubState:
+    def __init__(self, args):
+        self.args = args
+        self.rng = random.Random(7)
+        self.cond = threading.Condition()
+        self.inbox = {}       # user_id -> [(perf_counter, message)]
+        self.calls = {s: 0 for s in SERVICES}
+        self.injected = {s: 0 for s in SERVICES}
+        self.notion = build_notion_data(args.notion_rows, args.payload_bytes)
+        self.image = make_image(args.image_px)
+
+    def delay(self, service, share=1.0):
+        base = getattr(self.args, f"{service}_latency") / 1000 * share
+        time.sleep(max(0.0, base * self.rng.uniform(1 - self.args.jitter, 1 + self.args.jitter)))
+
+    def fail(self, service):
+        """依錯誤率決定這次是否回傳錯誤 (同時計數)"""
+        with self.cond:
+            self.calls[service] += 1
+            if self.rng.random() < getattr(self.args, f"{service}_errors"):
+                self.injected[service] += 1
+                return True
+        return False
+
+    def deliver(self, user_id, messages):
+        with self.cond:
+            inbox = self.inbox.setdefault(user_id, [])
+            inbox.extend((time.perf_counter(), m) for m in messages)
+            self.cond.notify_all()
+
+    def received(self, user_id):
+        with self.cond:
+            return len(self.inbox.get(user_id, []))
+
+    def wait(self, user_id, since, predicate, deadline):
+        """等到 since 之後收到的訊息滿足 predicate，回傳最後一則訊息到達時間 (逾時回傳 None)"""
+        with self.cond:
+            while True:
+                inbox = self.inbox.get(user_id, [])[since:]
+                if inbox and predicate([m for _, m in inbox]): return inbox[-1][0]
+                remaining = deadline - time.perf_counter()
+                if remaining <= 0: return None
+                self.cond.wait(remaining)
+
+
+def make_image(px):
+    """產生約手機照片大小的 JPEG (沒有 Pillow 時用隨機 bytes，前處理會直接略過)"""
+    try:
+        from PIL import Image
+        out = io.BytesIO()
+        Image.effect_noise((px, px * 3 // 4), 40).convert("RGB").save(out, format="JPEG", quality=92)
+        return out.getvalue()
+    except ImportError:
+        return os.urandom(px * px // 4)
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    state = None
+
+    def log_message(self, *args): pass
+
+    def _send(self, status, body=b"", content_type="application/json"):
+        if isinstance(body, (dict, list)): body = json.dumps(body, ensure_ascii=False).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _body(self):
+        length = int(self.headers.get("Content-Length") or 0)
+        return json.loads(self.rfile.read(length) or b"{}") if length else {}
+
+    def do_GET(self):
+        path = self.path.split("?")[0]
+        st = self.state
+        if path.startswith("/notion/v1/blocks/"):
+            st.delay("notion")
+            if st.fail("notion"): return self._send(503, {"message": "injected"})
+            text = f"複利是長期投資的核心。{'資產配置與再平衡。' * max(1, st.args.payload_bytes // 10)}"
+            return self._send(200, {"results": [{"id": f"b{i}", "type": "paragraph", "has_children": False,
+                                                 "paragraph": {"rich_text": _rt(text)}} for i in range(3)],
+                                    "has_more": False, "next_cursor": None})
+        if path.startswith("/line-data/v2/bot/message/"):
+            st.delay("line")
+            if st.fail("line"): return self._send(500, {"message": "injected"})
+            return self._send(200, st.image, "image/jpeg")
+        self._send(404, {"message": path})
+
+    def do_POST(self):
+        path = self.path.split("?")[0]
+        body = self._body()
+        st = self.state
+        if path.startswith("/notion/v1/"):
+            st.delay("notion")
+            if st.fail("notion"): return self._send(503, {"message": "injected"})
+            match = re.match(r"/notion/v1/databases/([^/]+)/query", path)
+            if not match: return self._send(200, {"object": "page", "id": str(uuid.uuid4())})
+            # filter 一律忽略 (鏡像會在本地過濾)，只處理翻頁
+            pages = st.notion.get(match.group(1), [])
+            start = int(body.get("start_cursor") or 0)
+            end = start + min(100, body.get("page_size", 100))
+            return self._send(200, {"results": pages[start:end], "has_more": end < len(pages),
+                                    "next_cursor": str(end) if end < len(pages) else None})
+        if path.startswith("/gemini/"):
+            stream = ":streamGenerateContent" in path
+            st.delay("gemini", 0.25 if stream else 1.0)
+            if st.fail("gemini"): return self._send(503, {"error": {"message": "injected"}})
+            answer = gemini_answer(body)
+            if not stream:
+                return self._send(200, {"candidates": [{"content": {"parts": [{"text": answer}]}}]})
+            # 串流：首段延遲佔 25%，其餘平均分配到各段
+            size = max(1, len(answer) // st.args.gemini_chunks + 1)
+            chunks = [answer[i:i + size] for i in range(0, len(answer), size)]
+            self.send_response(200)
+            self.send_header("Content-Type", "text/event-stream")
+            self.send_header("Connection", "close")
+            self.end_headers()
+            for chunk in chunks:
+                event = {"candidates": [{"content": {"parts": [{"text": chunk}]}}]}
+                self.wfile.write(f"data: {json.dumps(event, ensure_ascii=False)}\r\n\r\n".encode("utf-8"))
+                self.wfile.flush()
+                st.delay("gemini", 0.75 / len(chunks))
+            self.close_connection = True
+            return
+        if path.startswith("/line/v2/bot/message/"):
+            st.delay("line")
+            if st.fail("line"): return self._send(500, {"message": "injected"})
+            if path.endswith("/reply"):
+                user_id = (body.get("replyToken") or "").split(".")[1:2]
+                st.deliver(user_id[0] if user_id else "", body.get("messages", []))
+            elif path.endswith("/push"):
+                st.deliver(body.get("to", ""), body.get("messages", []))
+            return self._send(200, {})
+        if path.startswith("/quickchart/"):
+            st.delay("quickchart")
+            if st.fail("quickchart"): return self._send(500, {"success": False})
+            return self._send(200, {"success": True, "url": f"http://{self.headers.get('Host')}/quickchart/render/{uuid.uuid4().hex}"})
+        self._send(404, {"message": path})
+
+
+def start_stub(args):
+    StubHandler.state = StubState(args)
+    server = ThreadingHTTPServer(("127.0.0.1", args.port), StubHandler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name="bench-stub", daemon=True).start()
+    return server, StubHandler.state, f"http://127.0.0.1:{server.server_address[1]}"
+
+
+# ==========================================
+# 4. 驅動 /callback
+# ==========================================
+class Driver:
+    def __init__(self, bot, state, timeout):
+        self.bot = bot
+        self.state = state
+        self.timeout = timeout
+
+    def post_event(self, user_id, step, kind, text):
+        event = {
+            "type": "message", "mode": "active", "timestamp": int(time.time() * 1000),
+            "source": {"type": "user", "userId": user_id}, "webhookEventId": uuid.uuid4().hex,
+            "deliveryContext": {"isRedelivery": False}, "replyToken": f"bench.{user_id}.{step}",
+            "message": {"id": uuid.uuid4().hex[:16], "type": "text", "quoteToken": "q", "text": text} if kind == "text"
+                       else {"id": uuid.uuid4().hex[:16], "type": "image", "contentProvider": {"type": "line"}},
+        }
+        body = json.dumps({"destination": "bench", "events": [event]}, ensure_ascii=False)
+        signature = base64.b64encode(hmac.new(LINE_SECRET.encode(), body.encode("utf-8"), hashlib.sha256).digest()).decode()
+        with self.bot.app.test_client() as client:
+            r = client.post("/callback", data=body.encode("utf-8"), headers={"X-Line-Signature": signature, "Content-Type": "application/json"})
+        return r.status_code
+
+    def run(self, scenario):
+        """執行一次情境，回傳 {first_ms, done_ms} 或 {error}；計時由最後一步送出起算"""
+        user_id = f"Ubench{uuid.uuid4().hex[:20]}"
+        steps = SCENARIOS[scenario]
+        for i, (kind, text) in enumerate(steps):
+            since = self.state.received(user_id)
+            started = time.perf_counter()
+            deadline = started + self.timeout
+            status = self.post_event(user_id, i, kind, text)
+            if status != 200: return {"error": f"HTTP {status}"}
+            first = self.state.wait(user_id, since, lambda msgs: True, deadline)
+            if first is None: return {"error": "timeout"}
+            if i < len(steps) - 1: continue
+            done = self.state.wait(user_id, since, lambda msgs: is_final(scenario, msgs), deadline)
+            if done is None: return {"error": "timeout"}
+            return {"first_ms": (first - started) * 1000, "done_ms": (done - started) * 1000}
+
+
+def summarize(results, wall):
+    report = {"scenarios": {}, "wall_s": round(wall, 2)}
+    for scenario, items in results.items():
+        ok = [r for r in items if "done_ms" in r]
+        errors = {}
+        for r in items:
+            if "error" in r: errors[r["error"]] = errors.get(r["error"], 0) + 1
+        report["scenarios"][scenario] = {
+            "n": len(items), "ok": len(ok), "errors": errors,
+            **{f"{kind}_p{p}": round(percentile([r[f"{kind}_ms"] for r in ok], p), 1) for kind in ("first", "done") for p in (50, 95, 99)},
+        }
+    done = sum(s["ok"] for s in report["scenarios"].values())
+    report["throughput_rps"] = round(done / wall, 2) if wall else 0.0
+    return report
+
+
+def print_report(report, state):
+    print(f"\n{pad('情境', 16)}{'n':>5}{'ok':>5}  {pad('首次回覆 p50 / p95 / p99 (ms)', 32)}{pad('完成 p50 / p95 / p99 (ms)', 30)}錯誤")
+    for scenario, s in report["scenarios"].items():
+        first = f"{s['first_p50']:>7.0f} / {s['first_p95']:>7.0f} / {s['first_p99']:>7.0f}"
+        done = f"{s['done_p50']:>7.0f} / {s['done_p95']:>7.0f} / {s['done_p99']:>7.0f}"
+        print(f"{pad(scenario, 16)}{s['n']:>5}{s['ok']:>5}  {first:<32}{done:<30}{s['errors'] or ''}")
+    print(f"\n⏱️ {report['wall_s']} s / 吞吐量 {report['throughput_rps']} req/s")
+    print(f"📡 Stub 呼叫: {state.calls} / 注入錯誤: {state.injected}")
+
+
+def compare(report, baseline_path, max_regression):
+    """與基準比較各情境的完成 p95，回傳是否有退步超過門檻"""
+    with open(baseline_path, encoding="utf-8") as f:
+        baseline = json.load(f)
+    regressed = False
+    for scenario, s in report["scenarios"].items():
+        base = baseline.get("scenarios", {}).get(scenario)
+        if not base or not base.get("done_p95") or not s["ok"]: continue
+        ratio = s["done_p95"] / base["done_p95"] - 1
+        mark = "❌" if ratio > max_regression else "✅"
+        regressed |= ratio > max_regression
+        print(f"{mark} {scenario}: p95 {base['done_p95']:.0f} → {s['done_p95']:.0f} ms ({ratio:+.0%})")
+    return regressed
+
+
+# ==========================================
+# 5. 主程式
+# ==========================================
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Finance OS Bot 端到端壓測 (本地 stub)")
+    parser.add_argument("--requests", type=int, default=100, help="正式量測的總請求數 (平均分配到各情境)")
+    parser.add_argument("--concurrency", type=int, default=4, help="同時進行的使用者數")
+    parser.add_argument("--scenarios", default=",".join(SCENARIOS), help="以逗號分隔，可選：" + ",".join(SCENARIOS))
+    parser.add_argument("--timeout", type=float, default=60, help="單一請求等待最終回覆的秒數")
+    parser.add_argument("--no-warmup", action="store_true", help="不先把每個情境跑一次 (量測冷啟動)")
+    parser.add_argument("--port", type=int, default=0)
+    parser.add_argument("--jitter", type=float, default=0.3, help="延遲隨機浮動比例")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="所有服務的預設錯誤率")
+    for service, latency in SERVICES.items():
+        parser.add_argument(f"--{service}-latency", type=float, default=latency, help=f"{service} 延遲 (ms)")
+        parser.add_argument(f"--{service}-errors", type=float, default=None, help=f"{service} 錯誤率 (預設同 --error-rate)")
+    parser.add_argument("--notion-rows", type=int, default=150, help="每個 Notion 資料庫的筆數 (超過 100 會翻頁)")
+    parser.add_argument("--payload-bytes", type=int, default=200, help="每筆 Notion 資料 / 區塊的文字長度")
+    parser.add_argument("--gemini-chunks", type=int, default=8, help="串流回應切成幾段")
+    parser.add_argument("--image-px", type=int, default=2048, help="模擬照片的長邊 (px)")
+    parser.add_argument("--save", help="將結果存成 JSON (作為之後 --compare 的基準)")
+    parser.add_argument("--compare", help="與基準 JSON 比較完成 p95")
+    parser.add_argument("--max-regression", type=float, default=0.2)
+    parser.add_argument("--verbose", action="store_true", help="顯示 bot 本身的 log")
+    args = parser.parse_args(argv)
+    for service in SERVICES:
+        if getattr(args, f"{service}_errors") is None: setattr(args, f"{service}_errors", args.error_rate)
+    unknown = [s for s in args.scenarios.split(",") if s not in SCENARIOS]
+    if unknown: parser.error(f"unknown scenarios: {unknown}")
+    return args
+
+
+def configure_env(base_url, workdir):
+    """匯入 app 之前設定：API 位址指向 stub、資料庫 id 對應假資料、本地檔案寫到暫存目錄"""
+    env = {
+        "NOTION_API_BASE": f"{base_url}/notion/v1",
+        "GEMINI_API_BASE": f"{base_url}/gemini/v1beta",
+        "LINE_API_ENDPOINT": f"{base_url}/line",
+        "LINE_DATA_API_ENDPOINT": f"{base_url}/line-data",
+        "QUICKCHART_URL": f"{base_url}/quickchart/chart/create",
+        "LINE_CHANNEL_ACCESS_TOKEN": "bench-token", "LINE_CHANNEL_SECRET": LINE_SECRET,
+        "NOTION_TOKEN": "bench-notion", "GOOGLE_API_KEY": "bench-google",
+        "PUBLIC_BASE_URL": "", "RENDER_EXTERNAL_URL": "",
+    }
+    for key in ["DB_SNAPSHOT", "DB_MORTGAGE", "BUDGET_DB_ID", "DIET_DB_ID", "FLASH_DB_ID", "LITERATURE_DB_ID", "PERMAMENT_DB_ID",
+                "DB_TW_STOCK", "DB_US_STOCK", "DB_CRYPTO", "DB_GOLD", "PAY_LOSS_DB_ID", "TRANSACTIONS_DB_ID", "INCOME_DB_ID", "DB_ACCOUNT"]:
+        env[key] = f"bench-{key.lower()}"
+    os.environ.update(env)
+    os.chdir(workdir)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    # --save / --compare 以啟動時的目錄為準 (之後會切換到暫存目錄)
+    save_path = os.path.abspath(args.save) if args.save else None
+    compare_path = os.path.abspath(args.compare) if args.compare else None
+    scenarios = args.scenarios.split(",")
+    server, state, base_url = start_stub(args)
+    workdir = tempfile.mkdtemp(prefix="finance-bot-bench-")
+    configure_env(base_url, workdir)
+    print(f"🧪 Stub: {base_url} / 工作目錄: {workdir} / 照片 {len(state.image) / 1024:,.0f} KB")
+
+    log = contextlib.nullcontext() if args.verbose else contextlib.redirect_stdout(io.StringIO())
+    with log:
+        sys.path.insert(0, REPO_DIR)
+        import app as bot   # 需在 configure_env 之後匯入 (各模組於 import 時讀取 API 位址)
+        driver = Driver(bot, state, args.timeout)
+        if not args.no_warmup:
+            for scenario in scenarios: driver.run(scenario)
+
+        jobs = [scenarios[i % len(scenarios)] for i in range(args.requests)]
+        results = {s: [] for s in scenarios}
+        started = time.perf_counter()
+        with concurrent.futures.ThreadPoolExecutor(max_workers=args.concurrency) as executor:
+            for scenario, result in zip(jobs, executor.map(driver.run, jobs)):
+                results[scenario].append(result)
+        wall = time.perf_counter() - started
+
+    report = summarize(results, wall)
+    report["config"] = {k: v for k, v in vars(args).items() if k not in ("save", "compare")}
+    print_report(report, state)
+    server.shutdown()
+
+    if save_path:
+        with open(save_path, "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+        print(f"💾 已存檔: {save_path}")
+    if compare_path and compare(report, compare_path, args.max_regression): return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,163 @@
+import os
+import time
+import sqlite3
+import threading
+from datetime import datetime, date, timedelta, timezone
+from notion_helper_v1_0 import extract_number
+from notion_mirror_v1_0 import mirror_query
+
+# --- 每月預算彙總 ---
+# 預算資料庫每筆標題為「YYYYMM + 類別」(例：202501餐飲)
+# 依月份以標題前綴 (starts_with) 查詢並自動翻頁，不再整庫撈回來在 Python 過濾；
+# 已結束的月份彙總後存成不可變的快取，之後只有本月 (與尚在補登期的上月) 需要重算
+BUDGET_CACHE_PATH = os.getenv("BUDGET_CACHE_PATH", "budget_months.sqlite3")
+BUDGET_TITLE_PROP = "預算類別"
+BUDGET_SPENT_PROP = "實際花費"
+BUDGET_SEAL_GRACE_DAYS = int(os.getenv("BUDGET_SEAL_GRACE_DAYS", "3"))   # 月份結束後幾天內仍可能補登，期間內不封存
+BUDGET_QUERY_CHUNK = 12        # 一次 query 最多 OR 幾個月份前綴
+TW_TZ = timezone(timedelta(hours=8))
+
+_stats_lock = threading.Lock()
+BUDGET_STATS = {"sealed_hits": 0, "computed": 0, "queries": 0, "sealed": 0}
+
+
+def _connect():
+    conn = sqlite3.connect(BUDGET_CACHE_PATH, timeout=30)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("""CREATE TABLE IF NOT EXISTS sealed_months (
+        db_id TEXT NOT NULL,
+        ym TEXT NOT NULL,
+        sealed_at REAL NOT NULL,
+        PRIMARY KEY (db_id, ym))""")
+    conn.execute("""CREATE TABLE IF NOT EXISTS month_totals (
+        db_id TEXT NOT NULL,
+        ym TEXT NOT NULL,
+        category TEXT NOT NULL,
+        spent REAL NOT NULL,
+        PRIMARY KEY (db_id, ym, category))""")
+    return conn
+
+
+def _bump(key, n=1):
+    with _stats_lock: BUDGET_STATS[key] += n
+
+
+# ==========================================
+# 1. 月份工具 (YYYYMM)
+# ==========================================
+def current_month(now=None):
+    return (now or datetime.now(TW_TZ)).strftime("%Y%m")
+
+
+def shift_month(ym, n):
+    """ym 往前 (n < 0) 或往後 (n > 0) 平移 n 個月"""
+    index = int(ym[:4]) * 12 + int(ym[4:]) - 1 + n
+    return f"{index // 12:04d}{index % 12 + 1:02d}"
+
+
+def month_window(months, end=None):
+    """以 end (預設本月) 結尾、連續 months 個月的清單 (由舊到新)"""
+    end = end or current_month()
+    return [shift_month(end, -i) for i in range(months - 1, -1, -1)]
+
+
+def is_sealable(ym, now=None):
+    """月份結束且已過補登期才封存"""
+    now = now or datetime.now(TW_TZ)
+    next_month = shift_month(ym, 1)
+    seal_day = date(int(next_month[:4]), int(next_month[4:]), 1) + timedelta(days=BUDGET_SEAL_GRACE_DAYS)
+    return now.date() >= seal_day
+
+
+# ==========================================
+# 2. 查詢與彙總
+# ==========================================
+def _page_title(page):
+    return "".join(t.get("plain_text", "") for t in page.get("properties", {}).get(BUDGET_TITLE_PROP, {}).get("title") or [])
+
+
+def _fetch_months(db_id, yms):
+    """以標題前綴查詢指定月份並依類別加總，回傳 {ym: {類別: 花費}}；查詢失敗拋出 RuntimeError (避免把不完整的月份封存)"""
+    totals = {ym: {} for ym in yms}
+    for i in range(0, len(yms), BUDGET_QUERY_CHUNK):
+        chunk = yms[i:i + BUDGET_QUERY_CHUNK]
+        conditions = [{"property": BUDGET_TITLE_PROP, "title": {"starts_with": ym}} for ym in chunk]
+        payload = {"filter": conditions[0] if len(conditions) == 1 else {"or": conditions}}
+        # 錯誤由這次呼叫自己的 stats 判斷 (QUERY_STATS 為全域，同 label 的並行查詢會互相覆蓋)
+        stats = {}
+        pages = mirror_query(db_id, payload, label=f"BUDGET_MONTHS:{chunk[0]}-{chunk[-1]}", stats=stats)
+        _bump("queries")
+        if stats.get("error"):
+            raise RuntimeError(f"Notion query failed ({stats['error']})")
+        for page in pages:
+            title = _page_title(page)
+            ym, cat = title[:6], title[6:]
+            if ym not in totals or not cat: continue
+            spent = abs(extract_number(page["properties"].get(BUDGET_SPENT_PROP, {})))
+            totals[ym][cat] = totals[ym].get(cat, 0) + spent
+    return totals
+
+
+def monthly_totals(db_id, yms):
+    """
+    任意月份清單的每月各類別花費，回傳 {ym: {類別: 花費}} (順序同 yms)
+    - 已封存的月份直接讀快取，不查 Notion
+    - 其餘月份合併成一次前綴查詢；已可封存的月份寫入快取，之後不再重算
+    """
+    now = datetime.now(TW_TZ)
+    yms = [ym for ym in dict.fromkeys(yms) if ym <= current_month(now)]
+    result = {}
+    conn = _connect()
+    try:
+        for i in range(0, len(yms), 500):
+            chunk = yms[i:i + 500]
+            marks = ",".join("?" * len(chunk))
+            for (ym,) in conn.execute(f"SELECT ym FROM sealed_months WHERE db_id = ? AND ym IN ({marks})", [db_id, *chunk]).fetchall():
+                result[ym] = {}
+            for ym, cat, spent in conn.execute(
+                f"SELECT ym, category, spent FROM month_totals WHERE db_id = ? AND ym IN ({marks})", [db_id, *chunk]
+            ).fetchall():
+                if ym in result: result[ym][cat] = spent
+        _bump("sealed_hits", len(result))
+
+        missing = [ym for ym in yms if ym not in result]
+        if missing:
+            fetched = _fetch_months(db_id, missing)
+            _bump("computed", len(missing))
+            seal = [ym for ym in missing if is_sealable(ym, now)]
+            with conn:
+                for ym in seal:
+                    conn.execute("INSERT OR REPLACE INTO sealed_months (db_id, ym, sealed_at) VALUES (?, ?, ?)", (db_id, ym, time.time()))
+                    conn.execute("DELETE FROM month_totals WHERE db_id = ? AND ym = ?", (db_id, ym))
+                    conn.executemany("INSERT INTO month_totals (db_id, ym, category, spent) VALUES (?, ?, ?, ?)",
+                                     [(db_id, ym, cat, spent) for cat, spent in fetched[ym].items()])
+            _bump("sealed", len(seal))
+            result.update(fetched)
+    finally:
+        conn.close()
+    print(f"💰 Budget: {len(yms)} 個月 (快取 {len(yms) - len(missing)} / 查詢 {len(missing)})")
+    return {ym: result[ym] for ym in yms}
+
+
+def invalidate(db_id, ym=None):
+    """解除封存 (事後修改了舊月份的預算時使用)；不指定 ym 時清除該資料庫全部快取"""
+    conn = _connect()
+    try:
+        with conn:
+            where, args = ("db_id = ? AND ym = ?", (db_id, ym)) if ym else ("db_id = ?", (db_id,))
+            count = conn.execute(f"DELETE FROM sealed_months WHERE {where}", args).rowcount
+            conn.execute(f"DELETE FROM month_totals WHERE {where}", args)
+    finally:
+        conn.close()
+    return count
+
+
+def budget_cache_status():
+    conn = _connect()
+    try:
+        sealed, oldest, newest = conn.execute("SELECT COUNT(*), MIN(ym), MAX(ym) FROM sealed_months").fetchone()
+    finally:
+        conn.close()
+    with _stats_lock:
+        stats = dict(BUDGET_STATS)
+    return {"sealed_months": sealed, "oldest": oldest, "newest": newest, "grace_days": BUDGET_SEAL_GRACE_DAYS, **stats}
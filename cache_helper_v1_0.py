@@ -0,0 +1,203 @@
+import os
+import copy
+import json
+import time
+import hashlib
+import threading
+from collections import OrderedDict
+from metrics_helper_v1_0 import Counter
+
+SINGLE_FLIGHT_CALLS = Counter("bot_singleflight_calls_total", "Single-flight calls (leader = executed, coalesced = shared an in-flight call)", ("name", "result"))
+
+
+class TTLCache:
+    """
+    Thread-safe 的 TTL + LRU 快取
+    - ttl: 秒，過期即視為 miss
+    - maxsize: 超過筆數時淘汰最久未使用的項目
+    - hits / misses / evictions 計數，可由 stats() 取得
+    """
+
+    def __init__(self, name, ttl, maxsize):
+        self.name = name
+        self.ttl = ttl
+        self.maxsize = maxsize
+        self._data = OrderedDict()   # key -> (expires_at, value)
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key, default=None):
+        with self._lock:
+            item = self._data.get(key)
+            if item is None or item[0] < time.time():
+                if item is not None: del self._data[key]
+                self.misses += 1
+                return default
+            self._data.move_to_end(key)
+            self.hits += 1
+            return item[1]
+
+    def set(self, key, value, ttl=None):
+        with self._lock:
+            self._data[key] = (time.time() + (self.ttl if ttl is None else ttl), value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+                self.evictions += 1
+
+    def pop(self, key, default=None):
+        with self._lock:
+            item = self._data.pop(key, None)
+            return default if item is None else item[1]
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self):
+        return len(self._data)
+
+    def save(self, path):
+        """存到 JSON 檔 (key 需為字串、value 需可 JSON 序列化)，先寫暫存檔再 rename 避免寫到一半"""
+        with self._lock:
+            now = time.time()
+            items = [[k, exp, v] for k, (exp, v) in self._data.items() if exp >= now]
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        try:
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump(items, f, ensure_ascii=False)
+            os.replace(tmp_path, path)
+        except OSError as e:
+            print(f"❌ Cache [{self.name}] 存檔失敗: {e}")
+
+    def load(self, path):
+        """從 JSON 檔載入未過期的項目 (檔案不存在或損毀時略過)"""
+        try:
+            with open(path, encoding="utf-8") as f:
+                items = json.load(f)
+        except (OSError, ValueError):
+            return 0
+        now = time.time()
+        with self._lock:
+            for k, exp, v in items:
+                if exp >= now: self._data[k] = (exp, v)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+        return len(self._data)
+
+    def stats(self):
+        total = self.hits + self.misses
+        return {
+            "name": self.name, "size": len(self._data), "maxsize": self.maxsize, "ttl": self.ttl,
+            "hits": self.hits, "misses": self.misses, "evictions": self.evictions,
+            "hit_rate": round(self.hits / total, 3) if total else 0.0
+        }
+
+
+def flight_key(*parts):
+    """將請求內容 (DB id + payload、模型 + prompt…) 正規化後 hash 成 single-flight key"""
+    raw = json.dumps(parts, sort_keys=True, ensure_ascii=False, default=str)
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+class _Flight:
+    def __init__(self):
+        self.cond = threading.Condition()
+        self.done = False
+        self.result = None
+        self.error = None
+        self.items = []      # stream() 已產生的片段
+
+
+class SingleFlight:
+    """
+    相同 key 的請求同時只執行一次，其餘呼叫端等待並共用結果 (例外也一併拋給等待者)
+    - do(key, fn, ...)：一般呼叫，等待者拿到結果的 deep copy，避免彼此修改到同一份資料
+    - stream(key, fn, ...)：fn 回傳 iterator，等待者依序收到同樣的片段 (不必等整個回應結束)
+    只合併「同時進行中」的請求，完成後即移除，不做結果快取
+    """
+
+    def __init__(self, name):
+        self.name = name
+        self._flights = {}
+        self._lock = threading.Lock()
+        self.leaders = 0
+        self.coalesced = 0
+        self.errors = 0
+
+    def _join(self, key):
+        """回傳 (flight, 是否為 leader)"""
+        with self._lock:
+            flight = self._flights.get(key)
+            leader = flight is None
+            if leader:
+                flight = self._flights[key] = _Flight()
+                self.leaders += 1
+            else:
+                self.coalesced += 1
+        SINGLE_FLIGHT_CALLS.inc({"name": self.name, "result": "leader" if leader else "coalesced"})
+        return flight, leader
+
+    def _finish(self, key, flight, error=None):
+        with self._lock:
+            self._flights.pop(key, None)
+            if error is not None: self.errors += 1
+        with flight.cond:
+            flight.error = error
+            flight.done = True
+            flight.cond.notify_all()
+
+    def do(self, key, fn, *args, **kwargs):
+        flight, leader = self._join(key)
+        if not leader:
+            with flight.cond:
+                while not flight.done: flight.cond.wait()
+            if flight.error is not None: raise flight.error
+            return copy.deepcopy(flight.result)
+        try:
+            flight.result = fn(*args, **kwargs)
+        except Exception as e:
+            self._finish(key, flight, e)
+            raise
+        self._finish(key, flight)
+        return flight.result
+
+    def stream(self, key, fn, *args, **kwargs):
+        flight, leader = self._join(key)
+        if leader:
+            error = None
+            try:
+                for item in fn(*args, **kwargs):
+                    with flight.cond:
+                        flight.items.append(item)
+                        flight.cond.notify_all()
+                    yield item
+            except GeneratorExit:
+                # leader 提早停止讀取：等待者拿不到完整回應，讓它們改走各自的備援流程
+                error = RuntimeError(f"single-flight [{self.name}] leader stopped early")
+                raise
+            except Exception as e:
+                error = e
+                raise
+            finally:
+                self._finish(key, flight, error)
+            return
+        i = 0
+        while True:
+            with flight.cond:
+                while i >= len(flight.items) and not flight.done: flight.cond.wait()
+                if i < len(flight.items):
+                    item = flight.items[i]
+                elif flight.error is not None:
+                    raise flight.error
+                else:
+                    return
+            i += 1
+            yield item
+
+    def stats(self):
+        with self._lock:
+            return {"name": self.name, "in_flight": len(self._flights), "leaders": self.leaders,
+                    "coalesced": self.coalesced, "errors": self.errors}
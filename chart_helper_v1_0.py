@@ -0,0 +1,219 @@
+import os
+import io
+import re
+import json
+import time
+import hashlib
+import threading
+
+# matplotlib 為選用套件：未安裝時 render_chart_url 回傳 None，由呼叫端改走 QuickChart
+try:
+    import matplotlib
+    matplotlib.use("Agg")
+    import matplotlib.pyplot as plt
+    HAS_MATPLOTLIB = True
+except ImportError:
+    HAS_MATPLOTLIB = False
+
+# --- 本地圖表服務設定 ---
+# 圖片由 Flask 的 /charts/<hash>.png 提供，LINE 需要能從外部存取，因此需要公開網址
+# 需明確設定 PUBLIC_BASE_URL 才啟用 (Render 每次部署都會帶 RENDER_EXTERNAL_URL，但免費機器沒有中文字型)
+PUBLIC_BASE_URL = (os.getenv("PUBLIC_BASE_URL") or "").rstrip("/")
+LOCAL_CHART_ENABLED = os.getenv("LOCAL_CHART_ENABLED", "1") == "1"
+CHART_CACHE_DIR = os.getenv("CHART_CACHE_DIR", "chart_cache")
+CHART_CACHE_MAX_BYTES = int(os.getenv("CHART_CACHE_MAX_BYTES", str(50 * 1024 * 1024)))
+CHART_CACHE_MAX_FILES = int(os.getenv("CHART_CACHE_MAX_FILES", "500"))
+CHART_DPI_SCALE = 2   # 比照 QuickChart 預設 devicePixelRatio = 2
+CHART_FONT_PATH = os.getenv("CHART_FONT_PATH")   # 預算類別為中文，可指定 CJK 字型檔
+
+# 版面各區塊高度/寬度 (px)
+TITLE_PX = 24
+LEGEND_PX = 24
+TICK_LABEL_PX = 24
+Y_LABEL_PX = 40
+
+CHART_HASH_RE = re.compile(r"^[0-9a-f]{32}$")
+
+CJK_FONT_NAMES = ["Noto Sans CJK TC", "Noto Sans TC", "Microsoft JhengHei", "PingFang TC", "WenQuanYi Zen Hei"]
+CJK_FONT = None   # 找不到中文字型時不在本地渲染 (標籤會變成方塊)，改走 QuickChart
+
+if HAS_MATPLOTLIB:
+    from matplotlib import font_manager
+    if CHART_FONT_PATH and os.path.exists(CHART_FONT_PATH):
+        font_manager.fontManager.addfont(CHART_FONT_PATH)
+        CJK_FONT = font_manager.FontProperties(fname=CHART_FONT_PATH).get_name()
+    else:
+        # 依序尋找系統上已安裝的常見繁中字型
+        installed = {f.name for f in font_manager.fontManager.ttflist}
+        CJK_FONT = next((name for name in CJK_FONT_NAMES if name in installed), None)
+    if CJK_FONT:
+        matplotlib.rcParams["font.sans-serif"] = [CJK_FONT] + matplotlib.rcParams["font.sans-serif"]
+    elif LOCAL_CHART_ENABLED and PUBLIC_BASE_URL:
+        print("⚠️ 找不到中文字型 (可設定 CHART_FONT_PATH)，圖表改用 QuickChart")
+
+_render_lock = threading.Lock()   # pyplot 不是 thread-safe
+
+
+def chart_hash(config, width, height, background):
+    """圖表內容的 canonical hash (key 排序 + 緊湊 JSON)，相同內容永遠得到相同檔名"""
+    canonical = json.dumps({"chart": config, "width": width, "height": height, "backgroundColor": background},
+                           sort_keys=True, ensure_ascii=False, separators=(",", ":"))
+    return hashlib.sha256(canonical.encode("utf-8")).hexdigest()[:32]
+
+
+def chart_path(h):
+    return os.path.join(CHART_CACHE_DIR, f"{h}.png")
+
+
+# ==========================================
+# 1. Chart.js (v2) 設定 → matplotlib
+# ==========================================
+def _css_color(value, default="#ffffff"):
+    """支援 #rrggbb 與 rgba(r,g,b,a)，回傳 matplotlib 可用的顏色"""
+    if not value: return default
+    m = re.match(r"rgba?\(([^)]+)\)", str(value).strip())
+    if m:
+        parts = [float(x) for x in m.group(1).split(",")]
+        r, g, b = [x / 255 for x in parts[:3]]
+        return (r, g, b, parts[3] if len(parts) > 3 else 1.0)
+    return value
+
+
+def _render_png(config, width, height, background):
+    options = config.get("options", {})
+    data = config.get("data", {})
+    labels = data.get("labels", [])
+    datasets = data.get("datasets", [])
+    scales = options.get("scales", {})
+    y_axis = (scales.get("yAxes") or [{}])[0]
+    x_axis = (scales.get("xAxes") or [{}])[0]
+    stacked = bool(y_axis.get("stacked"))
+
+    title = options.get("title", {})
+    show_title = bool(title.get("display") and title.get("text"))
+    legend = options.get("legend", {})
+    show_legend = bool(legend.get("display", True) and datasets)
+    legend_bottom = legend.get("position") == "bottom"
+
+    # 版面以 px 計算 (比照 Chart.js：padding → 標題 → 圖例 → 繪圖區)
+    pad = options.get("layout", {}).get("padding", {})
+    top_px = pad.get("top", 0) + (TITLE_PX if show_title else 0)
+    legend_y_px = top_px
+    if show_legend and not legend_bottom: top_px += LEGEND_PX
+    bottom_px = pad.get("bottom", 0) + TICK_LABEL_PX + (LEGEND_PX if show_legend and legend_bottom else 0)
+
+    fig = plt.figure(figsize=(width / 100, height / 100), dpi=100 * CHART_DPI_SCALE, facecolor=background)
+    try:
+        ax = fig.add_subplot(111, facecolor=background)
+        fig.subplots_adjust(
+            left=(pad.get("left", 0) + Y_LABEL_PX) / width, right=1 - pad.get("right", 0) / width,
+            top=1 - top_px / height, bottom=bottom_px / height
+        )
+
+        xs = list(range(len(labels)))
+        baseline = [0.0] * len(xs)
+        for ds in datasets:
+            values = [float(v or 0) for v in ds.get("data", [])][:len(xs)]
+            values += [0.0] * (len(xs) - len(values))
+            top = [b + v for b, v in zip(baseline, values)] if stacked else values
+            color = _css_color(ds.get("borderColor"))
+            marker = "o" if ds.get("pointRadius", 3) else None
+            ax.plot(xs, top, color=color, linewidth=1.5, marker=marker, markersize=ds.get("pointRadius", 3) or 0, label=ds.get("label"))
+            if ds.get("fill"):
+                ax.fill_between(xs, baseline if stacked else 0, top, color=_css_color(ds.get("backgroundColor"), color), linewidth=0)
+            if stacked: baseline = top
+
+        tick_style = y_axis.get("ticks", {})
+        tick_color = tick_style.get("fontColor", "#bbbbbb")
+        tick_size = tick_style.get("fontSize", 10)
+        ax.set_xticks(xs)
+        ax.set_xticklabels(labels, rotation=0)
+        ax.tick_params(colors=tick_color, labelsize=tick_size * 0.8)
+        grid_color = (y_axis.get("gridLines") or x_axis.get("gridLines") or {}).get("color", "#333333")
+        ax.grid(True, color=grid_color, linewidth=0.6)
+        ax.set_axisbelow(True)
+        for spine in ax.spines.values(): spine.set_color(grid_color)
+        if x_axis.get("offset") and xs: ax.set_xlim(-0.5, len(xs) - 0.5)
+
+        if show_title:
+            fig.text(0.5, 1 - (pad.get("top", 0) + 4) / height, title["text"], ha="center", va="top",
+                     color=title.get("fontColor", "#dddddd"), fontsize=10, fontweight="bold")
+
+        if show_legend:
+            label_style = legend.get("labels", {})
+            y = pad.get("bottom", 0) / height if legend_bottom else 1 - legend_y_px / height
+            leg = fig.legend(loc="lower center" if legend_bottom else "upper center", bbox_to_anchor=(0.5, y),
+                             ncol=min(len(datasets), 6), frameon=False, handlelength=1.2, columnspacing=1.0,
+                             fontsize=label_style.get("fontSize", 10) * 0.8)
+            for text in leg.get_texts(): text.set_color(label_style.get("fontColor", "#ffffff"))
+
+        buf = io.BytesIO()
+        fig.savefig(buf, format="png", facecolor=background)
+        return buf.getvalue()
+    finally:
+        plt.close(fig)
+
+
+# ==========================================
+# 2. Content-addressed 磁碟快取 + LRU 淘汰
+# ==========================================
+def _evict():
+    """超過容量或檔案數時，依最後存取時間 (mtime) 由舊到新刪除"""
+    try:
+        entries = []
+        for name in os.listdir(CHART_CACHE_DIR):
+            if not name.endswith(".png"): continue
+            path = os.path.join(CHART_CACHE_DIR, name)
+            st = os.stat(path)
+            entries.append((st.st_mtime, st.st_size, path))
+    except OSError:
+        return
+    entries.sort()
+    total = sum(e[1] for e in entries)
+    while entries and (total > CHART_CACHE_MAX_BYTES or len(entries) > CHART_CACHE_MAX_FILES):
+        _, size, path = entries.pop(0)
+        try:
+            os.remove(path); total -= size
+        except OSError:
+            pass
+
+
+def touch_chart(h):
+    """標記為最近使用 (LRU)，檔案存在回傳 True"""
+    path = chart_path(h)
+    try:
+        os.utime(path, None)
+        return True
+    except OSError:
+        return False
+
+
+def render_chart(config, width=500, height=300, background="#121212"):
+    """
+    渲染圖表並存入快取，回傳 hash
+    相同內容已存在時直接回傳，不會重複渲染
+    """
+    h = chart_hash(config, width, height, background)
+    if touch_chart(h): return h
+
+    started = time.time()
+    with _render_lock:
+        if touch_chart(h): return h
+        png = _render_png(config, width, height, background)
+    os.makedirs(CHART_CACHE_DIR, exist_ok=True)
+    tmp_path = f"{chart_path(h)}.{os.getpid()}.{threading.get_ident()}.tmp"
+    with open(tmp_path, "wb") as f: f.write(png)
+    os.replace(tmp_path, chart_path(h))
+    print(f"🎨 Chart rendered {h[:8]}: {len(png):,} bytes / {int((time.time() - started) * 1000)} ms")
+    _evict()
+    return h
+
+
+def render_chart_url(config, width=500, height=300, background="#121212"):
+    """回傳本地圖表的公開網址；未啟用、缺 matplotlib、缺中文字型或缺 PUBLIC_BASE_URL 時回傳 None"""
+    if not (LOCAL_CHART_ENABLED and HAS_MATPLOTLIB and CJK_FONT and PUBLIC_BASE_URL): return None
+    try:
+        return f"{PUBLIC_BASE_URL}/charts/{render_chart(config, width, height, background)}.png"
+    except Exception as e:
+        print(f"❌ Local Chart Error: {e}")
+        return None
@@ -0,0 +1,84 @@
+import os
+import re
+import json
+
+# --- RAG Prompt 內容打包 ---
+# 每個資料庫輸出一次欄位名稱，之後每筆只列值，並在 token 預算內公平分配給各資料庫
+RAG_CONTEXT_TOKENS = int(os.getenv("RAG_CONTEXT_TOKENS", "12000"))
+CELL_MAX_CHARS = int(os.getenv("RAG_CELL_MAX_CHARS", "600"))   # 單一欄位過長時截斷 (筆記內文)
+
+CJK_RE = re.compile(r"[　-鿿가-힯豈-﫿＀-￯]")
+
+
+def estimate_tokens(text):
+    """粗估 token 數：中日韓字元約 1 token/字，其餘約 4 字元/token"""
+    cjk = len(CJK_RE.findall(text))
+    return cjk + (len(text) - cjk + 3) // 4
+
+
+def _cell(value):
+    if isinstance(value, (dict, list)): value = json.dumps(value, ensure_ascii=False)
+    text = str(value).replace("\r", " ").replace("\n", " / ").replace("|", "｜")
+    return text[:CELL_MAX_CHARS] + "…" if len(text) > CELL_MAX_CHARS else text
+
+
+def _encode_table(rows):
+    """回傳 (欄位列, 每筆資料列)；欄位順序依第一次出現的順序"""
+    columns = []
+    for row in rows:
+        for k in row:
+            if k not in columns: columns.append(k)
+    header = " | ".join(columns)
+    lines = [" | ".join(_cell(row[c]) if row.get(c) not in (None, "") else "" for c in columns) for row in rows]
+    return header, lines
+
+
+def pack_context(raw_data, budget_tokens=None):
+    """
+    raw_data = {db_name: [row dict, ...]}，每個資料庫的 rows 需已依重要性排序
+    (日期查詢為最新在前、筆記為相關度高在前)，預算不足時從尾端捨棄
+
+    預算分配 (water-filling)：需求小的資料庫先拿足，剩下的預算再平分給其餘資料庫
+    回傳 (context 字串, report)
+    report = {db_name: {"rows": 原始筆數, "included": 放入筆數, "tokens": 估計 token}}
+    """
+    budget = RAG_CONTEXT_TOKENS if budget_tokens is None else budget_tokens
+    tables = {}
+    for name, rows in raw_data.items():
+        header, lines = _encode_table(rows)
+        title = f"### {name}"
+        tables[name] = {
+            "title": title, "header": header, "lines": lines,
+            "fixed": estimate_tokens(title) + estimate_tokens(header) + 2,
+            "costs": [estimate_tokens(line) + 1 for line in lines],
+        }
+
+    remaining = budget
+    order = sorted(tables, key=lambda n: tables[n]["fixed"] + sum(tables[n]["costs"]))
+    report = {}
+    for i, name in enumerate(order):
+        t = tables[name]
+        share = remaining // (len(order) - i)
+        used = t["fixed"]; included = 0
+        for cost in t["costs"]:
+            if used + cost > share: break
+            used += cost; included += 1
+        if not included: used = 0
+        t["included"] = included
+        remaining -= used
+        report[name] = {"rows": len(t["lines"]), "included": included, "tokens": used}
+
+    blocks = []
+    for name in raw_data:   # 輸出維持原本的資料庫順序
+        t = tables[name]
+        if not t["included"]: continue
+        omitted = len(t["lines"]) - t["included"]
+        title = t["title"] + (f" (另有 {omitted} 筆因長度省略)" if omitted else "")
+        blocks.append("\n".join([title, t["header"], *t["lines"][:t["included"]]]))
+    return "\n\n".join(blocks), report
+
+
+def format_report(report):
+    total = sum(r["tokens"] for r in report.values())
+    parts = [f"{name} {r['included']}/{r['rows']}" for name, r in report.items()]
+    return f"~{total:,} tokens | " + ", ".join(parts)
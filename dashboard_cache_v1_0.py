@@ -0,0 +1,111 @@
+import os
+import time
+import threading
+
+# --- 關鍵字儀表板預先計算 ---
+# 房貸 / BTC / 總資產 / 預測 / 消費比較 的卡片由背景 thread 定期重建，使用者查詢時直接回傳算好的卡片；
+# 快取尚未建立 (剛啟動) 或過舊時才退回即時查詢
+DASHBOARD_ENABLED = os.getenv("DASHBOARD_WARM_ENABLED", "1") == "1"
+DASHBOARD_INTERVAL = int(os.getenv("DASHBOARD_REFRESH_INTERVAL", "600"))                     # 秒，背景重建間隔
+DASHBOARD_MAX_STALE = int(os.getenv("DASHBOARD_MAX_STALE", str(DASHBOARD_INTERVAL * 3)))    # 秒，超過視為過舊改走即時查詢
+
+
+class DashboardCache:
+    """
+    以「群組」為單位重建：同一群組共用一次資料讀取 (例如 BTC / 總資產 / 預測 共用 120 天快照)
+    - register(group, builder)：builder() 回傳 {key: card}，card 為 None 表示目前沒有資料
+    - get(key)：有新鮮的卡片直接回傳，否則同步重建該群組 (同一群組同時只會有一個重建)
+    """
+
+    def __init__(self, name, interval, max_stale):
+        self.name = name
+        self.interval = interval
+        self.max_stale = max_stale
+        self._groups = {}      # group -> {builder, lock, runs, errors, last_ms, last_ok_at, last_error}
+        self._key_group = {}   # key -> group
+        self._cards = {}       # key -> (card, built_at)
+        self._lock = threading.Lock()
+        self._thread = None
+        self.hits = 0
+        self.stale_hits = 0
+        self.live_builds = 0
+
+    def register(self, group, builder, keys):
+        self._groups[group] = {"builder": builder, "lock": threading.Lock(), "runs": 0, "errors": 0,
+                               "last_ms": None, "last_ok_at": None, "last_error": None}
+        for key in keys: self._key_group[key] = group
+
+    def refresh(self, group):
+        """重建一個群組，回傳是否成功 (失敗時保留舊卡片)"""
+        state = self._groups[group]
+        with state["lock"]:
+            started = time.time()
+            try:
+                cards = state["builder"]() or {}
+                error = None
+            except Exception as e:
+                cards, error = {}, str(e)[:200]
+            ms = int((time.time() - started) * 1000)
+            with self._lock:
+                state["runs"] += 1; state["last_ms"] = ms
+                if error:
+                    state["errors"] += 1; state["last_error"] = error
+                else:
+                    state["last_ok_at"] = time.time(); state["last_error"] = None
+                    for key, card in cards.items():
+                        if card is None: self._cards.pop(key, None)
+                        else: self._cards[key] = (card, time.time())
+        if error: print(f"❌ Dashboard [{group}] 重建失敗 ({ms} ms): {error}")
+        else: print(f"🔄 Dashboard [{group}] 重建完成: {ms} ms")
+        return error is None
+
+    def refresh_all(self):
+        for group in list(self._groups): self.refresh(group)
+
+    def get(self, key):
+        """回傳卡片；快取冷 / 過舊時即時重建，重建失敗則退回舊卡片 (沒有則 None)"""
+        with self._lock:
+            entry = self._cards.get(key)
+        if entry and time.time() - entry[1] <= self.max_stale:
+            with self._lock: self.hits += 1
+            return entry[0]
+        group = self._key_group[key]
+        lock = self._groups[group]["lock"]
+        # 另一個 thread 正在重建同一群組：等它完成後直接使用結果
+        if lock.locked():
+            with lock: pass
+            with self._lock:
+                entry = self._cards.get(key)
+            if entry and time.time() - entry[1] <= self.max_stale:
+                with self._lock: self.hits += 1
+                return entry[0]
+        with self._lock: self.live_builds += 1
+        ok = self.refresh(group)
+        with self._lock:
+            if not ok and entry: self.stale_hits += 1
+            latest = self._cards.get(key)
+        return latest[0] if latest else None
+
+    def _loop(self):
+        while True:
+            self.refresh_all()
+            time.sleep(self.interval)
+
+    def start(self):
+        """啟動背景重建 (第一次立即執行，之後每 interval 秒一次)"""
+        if not DASHBOARD_ENABLED or (self._thread and self._thread.is_alive()): return
+        self._thread = threading.Thread(target=self._loop, name=f"{self.name}-warmer", daemon=True)
+        self._thread.start()
+
+    def stats(self):
+        now = time.time()
+        with self._lock:
+            return {
+                "enabled": DASHBOARD_ENABLED, "interval": self.interval, "max_stale": self.max_stale,
+                "hits": self.hits, "stale_hits": self.stale_hits, "live_builds": self.live_builds,
+                "cards": {key: {"age_s": round(now - built_at, 1)} for key, (_, built_at) in self._cards.items()},
+                "groups": {group: {
+                    "runs": s["runs"], "errors": s["errors"], "last_ms": s["last_ms"], "last_error": s["last_error"],
+                    "age_s": round(now - s["last_ok_at"], 1) if s["last_ok_at"] else None,
+                } for group, s in self._groups.items()},
+            }
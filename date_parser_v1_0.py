@@ -0,0 +1,376 @@
+import re
+import unicodedata
+import calendar
+from datetime import datetime, date, timedelta, timezone
+
+# --- 台灣時區設定 (UTC+8)，與 diet_helper_v1_1 相同 ---
+TW_TZ = timezone(timedelta(hours=8))
+
+# --- 本地相對日期解析 ---
+# 常見的中英文時間描述直接轉成 {start, end}，解析不了的才交給 Gemini
+
+CN_DIGITS = {"零": 0, "〇": 0, "一": 1, "二": 2, "兩": 2, "三": 3, "四": 4, "五": 5, "六": 6, "七": 7, "八": 8, "九": 9}
+NUM = r"(\d{1,3}|[零〇一二兩三四五六七八九十]{1,3})"
+EN_MONTHS = {m.lower(): i for i, m in enumerate(calendar.month_name) if m}
+EN_MONTHS.update({m.lower(): i for i, m in enumerate(calendar.month_abbr) if m})
+COMPARE_RE = re.compile(r"(比較|相比|對比|比|vs\.?|versus|compared?)")
+# 相對年份：修飾後面的月份 (去年12月 = 2025-12)，而不是和月份各自解析後取聯集
+YEAR_WORDS = {"今年": 0, "本年": 0, "去年": -1, "前年": -2}
+YEAR_PREFIX = r"(?:(\d{4})\s*年|(" + "|".join(YEAR_WORDS) + r"))"
+
+DATE_FMT = "%Y-%m-%d"
+
+
+def cn_to_int(token):
+    """阿拉伯數字或中文數字 (一 ~ 九十九) 轉 int"""
+    if token.isdigit(): return int(token)
+    if token == "十": return 10
+    if "十" in token:
+        tens, _, ones = token.partition("十")
+        return (CN_DIGITS.get(tens, 1) if tens else 1) * 10 + (CN_DIGITS.get(ones, 0) if ones else 0)
+    return CN_DIGITS.get(token)
+
+
+# ==========================================
+# 日期區間工具
+# ==========================================
+def add_months(d, months):
+    y, m = divmod(d.month - 1 + months, 12)
+    y += d.year; m += 1
+    return date(y, m, min(d.day, calendar.monthrange(y, m)[1]))
+
+
+def month_range(y, m):
+    return date(y, m, 1), date(y, m, calendar.monthrange(y, m)[1])
+
+
+def week_start(d):
+    return d - timedelta(days=d.weekday())   # 週一為一週開始
+
+
+def quarter_range(y, q):
+    start = date(y, 3 * (q - 1) + 1, 1)
+    return start, add_months(start, 3) - timedelta(days=1)
+
+
+def _past_month(today, m):
+    """沒寫年份的月份：還沒到的月份視為去年"""
+    return today.year if m <= today.month else today.year - 1
+
+
+# ==========================================
+# 規則表：(regex, handler(match, today) -> (start, end, kind))
+# kind = "current" / "previous" / "explicit"，用於比較句補上對應的本期區間
+# ==========================================
+def _rule_ymd(m, today):
+    d = date(int(m.group(1)), int(m.group(2)), int(m.group(3)))
+    return d, d, "explicit"
+
+
+def _rule_ym(m, today):
+    s, e = month_range(int(m.group(1)), int(m.group(2)))
+    return s, e, "explicit"
+
+
+def _rule_y(m, today):
+    y = int(m.group(1))
+    return date(y, 1, 1), date(y, 12, 31), "explicit"
+
+
+def _rule_md(m, today):
+    mo, d = cn_to_int(m.group(1)), cn_to_int(m.group(2))
+    day = date(_past_month(today, mo), mo, d)
+    if day > today: day = date(day.year - 1, mo, d)
+    return day, day, "explicit"
+
+
+def _prefix_year(m, today):
+    """YEAR_PREFIX 的兩個 group：(西元年, 相對年份)，都沒有時回傳 None"""
+    if m.group(1): return int(m.group(1))
+    if m.group(2): return today.year + YEAR_WORDS[m.group(2)]
+    return None
+
+
+def _rule_year_md(m, today):
+    """去年12月 / 今年3月5日：年份修飾後面的月 (日)"""
+    y, mo = _prefix_year(m, today), cn_to_int(m.group(3))
+    if m.group(4):
+        d = date(y, mo, cn_to_int(m.group(4)))
+        return d, d, "explicit"
+    s, e = month_range(y, mo)
+    return s, e, "explicit"
+
+
+def _rule_month_span(m, today):
+    """一月到三月 / 去年10月至12月：整段月份；沒寫年份時以最近一次已開始的「結束月」為準，跨年時起始月算前一年"""
+    first, last = cn_to_int(m.group(3)), cn_to_int(m.group(4))
+    y = _prefix_year(m, today)
+    if y is None:
+        end_year = _past_month(today, last)
+        start_year = end_year if first <= last else end_year - 1
+    else:
+        start_year, end_year = y, (y if first <= last else y + 1)
+    return month_range(start_year, first)[0], month_range(end_year, last)[1], "explicit"
+
+
+def _rule_m(m, today):
+    mo = cn_to_int(m.group(1))
+    s, e = month_range(_past_month(today, mo), mo)
+    return s, e, "explicit"
+
+
+def _rule_en_month(m, today):
+    mo = EN_MONTHS[m.group(1)]
+    y = int(m.group(2)) if m.group(2) else _past_month(today, mo)
+    s, e = month_range(y, mo)
+    return s, e, "explicit"
+
+
+def _rule_last_n(m, today):
+    n = cn_to_int(m.group(1)); unit = m.group(2)
+    if unit.startswith(("天", "日", "day")): start = today - timedelta(days=n - 1)
+    elif unit.startswith(("週", "周", "禮拜", "星期", "個禮拜", "個星期", "week")): start = today - timedelta(weeks=n) + timedelta(days=1)
+    elif unit.startswith(("年", "year")): start = add_months(today, -12 * n) + timedelta(days=1)
+    else: start = add_months(today, -n) + timedelta(days=1)
+    return start, today, "current"
+
+
+def _rule_quarter(m, today):
+    q = int(m.group(3))
+    y = _prefix_year(m, today) or int(m.group(4) or 0) or (today.year if quarter_range(today.year, q)[0] <= today else today.year - 1)
+    s, e = quarter_range(y, q)
+    return s, e, "explicit"
+
+
+def _fixed(fn, kind):
+    return lambda m, today: (*fn(today), kind)
+
+
+def _this_quarter(today):
+    return quarter_range(today.year, (today.month - 1) // 3 + 1)[0], today
+
+
+def _last_quarter(today):
+    q = (today.month - 1) // 3 + 1
+    return quarter_range(today.year, q - 1) if q > 1 else quarter_range(today.year - 1, 4)
+
+
+RULES = [
+    (re.compile(YEAR_PREFIX + r"?\s*" + NUM + r"\s*月?份?\s*(?:到|至|~|-|—)\s*" + NUM + r"\s*月份?"), _rule_month_span),
+    (re.compile(r"(\d{4})\s*[年/\-.]\s*(\d{1,2})\s*[月/\-.]\s*(\d{1,2})\s*[日號]?"), _rule_ymd),
+    (re.compile(r"(\d{4})\s*[年/\-.]\s*(\d{1,2})\s*月?(?!\d)"), _rule_ym),
+    # q 前面不能緊接英文字母或「英文字 + 空白」(faq1、iphone q1 不是季度)；去年 / 今年 修飾後面的季度
+    (re.compile(r"(?:(?:(\d{4})\s*年?|(" + "|".join(YEAR_WORDS) + r"))\s*)?(?<![a-z])(?<![a-z] )q([1-4])\b(?:\s*(\d{4}))?"), _rule_quarter),
+    (re.compile(YEAR_PREFIX + r"\s*" + NUM + r"\s*月份?(?:\s*" + NUM + r"\s*[日號])?"), _rule_year_md),
+    (re.compile(r"(\d{4})\s*年"), _rule_y),
+    (re.compile(NUM + r"\s*月\s*" + NUM + r"\s*[日號]"), _rule_md),
+    (re.compile(r"(?:近|最近|過去|前)\s*" + NUM + r"\s*(天|日|個?禮拜|個?星期|週|周|個?月|年)"), _rule_last_n),
+    (re.compile(r"(?:last|past)\s+(\d+)\s+(days?|weeks?|months?|years?)"), _rule_last_n),
+    (re.compile(r"\b(" + "|".join(sorted(EN_MONTHS, key=len, reverse=True)) + r")\b\.?\s*(\d{4})?"), _rule_en_month),
+    (re.compile(r"(上上(?:個)?(?:週|周|禮拜|星期))"), _fixed(lambda t: (week_start(t) - timedelta(days=14), week_start(t) - timedelta(days=8)), "previous")),
+    (re.compile(r"(上(?:個)?(?:週|周|禮拜|星期)|last\s+week)"), _fixed(lambda t: (week_start(t) - timedelta(days=7), week_start(t) - timedelta(days=1)), "previous")),
+    (re.compile(r"((?:這|本|这)(?:個)?(?:週|周|禮拜|星期)|this\s+week)"), _fixed(lambda t: (week_start(t), t), "current")),
+    (re.compile(r"(上上(?:個)?月)"), _fixed(lambda t: month_range(add_months(t, -2).year, add_months(t, -2).month), "previous")),
+    (re.compile(r"(上(?:個)?月|last\s+month)"), _fixed(lambda t: month_range(add_months(t, -1).year, add_months(t, -1).month), "previous")),
+    (re.compile(r"((?:這|本|当|當)(?:個)?月|this\s+month)"), _fixed(lambda t: (t.replace(day=1), t), "current")),
+    (re.compile(r"(上(?:一)?(?:個)?季|last\s+quarter)"), _fixed(_last_quarter, "previous")),
+    (re.compile(r"((?:這|本)(?:一)?(?:個)?季|this\s+quarter)"), _fixed(_this_quarter, "current")),
+    (re.compile(r"(前年)"), _fixed(lambda t: (date(t.year - 2, 1, 1), date(t.year - 2, 12, 31)), "previous")),
+    (re.compile(r"(去年|last\s+year)"), _fixed(lambda t: (date(t.year - 1, 1, 1), date(t.year - 1, 12, 31)), "previous")),
+    (re.compile(r"((?:今|本)年|this\s+year)"), _fixed(lambda t: (date(t.year, 1, 1), t), "current")),
+    (re.compile(r"(前天|day\s+before\s+yesterday)"), _fixed(lambda t: (t - timedelta(days=2), t - timedelta(days=2)), "previous")),
+    (re.compile(r"(昨天|昨日|昨晚|yesterday)"), _fixed(lambda t: (t - timedelta(days=1), t - timedelta(days=1)), "previous")),
+    (re.compile(r"(今天|今日|今晚|今早|today|tonight)"), _fixed(lambda t: (t, t), "current")),
+    (re.compile(NUM + r"\s*月份?(?!\d)"), _rule_m),
+]
+
+# 比較句只寫了「上期」時，補上對應的「本期」(例如 "vs last month" → 上個月 + 這個月)
+CURRENT_OF_PREVIOUS = [
+    (re.compile(r"上(?:個)?(?:週|周|禮拜|星期)|last\s+week"), lambda t: (week_start(t), t)),
+    (re.compile(r"上(?:個)?月|last\s+month"), lambda t: (t.replace(day=1), t)),
+    (re.compile(r"上(?:一)?(?:個)?季|last\s+quarter"), _this_quarter),
+    (re.compile(r"去年|last\s+year"), lambda t: (date(t.year, 1, 1), t)),
+    (re.compile(r"昨天|昨日|yesterday"), lambda t: (t, t)),
+]
+
+
+def today_tw():
+    return datetime.now(TW_TZ).date()
+
+
+def parse_date_range(text, today=None):
+    """
+    解析問題中的時間描述，回傳 {"start": "YYYY-MM-DD", "end": "YYYY-MM-DD"}；完全沒有可辨識的描述時回傳 None
+    - 多個時間描述 (比較句) 取聯集：start 取最早、end 取最晚
+    - 比較句只出現上期時，自動補上本期
+    """
+    today = today or today_tw()
+    s = unicodedata.normalize("NFKC", text or "").lower()
+    ranges = []
+    kinds = []
+    for pattern, handler in RULES:
+        def _take(m):
+            try:
+                start, end, kind = handler(m, today)
+            except (ValueError, TypeError, KeyError):
+                return m.group(0)   # 無效日期 (例如 2 月 30 日) 視為沒解析到
+            ranges.append((start, end)); kinds.append(kind)
+            return " " * len(m.group(0))   # 遮掉已解析的文字，避免被較短的規則重複解析
+        s = pattern.sub(_take, s)
+
+    if not ranges: return None
+
+    if COMPARE_RE.search(unicodedata.normalize("NFKC", text).lower()) and "current" not in kinds and "explicit" not in kinds:
+        lowered = unicodedata.normalize("NFKC", text).lower()
+        for pattern, current_fn in CURRENT_OF_PREVIOUS:
+            if pattern.search(lowered):
+                ranges.append(current_fn(today))
+                break
+
+    start = min(r[0] for r in ranges)
+    end = max(r[1] for r in ranges)
+    return {"start": start.strftime(DATE_FMT), "end": end.strftime(DATE_FMT)}
+
+
+def sanitize_date_filter(date_filter):
+    """
+    檢查 Gemini 回傳的 date_filter：格式錯誤的欄位清成 ""，start > end 時對調
+    回傳值一定是 {"start": str, "end": str}
+    """
+    clean = {"start": "", "end": ""}
+    if not isinstance(date_filter, dict): return clean
+    for key in ("start", "end"):
+        value = str(date_filter.get(key) or "").strip()[:10]
+        try:
+            datetime.strptime(value, DATE_FMT)
+            clean[key] = value
+        except ValueError:
+            pass
+    if clean["start"] and clean["end"] and clean["start"] > clean["end"]:
+        clean["start"], clean["end"] = clean["end"], clean["start"]
+    return clean
+
+
+# ==========================================
+# 自我檢查：python date_parser_v1_0.py
+# 基準日 2026-02-11 (週三)
+# ==========================================
+SELF_CHECK_TODAY = date(2026, 2, 11)
+SELF_CHECK_CASES = [
+    # (問題, start, end)；start 為 None 表示應回傳 None
+    ("今天吃了什麼", "2026-02-11", "2026-02-11"),
+    ("今日花費", "2026-02-11", "2026-02-11"),
+    ("昨天花多少", "2026-02-10", "2026-02-10"),
+    ("昨日熱量", "2026-02-10", "2026-02-10"),
+    ("前天的午餐", "2026-02-09", "2026-02-09"),
+    ("這週蛋白質夠嗎", "2026-02-09", "2026-02-11"),
+    ("這周花費", "2026-02-09", "2026-02-11"),
+    ("本週支出", "2026-02-09", "2026-02-11"),
+    ("這禮拜吃了幾次速食", "2026-02-09", "2026-02-11"),
+    ("上週花多少", "2026-02-02", "2026-02-08"),
+    ("上周的消費", "2026-02-02", "2026-02-08"),
+    ("上個禮拜", "2026-02-02", "2026-02-08"),
+    ("上上週", "2026-01-26", "2026-02-01"),
+    ("這個月花多少", "2026-02-01", "2026-02-11"),
+    ("這月預算", "2026-02-01", "2026-02-11"),
+    ("本月收入", "2026-02-01", "2026-02-11"),
+    ("上個月花多少", "2026-01-01", "2026-01-31"),
+    ("上月最大開銷", "2026-01-01", "2026-01-31"),
+    ("上上個月", "2025-12-01", "2025-12-31"),
+    ("這個月比上個月多花多少", "2026-01-01", "2026-02-11"),
+    ("跟上個月比", "2026-01-01", "2026-02-11"),
+    ("spending vs last month", "2026-01-01", "2026-02-11"),
+    ("上週相比", "2026-02-02", "2026-02-11"),
+    ("近三個月", "2025-11-12", "2026-02-11"),
+    ("最近3個月的支出", "2025-11-12", "2026-02-11"),
+    ("過去六個月", "2025-08-12", "2026-02-11"),
+    ("近7天", "2026-02-05", "2026-02-11"),
+    ("最近十天吃什麼", "2026-02-02", "2026-02-11"),
+    ("近兩週", "2026-01-29", "2026-02-11"),
+    ("近一年", "2025-02-12", "2026-02-11"),
+    ("last 30 days", "2026-01-13", "2026-02-11"),
+    ("past 2 weeks", "2026-01-29", "2026-02-11"),
+    ("last 3 months", "2025-11-12", "2026-02-11"),
+    ("今年", "2026-01-01", "2026-02-11"),
+    ("今年的損益", "2026-01-01", "2026-02-11"),
+    ("去年總共花多少", "2025-01-01", "2025-12-31"),
+    ("前年", "2024-01-01", "2024-12-31"),
+    ("今年跟去年比", "2025-01-01", "2026-02-11"),
+    ("2025年12月", "2025-12-01", "2025-12-31"),
+    ("2025年12月花費", "2025-12-01", "2025-12-31"),
+    ("2025-12", "2025-12-01", "2025-12-31"),
+    ("2025/3", "2025-03-01", "2025-03-31"),
+    ("2025年", "2025-01-01", "2025-12-31"),
+    ("2026-01-15", "2026-01-15", "2026-01-15"),
+    ("2026/1/15 吃什麼", "2026-01-15", "2026-01-15"),
+    ("2025年12月25日", "2025-12-25", "2025-12-25"),
+    ("2025年11月和2025年12月比較", "2025-11-01", "2025-12-31"),
+    ("1月花多少", "2026-01-01", "2026-01-31"),
+    ("12月花多少", "2025-12-01", "2025-12-31"),
+    ("十二月的預算", "2025-12-01", "2025-12-31"),
+    ("三月份", "2025-03-01", "2025-03-31"),
+    ("2月3日吃了什麼", "2026-02-03", "2026-02-03"),
+    ("12月25號", "2025-12-25", "2025-12-25"),
+    ("這季", "2026-01-01", "2026-02-11"),
+    ("上一季", "2025-10-01", "2025-12-31"),
+    ("2025 q3", "2025-07-01", "2025-09-30"),
+    ("Q4", "2025-10-01", "2025-12-31"),
+    ("去年q3", "2025-07-01", "2025-09-30"),
+    ("faq1 問題", None, None),
+    ("iphone q1 規格", None, None),
+    ("today", "2026-02-11", "2026-02-11"),
+    ("yesterday spending", "2026-02-10", "2026-02-10"),
+    ("this week", "2026-02-09", "2026-02-11"),
+    ("last week", "2026-02-02", "2026-02-08"),
+    ("this month", "2026-02-01", "2026-02-11"),
+    ("last month", "2026-01-01", "2026-01-31"),
+    ("this year", "2026-01-01", "2026-02-11"),
+    ("last year", "2025-01-01", "2025-12-31"),
+    ("December 2025", "2025-12-01", "2025-12-31"),
+    ("dec 2025", "2025-12-01", "2025-12-31"),
+    ("台股庫存", None, None),
+    ("我的筆記", None, None),
+    ("最近有吃太油嗎", None, None),
+    ("BTC 有多少", None, None),
+    ("2025年2月30日", "2025-02-01", "2025-02-28"),   # 無效日期退回整個月
+    # 年份修飾後面的月份 / 月份區間
+    ("去年12月", "2025-12-01", "2025-12-31"),
+    ("去年3月花多少", "2025-03-01", "2025-03-31"),
+    ("今年1月", "2026-01-01", "2026-01-31"),
+    ("前年五月", "2024-05-01", "2024-05-31"),
+    ("去年12月25日", "2025-12-25", "2025-12-25"),
+    ("去年12月跟今年1月比", "2025-12-01", "2026-01-31"),
+    ("一月到三月", "2025-01-01", "2025-03-31"),
+    ("1月到2月", "2026-01-01", "2026-02-28"),
+    ("十一月到一月", "2025-11-01", "2026-01-31"),
+    ("去年一月到三月", "2025-01-01", "2025-03-31"),
+    ("2025年10月至12月", "2025-10-01", "2025-12-31"),
+    ("3-5月", "2025-03-01", "2025-05-31"),
+]
+
+
+def run_self_check():
+    failed = 0
+    for query, start, end in SELF_CHECK_CASES:
+        got = parse_date_range(query, SELF_CHECK_TODAY)
+        expected = {"start": start, "end": end} if start else None
+        if got != expected:
+            failed += 1
+            print(f"❌ {query!r}: expected {expected}, got {got}")
+    for raw, expected in [
+        ({"start": "2026-01-01", "end": "2026-02-11"}, {"start": "2026-01-01", "end": "2026-02-11"}),
+        ({"start": "2026-02-11", "end": "2026-01-01"}, {"start": "2026-01-01", "end": "2026-02-11"}),
+        ({"start": "上個月", "end": ""}, {"start": "", "end": ""}),
+        ({"start": "2026-13-01"}, {"start": "", "end": ""}),
+        (None, {"start": "", "end": ""}),
+    ]:
+        if sanitize_date_filter(raw) != expected:
+            failed += 1
+            print(f"❌ sanitize {raw!r}: expected {expected}, got {sanitize_date_filter(raw)}")
+    total = len(SELF_CHECK_CASES) + 5
+    print(f"{'✅' if not failed else '❌'} {total - failed}/{total} cases passed")
+    return failed == 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(0 if run_self_check() else 1)
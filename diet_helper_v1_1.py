@@ -1,10 +1,20 @@
 import os
-import requests
 import json
+import time
+import uuid
 import base64
 import urllib3
 from datetime import datetime, timedelta, timezone
 from linebot.models import TextSendMessage, FlexSendMessage, QuickReply, QuickReplyButton, MessageAction
+from http_helper_v1_0 import http_post
+from line_helper_v1_0 import deliver_line_message
+from gemini_helper_v1_0 import gemini_url
+from image_helper_v1_0 import prepare_image
+from session_store_v1_0 import create_session_store
+from job_helper_v1_0 import JobQueue
+from write_queue_v1_0 import enqueue_page
+from nutrition_ledger_v1_0 import record_meal
+from metrics_helper_v1_0 import request_trace, span
 
 # --- 關閉 SSL 警告 ---
 urllib3.disable_warnings(urllib3.exceptions.InsecureRequestWarning)
@@ -14,7 +24,11 @@ NOTION_TOKEN = os.getenv("NOTION_TOKEN")
 DIET_DB_ID = os.getenv("DIET_DB_ID")
 GOOGLE_API_KEY = os.getenv("GOOGLE_API_KEY")
 
-user_sessions = {}
+# 餐前照片暫存 (有 TTL 與容量上限，預設存在 SQLite 讓多個 worker 共用)
+SESSION_STORE = create_session_store()
+
+# 飲食分析 (Gemini Vision + Notion 寫入) 專用的背景佇列，不佔用 webhook worker，也不會卡住關鍵字指令
+DIET_QUEUE = JobQueue("diet", workers=int(os.getenv("DIET_WORKERS", "2")), max_depth=int(os.getenv("DIET_QUEUE_DEPTH", "20")))
 
 NOTION_HEADERS = {
     "Authorization": f"Bearer {NOTION_TOKEN}",
@@ -65,10 +79,16 @@ def make_progress_bar(label, value, target, color):
         ]
     }
 
-def create_diet_flex(data):
-    """產生營養分析 Flex Message"""
-    cal_pct = min(int((data['calories'] / DAILY_TARGET['calories']) * 100), 100)
-    cal_color = "#ef5350" if cal_pct > 40 else "#27ae60" 
+def create_diet_flex(data, day_totals=None):
+    """產生營養分析 Flex Message (有 day_totals 時進度條顯示今日累計)"""
+    totals = day_totals or data
+    cal_pct = min(int((totals['calories'] / DAILY_TARGET['calories']) * 100), 100)
+    if day_totals:
+        cal_color = "#ef5350" if cal_pct >= 90 else "#27ae60"
+        cal_note = f"今日累計 {int(totals['calories'])} kcal ({totals['meals']} 餐)，佔每日 {cal_pct}% (目標 {DAILY_TARGET['calories']})"
+    else:
+        cal_color = "#ef5350" if cal_pct > 40 else "#27ae60" 
+        cal_note = f"佔每日 {cal_pct}% (目標 {DAILY_TARGET['calories']})"
 
     return {
         "type": "bubble",
@@ -87,15 +107,15 @@ def create_diet_flex(data):
                 {
                     "type": "box", "layout": "vertical", "contents": [
                         {"type": "text", "text": f"{data['calories']} kcal", "size": "4xl", "weight": "bold", "color": cal_color, "align": "center"},
-                        {"type": "text", "text": f"佔每日 {cal_pct}% (目標 {DAILY_TARGET['calories']})", "size": "xxs", "color": "#aaaaaa", "align": "center"}
+                        {"type": "text", "text": cal_note, "size": "xxs", "color": "#aaaaaa", "align": "center", "wrap": True}
                     ]
                 },
                 {"type": "separator", "margin": "lg", "color": "#333333"},
                 
                 # 2. 三大營養素進度條
-                make_progress_bar("蛋白質", data.get('protein', 0), DAILY_TARGET['protein'], "#4fc3f7"),
-                make_progress_bar("碳水", data.get('carbs', 0), DAILY_TARGET['carbs'], "#ffb74d"),
-                make_progress_bar("脂肪", data.get('fat', 0), DAILY_TARGET['fat'], "#e57373"),
+                make_progress_bar("今日蛋白質" if day_totals else "蛋白質", round(totals.get('protein', 0)), DAILY_TARGET['protein'], "#4fc3f7"),
+                make_progress_bar("今日碳水" if day_totals else "碳水", round(totals.get('carbs', 0)), DAILY_TARGET['carbs'], "#ffb74d"),
+                make_progress_bar("今日脂肪" if day_totals else "脂肪", round(totals.get('fat', 0)), DAILY_TARGET['fat'], "#e57373"),
 
                 {"type": "separator", "margin": "lg", "color": "#333333"},
 
@@ -115,7 +135,7 @@ def analyze_with_gemini_http(img1_bytes, img2_bytes=None):
     print("🤖 正在呼叫 Gemini 2.5 Flash (HTTP)...")
     b64_img1 = base64.b64encode(img1_bytes).decode('utf-8')
     
-    url = f"https://generativelanguage.googleapis.com/v1beta/models/gemini-2.5-flash:generateContent?key={GOOGLE_API_KEY}"
+    url = gemini_url("gemini-2.5-flash")
     headers = {"Content-Type": "application/json"}
     
     parts = [{"inline_data": {"mime_type": "image/jpeg", "data": b64_img1}}]
@@ -163,7 +183,9 @@ def analyze_with_gemini_http(img1_bytes, img2_bytes=None):
     data = {"contents": [{"parts": parts}]}
 
     try:
-        response = requests.post(url, headers=headers, json=data, verify=False)
+        started = time.time()
+        response = http_post(url, headers=headers, json=data, timeout=80, retries=1, idempotent=True)
+        print(f"🤖 Gemini 飲食分析: 上傳 {len(response.request.body or b'') / 1024:,.0f} KB / {int((time.time() - started) * 1000)} ms")
         
         if response.status_code == 200:
             result = response.json()
@@ -183,7 +205,7 @@ def analyze_with_gemini_http(img1_bytes, img2_bytes=None):
 
 # 🔥 核心修改：寫入 Notion 數值欄位
 def save_to_notion(user_id, data):
-    """寫入 Notion 資料庫"""
+    """寫入 Notion 資料庫，並累加到本地每日營養帳本 (回傳今日累計，帳本失敗時回傳 None)"""
     now_tw = datetime.now(TW_TZ)
     meal_type = get_meal_type_tw()
     
@@ -232,20 +254,34 @@ def save_to_notion(user_id, data):
         ]
     }
     
+    # 先寫入本地佇列立即返回，由背景 thread 送到 Notion (失敗會重試，不會遺失紀錄)
     try:
-        requests.post("https://api.notion.com/v1/pages", headers=NOTION_HEADERS, json=payload, verify=False)
-        print("✅ Notion 寫入成功")
+        write_id = enqueue_page(payload, label="diet")
+        print(f"📝 Notion 寫入已排入佇列 #{write_id}")
     except Exception as e:
-        print(f"❌ Notion 寫入失敗: {e}")
+        # 沒有排入佇列就不累加帳本，避免帳本與 Notion 不一致 (之後重建也不會補上這一餐)
+        print(f"❌ Notion 寫入佇列失敗: {e}")
+        return None
 
-def handle_diet_image(user_id, image_content, reply_token, line_bot_api):
-    """處理使用者傳送的飲食圖片"""
-    now_tw = datetime.now(TW_TZ)
+    try:
+        return record_meal(user_id, data, now_tw)
+    except Exception as e:
+        print(f"❌ 營養帳本更新失敗: {e}")
+        return None
+
+def handle_diet_image(user_id, image_content, reply_token, line_bot_api, event_ts=None):
+    """處理使用者傳送的飲食圖片 (event_ts 用於判斷 Reply Token 是否過期)"""
+    # 收到就先縮圖，session 暫存與送 Gemini 都用縮小後的版本
+    with span("image_prepare") as info:
+        image_content, _ = prepare_image(image_content)
+        info["bytes"] = len(image_content)
     
-    if user_id not in user_sessions:
+    # 取出即刪除，兩個 worker 不會同時拿到同一份餐前照片
+    session = SESSION_STORE.pop(user_id)
+    if session is None:
         print(f"📸 用戶 {user_id} 傳送了餐前照片")
         # 記錄狀態與餐前照片
-        user_sessions[user_id] = {'step': 'waiting_after', 'before_img': image_content, 'timestamp': now_tw}
+        SESSION_STORE.put(user_id, 'waiting_after', image_content)
         
         # 回覆並附帶「完食」按鈕
         text_msg = TextSendMessage(
@@ -254,45 +290,70 @@ def handle_diet_image(user_id, image_content, reply_token, line_bot_api):
                 QuickReplyButton(action=MessageAction(label="完食 (單圖分析)", text="完食"))
             ])
         )
-        line_bot_api.reply_message(reply_token, text_msg)
+        deliver_line_message(reply_token, user_id, text_msg, event_ts)
     else:
         print(f"📸 用戶 {user_id} 傳送了餐後照片，開始分析 (雙圖)...")
-        session = user_sessions.pop(user_id)
-        before_img = session['before_img']
-        
-        line_bot_api.reply_message(reply_token, TextSendMessage(text="🤖 AI 營養師正在分析中 (雙圖比對)..."))
+        before_img = session['image']
+        submit_analysis(user_id, before_img, image_content, reply_token, line_bot_api, event_ts, "雙圖比對")
 
-        perform_analysis(user_id, before_img, image_content, reply_token, line_bot_api)
+def submit_analysis(user_id, img1, img2, reply_token, line_bot_api, event_ts, mode_label):
+    """
+    先把分析工作交給 DIET_QUEUE，再依結果回覆 (避免先說「分析中」又說佇列已滿)
+    佇列已滿時保留餐前照片：單圖模式請使用者稍後再按「完食」，雙圖模式請使用者重傳餐後照片
+    """
+    ahead = DIET_QUEUE.depth() + DIET_QUEUE.running
+    job_id = DIET_QUEUE.submit(perform_analysis, user_id, img1, img2, reply_token, line_bot_api)
+    if not job_id:
+        SESSION_STORE.put(user_id, 'waiting_after', img1)
+        retry_hint = "請稍後再傳一次「餐後照片」" if img2 else "請稍後再按一次「完食」"
+        deliver_line_message(reply_token, user_id, TextSendMessage(
+            text=f"⚠️ 目前分析的照片太多，已保留您的餐前照片，{retry_hint}。",
+            quick_reply=QuickReply(items=[
+                QuickReplyButton(action=MessageAction(label="完食 (單圖分析)", text="完食"))
+            ])
+        ), event_ts)
+        return None
+
+    queue_note = f"\n(前面還有 {ahead} 筆分析在排隊)" if ahead >= DIET_QUEUE.workers else ""
+    deliver_line_message(reply_token, user_id, TextSendMessage(text=f"🤖 AI 營養師正在分析中 ({mode_label})...{queue_note}"), event_ts)
+    print(f"📥 飲食分析已排入佇列: {job_id} ({mode_label})")
+    return job_id
 
 def perform_analysis(user_id, img1, img2, reply_token, line_bot_api):
-    try:
-        result = analyze_with_gemini_http(img1, img2)
+    """於 DIET_QUEUE worker 執行，結果一律以 Push 發送；失敗時通知使用者後拋出例外，工作狀態記為 failed"""
+    with request_trace("diet_analysis", mode="double" if img2 else "single"):
+        try:
+            with span("gemini_diet") as info:
+                result = analyze_with_gemini_http(img1, img2)
+                info["bytes"] = len(img1) + len(img2 or b"")
         
-        if result and result.get("error") == "quota_exceeded":
-            line_bot_api.push_message(user_id, TextSendMessage(text="💸 今日 TOKEN 已用罄 QQ"))
-            return
+            if result and result.get("error") == "quota_exceeded":
+                notice, reason = "💸 今日 TOKEN 已用罄 QQ", "Gemini quota exceeded"
+            elif result:
+                with span("save"):
+                    day_totals = save_to_notion(user_id, result)
+                flex_content = create_diet_flex(result, day_totals)
+                flex_message = FlexSendMessage(alt_text=f"營養分析：{result['food_name']}", contents=flex_content)
+                line_bot_api.push_message(user_id, flex_message, retry_key=str(uuid.uuid4()))
+                return
+            else:
+                notice, reason = "⚠️ AI 分析失敗，請重試。", "Gemini analysis failed"
+        except Exception as e:
+            print(f"❌ 系統錯誤: {e}")
+            line_bot_api.push_message(user_id, TextSendMessage(text="⚠️ 系統發生錯誤"), retry_key=str(uuid.uuid4()))
+            raise
+        line_bot_api.push_message(user_id, TextSendMessage(text=notice), retry_key=str(uuid.uuid4()))
+        raise RuntimeError(reason)
 
-        if result:
-            save_to_notion(user_id, result)
-            flex_content = create_diet_flex(result)
-            flex_message = FlexSendMessage(alt_text=f"營養分析：{result['food_name']}", contents=flex_content)
-            line_bot_api.push_message(user_id, flex_message)
-        else:
-            line_bot_api.push_message(user_id, TextSendMessage(text="⚠️ AI 分析失敗，請重試。"))
-    except Exception as e:
-        print(f"❌ 系統錯誤: {e}")
-        line_bot_api.push_message(user_id, TextSendMessage(text="⚠️ 系統發生錯誤"))
-
-def trigger_single_image_analysis(user_id, reply_token, line_bot_api):
+def trigger_single_image_analysis(user_id, reply_token, line_bot_api, event_ts=None):
     """供 app.py 呼叫的單圖觸發函式"""
-    if user_id in user_sessions and user_sessions[user_id].get('step') == 'waiting_after':
+    if SESSION_STORE.peek_step(user_id) == 'waiting_after':
+        session = SESSION_STORE.pop(user_id)
+        if session is None: return False   # 已被其他 worker 取走或剛好過期
         print(f"🚀 用戶 {user_id} 觸發單圖分析 (完食)")
-        session = user_sessions.pop(user_id)
-        before_img = session['before_img']
-        
-        line_bot_api.reply_message(reply_token, TextSendMessage(text="🤖 AI 營養師正在分析中 (單圖假設完食)..."))
+        before_img = session['image']
         
         # 傳入 img2=None 觸發單圖模式
-        perform_analysis(user_id, before_img, None, reply_token, line_bot_api)
+        submit_analysis(user_id, before_img, None, reply_token, line_bot_api, event_ts, "單圖假設完食")
         return True
     return False
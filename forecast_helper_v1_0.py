@@ -0,0 +1,147 @@
+import os
+import time
+import hashlib
+import numpy as np
+
+# --- 蒙地卡羅模擬設定 ---
+MC_PATHS = int(os.getenv("MC_PATHS", "50000"))
+MC_YEARS = int(os.getenv("MC_YEARS", "10"))
+MC_STEP = os.getenv("MC_STEP", "yearly")      # yearly / monthly
+MC_MODEL = os.getenv("MC_MODEL", "normal")    # normal / bootstrap
+MC_SEED = int(os.getenv("MC_SEED")) if os.getenv("MC_SEED") else None
+
+# bootstrap 模式每次抽樣的連續天數 (moving block)
+MC_BLOCK_DAYS = int(os.getenv("MC_BLOCK_DAYS", "5"))
+# bootstrap 模式一次最多產生多少個亂數 (控制記憶體，約 8 bytes / 個)
+MC_CHUNK_ELEMENTS = int(os.getenv("MC_CHUNK_ELEMENTS", "20000000"))
+
+STEPS_PER_YEAR = {"yearly": 1, "monthly": 12}
+DAYS_PER_YEAR = 365
+
+
+def estimate_params(history_totals):
+    """由每日總資產估算年化報酬與波動 (沿用原本的上下限，避免短期極端值)"""
+    arr = np.array(history_totals, dtype=float); arr[arr == 0] = 1
+    daily_returns = np.diff(arr) / arr[:-1]
+    cagr = (1 + np.mean(daily_returns)) ** DAYS_PER_YEAR - 1
+    vol = np.std(daily_returns) * np.sqrt(DAYS_PER_YEAR)
+    cagr = max(min(cagr, 0.30), 0.02); vol = max(min(vol, 0.40), 0.05)
+    return daily_returns, cagr, vol
+
+
+def _normal_growth(rng, cagr, vol, paths, n_steps, per_year):
+    """常態模型：每一期報酬 ~ N(mu, sigma)，整個 (paths, n_steps) 矩陣一次抽完"""
+    mu = (1 + cagr) ** (1 / per_year) - 1
+    sigma = vol / np.sqrt(per_year)
+    return 1 + rng.normal(mu, sigma, size=(paths, n_steps))
+
+
+def _bootstrap_growth(rng, daily_returns, cagr, vol, paths, n_steps, per_year):
+    """
+    Bootstrap 模型：以 moving block bootstrap 重抽歷史日報酬 (保留肥尾/偏態與短期自相關)
+    先把 log 日報酬標準化，再縮放到 cagr / vol，讓結果與常態模型採用相同的上下限。
+    每期報酬 = 該期抽到的各區塊 log 報酬加總；依 MC_CHUNK_ELEMENTS 分批以限制記憶體。
+    """
+    log_r = np.log1p(np.asarray(daily_returns, dtype=float))
+    std = log_r.std()
+    z = (log_r - log_r.mean()) / std if std > 0 else np.zeros_like(log_r)
+    mu_d = np.log1p(cagr) / DAYS_PER_YEAR - 0.5 * (vol ** 2) / DAYS_PER_YEAR
+    sigma_d = vol / np.sqrt(DAYS_PER_YEAR)
+    samples = mu_d + sigma_d * z
+
+    # 預先算好所有連續 block 的加總，抽樣次數減為 1 / MC_BLOCK_DAYS
+    block = max(1, min(MC_BLOCK_DAYS, len(samples)))
+    csum = np.concatenate(([0.0], np.cumsum(samples)))
+    block_sums = csum[block:] - csum[:-block]
+    # 重疊區塊會讓頭尾的日子權重較低，重新置中確保漂移量仍等於 block * mu_d
+    block_sums += block * mu_d - block_sums.mean()
+
+    days_per_step = max(1, round(DAYS_PER_YEAR / per_year))
+    blocks_per_step = max(1, round(days_per_step / block))
+    chunk = max(1, MC_CHUNK_ELEMENTS // (n_steps * blocks_per_step))
+    out = np.empty((paths, n_steps))
+    for start in range(0, paths, chunk):
+        n = min(chunk, paths - start)
+        idx = rng.integers(0, len(block_sums), size=(n, n_steps, blocks_per_step))
+        out[start:start + n] = block_sums[idx].sum(axis=2)
+    # 區塊數取整後的天數誤差，以比例修正回每期應有的天數
+    out *= days_per_step / (blocks_per_step * block)
+    return np.exp(out)
+
+
+def simulate_paths(current_assets, cagr, vol, paths=None, years=None, step=None, model=None, daily_returns=None, seed=None):
+    """
+    產生資產路徑矩陣 shape = (paths, years * steps_per_year)
+    - step: "yearly" / "monthly"
+    - model: "normal" / "bootstrap" (bootstrap 需提供 daily_returns)
+    """
+    paths = paths or MC_PATHS
+    years = years or MC_YEARS
+    step = step or MC_STEP
+    model = model or MC_MODEL
+    per_year = STEPS_PER_YEAR.get(step, 1)
+    n_steps = years * per_year
+    rng = np.random.default_rng(MC_SEED if seed is None else seed)
+
+    if model == "bootstrap" and daily_returns is not None and len(daily_returns) > 1:
+        growth = _bootstrap_growth(rng, daily_returns, cagr, vol, paths, n_steps, per_year)
+    else:
+        growth = _normal_growth(rng, cagr, vol, paths, n_steps, per_year)
+    return current_assets * np.cumprod(growth, axis=1)
+
+
+def yearly_percentiles(history_totals, percentiles=(10, 50, 90), **kwargs):
+    """
+    預測指令用：回傳 (cagr, {百分位: 每年年底數值 list})
+    月模擬時只取每 12 期 (年底) 的欄位，讓圖表維持年為單位
+    """
+    daily_returns, cagr, vol = estimate_params(history_totals)
+    current_assets = float(history_totals[-1]) or 1.0
+    if kwargs.get("seed") is None and MC_SEED is None:
+        # 未指定種子時以歷史資料推導，同一份快照產生相同結果 (圖表網址才能被快取)
+        digest = hashlib.sha256(repr([float(x) for x in history_totals]).encode()).hexdigest()
+        kwargs["seed"] = int(digest[:16], 16)
+    res = simulate_paths(current_assets, cagr, vol, daily_returns=daily_returns, **kwargs)
+    per_year = res.shape[1] // (kwargs.get("years") or MC_YEARS)
+    year_end = res[:, per_year - 1::per_year]
+    values = np.percentile(year_end, percentiles, axis=0)
+    return cagr, {p: values[i] for i, p in enumerate(percentiles)}
+
+
+# ==========================================
+# Benchmark：python forecast_helper_v1_0.py
+# ==========================================
+def _legacy_loop(current_assets, cagr, vol, sims, years):
+    """舊版 app.gen_monte_carlo 的巢狀迴圈，作為基準比較"""
+    results = []
+    for _ in range(sims):
+        p = [current_assets]
+        for _ in range(years): p.append(p[-1] * (1 + np.random.normal(cagr, vol)))
+        results.append(p[1:])
+    return np.array(results)
+
+
+def run_benchmark():
+    rng = np.random.default_rng(0)
+    history = list(10_000_000 * np.cumprod(1 + rng.normal(0.0004, 0.01, size=120)))
+    daily_returns, cagr, vol = estimate_params(history)
+    current = history[-1]
+
+    def bench(name, fn, paths):
+        started = time.perf_counter()
+        fn()
+        elapsed = time.perf_counter() - started
+        print(f"{name:<32} {paths:>8,} paths  {elapsed * 1000:>9.1f} ms  {paths / elapsed:>14,.0f} paths/s")
+
+    print(f"CAGR={cagr:.2%}  VOL={vol:.2%}  YEARS={MC_YEARS}")
+    bench("legacy loop (yearly)", lambda: _legacy_loop(current, cagr, vol, 500, MC_YEARS), 500)
+    for paths in (10_000, 50_000, 100_000):
+        for step in ("yearly", "monthly"):
+            bench(f"normal ({step})", lambda: simulate_paths(current, cagr, vol, paths=paths, step=step, model="normal", seed=1), paths)
+    for paths in (10_000, 50_000):
+        for step in ("yearly", "monthly"):
+            bench(f"bootstrap ({step})", lambda: simulate_paths(current, cagr, vol, paths=paths, step=step, model="bootstrap", daily_returns=daily_returns, seed=1), paths)
+
+
+if __name__ == "__main__":
+    run_benchmark()
@@ -0,0 +1,135 @@
+import os
+import json
+from http_helper_v1_0 import http_post
+from cache_helper_v1_0 import SingleFlight, flight_key
+
+# --- Gemini API 設定 ---
+GOOGLE_API_KEY = os.getenv("GOOGLE_API_KEY")
+# 可改指向本地 stub (測試串流 / 壓測用)
+GEMINI_API_BASE = os.getenv("GEMINI_API_BASE", "https://generativelanguage.googleapis.com/v1beta")
+
+SAFETY_SETTINGS = [
+    {"category": "HARM_CATEGORY_HARASSMENT", "threshold": "BLOCK_NONE"},
+    {"category": "HARM_CATEGORY_HATE_SPEECH", "threshold": "BLOCK_NONE"},
+    {"category": "HARM_CATEGORY_SEXUALLY_EXPLICIT", "threshold": "BLOCK_NONE"},
+    {"category": "HARM_CATEGORY_DANGEROUS_CONTENT", "threshold": "BLOCK_NONE"}
+]
+
+
+def gemini_url(model, method="generateContent"):
+    url = f"{GEMINI_API_BASE}/models/{model}:{method}?key={GOOGLE_API_KEY}"
+    return url + "&alt=sse" if method == "streamGenerateContent" else url
+
+
+def _chunk_text(chunk):
+    try:
+        parts = chunk["candidates"][0]["content"]["parts"]
+    except (KeyError, IndexError, TypeError):
+        return ""
+    return "".join(p.get("text", "") for p in parts)
+
+
+# 相同模型 + prompt 同時只呼叫一次 Gemini，其餘呼叫端共用 (串流則同步收到相同片段)
+GEMINI_FLIGHT = SingleFlight("gemini")
+
+
+def stream_generate(model, prompt, timeout=80):
+    """
+    呼叫 streamGenerateContent (SSE)，逐段 yield 模型輸出的文字
+    非 200 時拋出 RuntimeError (尚未輸出任何內容，呼叫端可改用一般呼叫)
+    """
+    return GEMINI_FLIGHT.stream(flight_key("stream", model, prompt), _stream_generate, model, prompt, timeout)
+
+
+def _stream_generate(model, prompt, timeout):
+    data = {
+        "contents": [{"parts": [{"text": prompt}]}],
+        "safetySettings": SAFETY_SETTINGS
+    }
+    # 串流中途斷線無法接續，只在建立連線時重試
+    r = http_post(gemini_url(model, "streamGenerateContent"), headers={"Content-Type": "application/json"},
+                  json=data, timeout=timeout, retries=1, stream=True, idempotent=True)
+    try:
+        if r.status_code != 200:
+            raise RuntimeError(f"Gemini Stream Error ({r.status_code}): {r.text[:200]}")
+        r.encoding = "utf-8"   # SSE 未帶 charset 時 requests 不會自動解碼
+        for line in r.iter_lines(decode_unicode=True):
+            if not line or not line.startswith("data:"): continue
+            payload = line[5:].strip()
+            if payload == "[DONE]": break
+            try:
+                text = _chunk_text(json.loads(payload))
+            except ValueError:
+                continue
+            if text: yield text
+    finally:
+        r.close()
+
+
+class JSONFieldStream:
+    """
+    增量解析最外層 JSON 物件：每當一個最上層欄位的值完整出現，就可以先取出使用
+    feed(text) 回傳這次新完成的 [(key, value)]；允許前面有 ```json 等雜訊
+    """
+
+    def __init__(self):
+        self.buf = ""
+        self.pos = 0            # 下一個要掃描的字元
+        self.depth = 0
+        self.in_string = False
+        self.escape = False
+        self.started = False
+        self.key = None         # 目前欄位名稱
+        self.key_start = None
+        self.value_start = None
+        self.done = False
+        self.fields = {}
+
+    def feed(self, text):
+        self.buf += text
+        completed = []
+        while self.pos < len(self.buf) and not self.done:
+            ch = self.buf[self.pos]
+            if not self.started:
+                if ch == "{":
+                    self.started = True; self.depth = 1
+                self.pos += 1
+                continue
+
+            if self.in_string:
+                if self.escape: self.escape = False
+                elif ch == "\\": self.escape = True
+                elif ch == '"':
+                    self.in_string = False
+                    if self.depth == 1 and self.value_start is None and self.key_start is not None:
+                        self.key = json.loads(self.buf[self.key_start:self.pos + 1])
+                        self.key_start = None
+                self.pos += 1
+                continue
+
+            if ch == '"':
+                self.in_string = True
+                if self.depth == 1 and self.value_start is None and self.key is None: self.key_start = self.pos
+            elif ch == ":" and self.depth == 1 and self.key is not None and self.value_start is None:
+                self.value_start = self.pos + 1
+            elif ch in "{[":
+                self.depth += 1
+            elif ch in "}]":
+                self.depth -= 1
+                if self.depth == 0:
+                    self._finish(self.pos, completed)
+                    self.done = True
+            elif ch == "," and self.depth == 1:
+                self._finish(self.pos, completed)
+            self.pos += 1
+        return completed
+
+    def _finish(self, end, completed):
+        if self.key is not None and self.value_start is not None:
+            try:
+                value = json.loads(self.buf[self.value_start:end])
+                self.fields[self.key] = value
+                completed.append((self.key, value))
+            except ValueError:
+                pass
+        self.key = None; self.key_start = None; self.value_start = None
@@ -0,0 +1,148 @@
+import os
+import time
+import random
+import threading
+from urllib.parse import urlparse
+import requests
+import urllib3
+from requests.adapters import HTTPAdapter
+from linebot.http_client import RequestsHttpClient, RequestsHttpResponse
+from metrics_helper_v1_0 import record_http
+
+# --- 關閉 SSL 警告 ---
+urllib3.disable_warnings(urllib3.exceptions.InsecureRequestWarning)
+
+# --- 連線池設定 ---
+# 所有對外呼叫 (Notion / Gemini / LINE / QuickChart) 共用同一個 Session，
+# 每個 host 各自維持 keep-alive 連線池，避免每次請求都重新做 TCP + TLS 握手
+HTTP_POOL_CONNECTIONS = int(os.getenv("HTTP_POOL_CONNECTIONS", "10"))  # 保留幾個 host 的連線池
+HTTP_POOL_MAXSIZE = int(os.getenv("HTTP_POOL_MAXSIZE", "20"))          # 每個 host 最多幾條連線
+HTTP_MAX_RETRIES = int(os.getenv("HTTP_MAX_RETRIES", "3"))
+HTTP_BACKOFF_BASE = float(os.getenv("HTTP_BACKOFF_BASE", "0.5"))       # 秒
+HTTP_BACKOFF_MAX = float(os.getenv("HTTP_BACKOFF_MAX", "8"))           # 秒
+
+# 遇到這些狀態碼才重試 (429 依 Retry-After，其餘為暫時性錯誤)
+RETRY_STATUS = {429, 500, 502, 503, 504}
+# 非冪等的請求 (例如 LINE push、Notion 建立頁面) 5xx / 連線中斷時伺服器可能已經處理過，重試會重複發送；
+# 預設只有這些 method 或帶 X-Line-Retry-Key (LINE 會以此去重) 的請求才完整重試，其餘只重試 429 與連線建立逾時
+IDEMPOTENT_METHODS = {"GET", "HEAD", "OPTIONS", "PUT", "DELETE"}
+RETRY_KEY_HEADER = "X-Line-Retry-Key"
+
+# (connect, read) 秒數；沒列到的 host 用 DEFAULT_TIMEOUT
+DEFAULT_TIMEOUT = (5, 30)
+HOST_TIMEOUTS = {
+    "api.notion.com": (5, 30),
+    "generativelanguage.googleapis.com": (5, 80),
+    "api.line.me": (5, 10),
+    "api-data.line.me": (5, 30),
+    "quickchart.io": (5, 15),
+}
+
+_session = None
+_session_lock = threading.Lock()
+
+
+def get_session():
+    """取得共用 Session (第一次呼叫時建立，requests 的連線池本身是 thread-safe)"""
+    global _session
+    if _session is None:
+        with _session_lock:
+            if _session is None:
+                s = requests.Session()
+                adapter = HTTPAdapter(pool_connections=HTTP_POOL_CONNECTIONS, pool_maxsize=HTTP_POOL_MAXSIZE, pool_block=False)
+                s.mount("https://", adapter)
+                s.mount("http://", adapter)
+                # 比照各模組原本的 verify=False，繞過 Render 環境的 SSL 憑證問題
+                s.verify = False
+                _session = s
+    return _session
+
+
+def _backoff_delay(attempt, response=None):
+    """指數退避 + full jitter；429 若有 Retry-After 則優先採用"""
+    if response is not None:
+        retry_after = response.headers.get("Retry-After")
+        if retry_after and retry_after.isdigit():
+            return min(float(retry_after), HTTP_BACKOFF_MAX)
+    return random.uniform(0, min(HTTP_BACKOFF_MAX, HTTP_BACKOFF_BASE * (2 ** attempt)))
+
+
+def _body_size(body):
+    if body is None: return 0
+    return len(body.encode("utf-8")) if isinstance(body, str) else len(body) if isinstance(body, bytes) else 0
+
+
+def _response_size(response, stream):
+    # 串流回應不能先讀 content，改用 Content-Length (沒有時記 0)
+    if not stream: return len(response.content)
+    length = response.headers.get("Content-Length")
+    return int(length) if length and length.isdigit() else 0
+
+
+def http_request(method, url, retries=None, timeout=None, idempotent=None, **kwargs):
+    """
+    共用的 HTTP 呼叫入口
+    - timeout 未指定時依 host 套用 HOST_TIMEOUTS
+    - 5xx / 429 / 連線失敗 會以 jitter 指數退避重試 retries 次
+    - idempotent: 未指定時依 method 與 X-Line-Retry-Key 判斷；唯讀的 POST (Notion query、Gemini) 由呼叫端傳 True。
+      非冪等請求只重試 429 與連線建立逾時 (伺服器尚未收到請求)
+    - 最後一次仍失敗時回傳該 response (或拋出連線例外)，交由呼叫端判斷 status_code
+    """
+    retries = HTTP_MAX_RETRIES if retries is None else retries
+    if idempotent is None:
+        idempotent = method.upper() in IDEMPOTENT_METHODS or RETRY_KEY_HEADER in (kwargs.get("headers") or {})
+    retry_status = RETRY_STATUS if idempotent else {429}
+    retry_errors = requests.exceptions.ConnectionError if idempotent else requests.exceptions.ConnectTimeout
+    host = urlparse(url).hostname
+    if timeout is None:
+        timeout = HOST_TIMEOUTS.get(host, DEFAULT_TIMEOUT)
+    session = get_session()
+
+    for attempt in range(retries + 1):
+        started = time.perf_counter()
+        try:
+            response = session.request(method, url, timeout=timeout, **kwargs)
+        except requests.exceptions.RequestException as e:
+            record_http(method, host, None, time.perf_counter() - started, error=type(e).__name__)
+            if not isinstance(e, retry_errors) or attempt >= retries: raise
+            delay = _backoff_delay(attempt)
+            print(f"⚠️ HTTP 連線失敗，{delay:.1f}s 後重試 ({attempt + 1}/{retries}): {e}")
+            time.sleep(delay)
+            continue
+        record_http(method, host, response.status_code, time.perf_counter() - started,
+                    _body_size(response.request.body), _response_size(response, kwargs.get("stream")))
+
+        if response.status_code not in retry_status or attempt >= retries:
+            return response
+        delay = _backoff_delay(attempt, response)
+        print(f"⚠️ HTTP {response.status_code} ({host})，{delay:.1f}s 後重試 ({attempt + 1}/{retries})")
+        response.close()
+        time.sleep(delay)
+
+
+def http_get(url, **kwargs):
+    return http_request("GET", url, **kwargs)
+
+
+def http_post(url, **kwargs):
+    return http_request("POST", url, **kwargs)
+
+
+class PooledLineHttpClient(RequestsHttpClient):
+    """
+    讓 LINE SDK (LineBotApi) 也走共用連線池與重試
+    timeout 原樣傳入 (未指定時套用 HOST_TIMEOUTS，而不是 SDK 的預設值)；
+    push_message 需帶 retry_key 才會在 5xx 時重試
+    """
+
+    def get(self, url, headers=None, params=None, stream=False, timeout=None):
+        return RequestsHttpResponse(http_get(url, headers=headers, params=params, stream=stream, timeout=timeout))
+
+    def post(self, url, headers=None, data=None, timeout=None):
+        return RequestsHttpResponse(http_post(url, headers=headers, data=data, timeout=timeout))
+
+    def delete(self, url, headers=None, data=None, timeout=None):
+        return RequestsHttpResponse(http_request("DELETE", url, headers=headers, data=data, timeout=timeout))
+
+    def put(self, url, headers=None, data=None, timeout=None):
+        return RequestsHttpResponse(http_request("PUT", url, headers=headers, data=data, timeout=timeout))
@@ -0,0 +1,63 @@
+import os
+import io
+import time
+import threading
+
+# Pillow 為選用套件：未安裝時 prepare_image 直接回傳原圖
+try:
+    from PIL import Image, ImageOps
+    HAS_PIL = True
+except ImportError:
+    HAS_PIL = False
+
+# --- 餐點照片前處理 ---
+# LINE 原圖常有數 MB，縮圖 + 重新壓縮後再送 Gemini，可大幅縮短上傳時間並降低記憶體用量
+IMAGE_PREPROCESS_ENABLED = os.getenv("IMAGE_PREPROCESS_ENABLED", "1") == "1"
+IMAGE_MAX_EDGE = int(os.getenv("IMAGE_MAX_EDGE", "1024"))        # 長邊上限 (px)
+IMAGE_JPEG_QUALITY = int(os.getenv("IMAGE_JPEG_QUALITY", "80"))
+
+_stats_lock = threading.Lock()
+IMAGE_STATS = {"images": 0, "bytes_before": 0, "bytes_after": 0, "ms": 0, "errors": 0}
+
+
+def prepare_image(image_bytes):
+    """
+    縮到長邊 IMAGE_MAX_EDGE 並以 JPEG 重新壓縮 (依 EXIF 轉正後移除 EXIF)
+    回傳 (bytes, info)；info = {before, after, size, ms}
+    Pillow 未安裝、停用或圖片無法解析時回傳原圖
+    """
+    info = {"before": len(image_bytes), "after": len(image_bytes), "size": None, "ms": 0}
+    if not IMAGE_PREPROCESS_ENABLED or not HAS_PIL: return image_bytes, info
+
+    started = time.time()
+    try:
+        with Image.open(io.BytesIO(image_bytes)) as img:
+            img = ImageOps.exif_transpose(img)   # 手機直拍照片的方向寫在 EXIF，移除前先轉正
+            if img.mode != "RGB": img = img.convert("RGB")
+            img.thumbnail((IMAGE_MAX_EDGE, IMAGE_MAX_EDGE), Image.LANCZOS)
+            out = io.BytesIO()
+            img.save(out, format="JPEG", quality=IMAGE_JPEG_QUALITY, optimize=True)
+            info["size"] = f"{img.width}x{img.height}"
+    except Exception as e:
+        print(f"⚠️ 圖片前處理失敗，改用原圖: {e}")
+        with _stats_lock: IMAGE_STATS["errors"] += 1
+        return image_bytes, info
+
+    result = out.getvalue()
+    info["after"] = len(result)
+    info["ms"] = int((time.time() - started) * 1000)
+    with _stats_lock:
+        IMAGE_STATS["images"] += 1
+        IMAGE_STATS["bytes_before"] += info["before"]
+        IMAGE_STATS["bytes_after"] += info["after"]
+        IMAGE_STATS["ms"] += info["ms"]
+    print(f"🖼️ Image: {info['before'] / 1024:,.0f} KB → {info['after'] / 1024:,.0f} KB ({info['size']}, {info['ms']} ms)")
+    return result, info
+
+
+def image_stats():
+    with _stats_lock:
+        stats = dict(IMAGE_STATS)
+    stats["saved_ratio"] = round(1 - stats["bytes_after"] / stats["bytes_before"], 3) if stats["bytes_before"] else 0.0
+    stats["enabled"] = IMAGE_PREPROCESS_ENABLED and HAS_PIL
+    return stats
@@ -0,0 +1,173 @@
+import os
+import json
+import math
+import threading
+import unicodedata
+from collections import defaultdict
+
+# --- 本地領域分類器 ---
+# 信心夠高時直接決定 domain，省下一次 Gemini 意圖分析；信心不足才交給 Gemini
+DOMAINS = ["INVESTMENT", "FINANCE", "HEALTH", "KNOWLEDGE", "OTHER"]
+INTENT_LOCAL_THRESHOLD = float(os.getenv("INTENT_LOCAL_THRESHOLD", "0.8"))
+INTENT_LABEL_LOG_PATH = os.getenv("INTENT_LABEL_LOG_PATH", "intent_labels.jsonl")
+# 信心足夠的問題仍抽樣一部分送 Gemini 比對，高門檻下的準確率才有樣本
+INTENT_AUDIT_RATE = float(os.getenv("INTENT_AUDIT_RATE", "0.1"))
+MIN_TRAIN_SAMPLES = 30     # 累積多少筆 Gemini 標記後才啟用 Naive Bayes
+KEYWORD_PRIOR = 0.5        # 關鍵字分數的平滑項，單一強關鍵字 (權重 3) 信心約 0.89
+
+# 與 analyze_query_intent prompt 中的關鍵字一致 (權重 3 = 幾乎只屬於該領域)
+DOMAIN_KEYWORDS = {
+    "INVESTMENT": {
+        "台股": 3, "美股": 3, "股票": 3, "持股": 3, "庫存": 3, "btc": 3, "eth": 3, "比特幣": 3, "以太": 3,
+        "加密貨幣": 3, "crypto": 3, "黃金": 3, "gold": 3, "損益": 3, "已實現": 3, "未實現": 3, "etf": 3,
+        "淨值": 2, "資產": 2, "投資": 2, "報酬": 2, "股息": 2, "配息": 2, "持有": 1, "市值": 2, "複委託": 3,
+    },
+    "FINANCE": {
+        "花費": 3, "消費": 3, "支出": 3, "花多少": 3, "花了": 3, "預算": 3, "流水帳": 3, "記帳": 3, "收入": 3,
+        "薪水": 3, "房貸": 3, "帳單": 3, "帳戶": 2, "存款": 2, "開銷": 3, "餐費": 2, "交通費": 3, "繳費": 3,
+        "spending": 3, "budget": 3, "income": 3, "mortgage": 3, "花": 1,
+    },
+    "HEALTH": {
+        "熱量": 3, "卡路里": 3, "大卡": 3, "蛋白質": 3, "碳水": 3, "脂肪": 3, "飲食": 3, "營養": 3, "吃太": 3,
+        "吃了": 2, "早餐": 2, "午餐": 2, "晚餐": 2, "點心": 2, "體重": 2, "減肥": 3, "calorie": 3, "protein": 3,
+        "diet": 3, "吃": 1,
+    },
+    "KNOWLEDGE": {
+        "筆記": 3, "閃電筆記": 3, "文獻": 3, "永久筆記": 3, "讀書": 3, "書": 2, "文章": 2, "學到": 3, "卡片": 2,
+        "概念": 2, "心得": 3, "notes": 3, "note": 3, "zettelkasten": 3, "摘要": 1,
+    },
+}
+
+_lock = threading.Lock()
+# Naive Bayes 統計 (由標記紀錄累加，可隨時增量更新)
+_nb_doc_counts = defaultdict(int)
+_nb_token_counts = defaultdict(lambda: defaultdict(int))
+_nb_token_totals = defaultdict(int)
+_nb_vocab = set()
+_nb_samples = 0
+# 與 Gemini 標記比對的紀錄 [(local_domain, confidence, gemini_domain)]
+_evaluations = []
+
+
+def normalize(text):
+    text = unicodedata.normalize("NFKC", text or "").lower()
+    return "".join(ch for ch in text if not (ch.isspace() or unicodedata.category(ch).startswith("P")))
+
+
+def _tokens(text):
+    """字元 unigram + bigram (中文不需斷詞)"""
+    return list(text) + [text[i:i + 2] for i in range(len(text) - 1)]
+
+
+def _keyword_distribution(text):
+    scores = {d: 0.0 for d in DOMAINS}
+    for domain, keywords in DOMAIN_KEYWORDS.items():
+        for kw, weight in keywords.items():
+            if kw in text: scores[domain] += weight
+    total = sum(scores.values()) + KEYWORD_PRIOR
+    return {d: (scores[d] + KEYWORD_PRIOR / len(DOMAINS)) / total for d in DOMAINS}, sum(scores.values())
+
+
+def _nb_distribution(text):
+    tokens = _tokens(text)
+    vocab_size = len(_nb_vocab) + 1
+    log_probs = {}
+    for d in DOMAINS:
+        lp = math.log((_nb_doc_counts[d] + 1) / (_nb_samples + len(DOMAINS)))
+        counts = _nb_token_counts[d]; total = _nb_token_totals[d]
+        for t in tokens:
+            lp += math.log((counts.get(t, 0) + 1) / (total + vocab_size))
+        log_probs[d] = lp
+    top = max(log_probs.values())
+    exp = {d: math.exp(v - top) for d, v in log_probs.items()}
+    z = sum(exp.values())
+    return {d: v / z for d, v in exp.items()}
+
+
+def classify_domain(user_query):
+    """
+    回傳 (domain, confidence)
+    - 沒有任何關鍵字且尚未訓練時，信心為 0 (一律交給 Gemini)
+    - 累積足夠 Gemini 標記後，與 Naive Bayes 的機率各半混合
+    """
+    text = normalize(user_query)
+    kw_dist, kw_hits = _keyword_distribution(text)
+    with _lock:
+        use_nb = _nb_samples >= MIN_TRAIN_SAMPLES
+        nb_dist = _nb_distribution(text) if use_nb else None
+    if nb_dist:
+        dist = {d: 0.5 * kw_dist[d] + 0.5 * nb_dist[d] for d in DOMAINS}
+    elif kw_hits:
+        dist = kw_dist
+    else:
+        return "OTHER", 0.0
+    domain = max(dist, key=dist.get)
+    return domain, round(dist[domain], 3)
+
+
+def _learn(text, domain):
+    global _nb_samples
+    if domain not in DOMAINS: return
+    _nb_samples += 1
+    _nb_doc_counts[domain] += 1
+    for t in _tokens(text):
+        _nb_token_counts[domain][t] += 1
+        _nb_token_totals[domain] += 1
+        _nb_vocab.add(t)
+
+
+def record_label(user_query, local_domain, confidence, gemini_domain):
+    """Gemini 回傳 domain 後呼叫：記錄 (query, domain) 供訓練，並累計本地分類的準確率"""
+    text = normalize(user_query)
+    with _lock:
+        _learn(text, gemini_domain)
+        _evaluations.append((local_domain, confidence, gemini_domain))
+        try:
+            with open(INTENT_LABEL_LOG_PATH, "a", encoding="utf-8") as f:
+                f.write(json.dumps({"query": user_query, "domain": gemini_domain, "local_domain": local_domain, "confidence": confidence}, ensure_ascii=False) + "\n")
+        except OSError as e:
+            print(f"❌ Intent Label Log 寫入失敗: {e}")
+
+
+def load_labels(path=None):
+    """啟動時由標記紀錄重建模型與準確率統計"""
+    path = path or INTENT_LABEL_LOG_PATH
+    loaded = 0
+    try:
+        with open(path, encoding="utf-8") as f:
+            lines = f.readlines()
+    except OSError:
+        return 0
+    with _lock:
+        for line in lines:
+            try:
+                row = json.loads(line)
+            except ValueError:
+                continue
+            _learn(normalize(row.get("query")), row.get("domain"))
+            if row.get("local_domain") is not None:
+                _evaluations.append((row["local_domain"], row.get("confidence", 0.0), row.get("domain")))
+            loaded += 1
+    return loaded
+
+
+def accuracy_report(thresholds=(0.5, 0.6, 0.7, 0.8, 0.9, 0.95)):
+    """
+    以 Gemini 標記為準，列出各門檻下的覆蓋率 (本地可直接決定的比例) 與準確率
+    用來調整 INTENT_LOCAL_THRESHOLD
+    """
+    with _lock:
+        evals = list(_evaluations)
+    report = {"samples": len(evals), "threshold": INTENT_LOCAL_THRESHOLD, "trained": _nb_samples >= MIN_TRAIN_SAMPLES, "by_threshold": []}
+    for th in thresholds:
+        covered = [e for e in evals if e[1] >= th]
+        correct = sum(1 for e in covered if e[0] == e[2])
+        report["by_threshold"].append({
+            "threshold": th,
+            "coverage": round(len(covered) / len(evals), 3) if evals else 0.0,
+            "accuracy": round(correct / len(covered), 3) if covered else None
+        })
+    return report
+
+
+load_labels()
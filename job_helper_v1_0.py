@@ -0,0 +1,133 @@
+import time
+import uuid
+import queue
+import threading
+import traceback
+from collections import deque, OrderedDict
+
+# 計算 p50 / p95 時保留最近幾筆樣本
+STATS_WINDOW = 500
+# 保留最近幾筆工作的狀態 (queued / running / done / failed)
+JOB_HISTORY = 200
+
+
+def _percentile(values, pct):
+    if not values: return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))]
+
+
+class JobQueue:
+    """
+    行程內的背景工作佇列 (固定數量 worker thread + 有上限的佇列)
+    - submit() 佇列已滿時回傳 False，由呼叫端決定降級方式
+    - worker 於第一次 submit 時才啟動 (避免 gunicorn fork 前就建立 thread)
+    - stats() 提供佇列深度、等待時間、執行時間與最近一分鐘完成的工作數
+    - submit() 成功時回傳 job id，可用 job() 查詢該筆工作的狀態
+    """
+
+    def __init__(self, name, workers, max_depth):
+        self.name = name
+        self.workers = workers
+        self.max_depth = max_depth
+        self._queue = queue.Queue(maxsize=max_depth)
+        self._threads = []
+        self._start_lock = threading.Lock()
+        self._stats_lock = threading.Lock()
+        self.submitted = 0
+        self.rejected = 0
+        self.completed = 0
+        self.failed = 0
+        self.running = 0
+        self._wait_ms = deque(maxlen=STATS_WINDOW)
+        self._run_ms = deque(maxlen=STATS_WINDOW)
+        self._finished_at = deque(maxlen=STATS_WINDOW)
+        self._jobs = OrderedDict()   # job_id -> 狀態紀錄
+
+    def _ensure_started(self):
+        if self._threads: return
+        with self._start_lock:
+            if self._threads: return
+            for i in range(self.workers):
+                t = threading.Thread(target=self._worker, name=f"{self.name}-{i}", daemon=True)
+                t.start()
+                self._threads.append(t)
+
+    def submit(self, fn, *args, **kwargs):
+        """佇列已滿回傳 False，否則回傳 job id"""
+        self._ensure_started()
+        job_id = uuid.uuid4().hex[:12]
+        job = {"id": job_id, "name": getattr(fn, "__name__", "job"), "state": "queued",
+               "submitted_at": time.time(), "wait_ms": None, "run_ms": None, "error": None}
+        with self._stats_lock:
+            self._jobs[job_id] = job
+            while len(self._jobs) > JOB_HISTORY: self._jobs.popitem(last=False)
+        try:
+            self._queue.put_nowait((job, fn, args, kwargs))
+        except queue.Full:
+            with self._stats_lock:
+                self.rejected += 1
+                self._jobs.pop(job_id, None)
+            print(f"⚠️ JobQueue [{self.name}] 已滿 ({self.max_depth})，拒絕新工作")
+            return False
+        with self._stats_lock: self.submitted += 1
+        return job_id
+
+    def _worker(self):
+        while True:
+            job, fn, args, kwargs = self._queue.get()
+            started = time.time()
+            wait_ms = (started - job["submitted_at"]) * 1000
+            with self._stats_lock:
+                self.running += 1
+                self._wait_ms.append(wait_ms)
+                job.update(state="running", wait_ms=round(wait_ms, 1))
+            ok = True
+            try:
+                fn(*args, **kwargs)
+            except Exception as e:
+                ok = False
+                job["error"] = str(e)[:200]
+                print(f"❌ JobQueue [{self.name}] 工作失敗: {e}")
+                traceback.print_exc()
+            finally:
+                finished = time.time()
+                run_ms = (finished - started) * 1000
+                with self._stats_lock:
+                    self.running -= 1
+                    self._run_ms.append(run_ms)
+                    self._finished_at.append(finished)
+                    job.update(state="done" if ok else "failed", run_ms=round(run_ms, 1))
+                    if ok: self.completed += 1
+                    else: self.failed += 1
+                self._queue.task_done()
+            if wait_ms > 5000:
+                print(f"🐢 JobQueue [{self.name}] 排隊 {wait_ms:.0f} ms / 執行 {run_ms:.0f} ms")
+
+    def job(self, job_id):
+        with self._stats_lock:
+            job = self._jobs.get(job_id)
+            return dict(job) if job else None
+
+    def recent_jobs(self, limit=20):
+        with self._stats_lock:
+            return [dict(j) for j in list(self._jobs.values())[-limit:]]
+
+    def depth(self):
+        return self._queue.qsize()
+
+    def stats(self):
+        with self._stats_lock:
+            wait = list(self._wait_ms); run = list(self._run_ms)
+            now = time.time()
+            per_min = sum(1 for t in self._finished_at if now - t <= 60)
+            return {
+                "name": self.name, "workers": self.workers, "max_depth": self.max_depth,
+                "depth": self._queue.qsize(), "running": self.running,
+                "submitted": self.submitted, "rejected": self.rejected,
+                "completed": self.completed, "failed": self.failed,
+                "wait_ms_p50": round(_percentile(wait, 50), 1), "wait_ms_p95": round(_percentile(wait, 95), 1),
+                "wait_ms_max": round(max(wait), 1) if wait else 0.0,
+                "run_ms_p50": round(_percentile(run, 50), 1), "run_ms_p95": round(_percentile(run, 95), 1),
+                "finished_last_min": per_min,
+            }
@@ -0,0 +1,250 @@
+import os
+import re
+import math
+import time
+import sqlite3
+import threading
+import unicodedata
+from collections import defaultdict
+from notion_mirror_v1_0 import mirror_query, get_page_bodies
+
+# --- 筆記全文索引 (BM25) ---
+# 所有筆記標題 + 內文切成段落建立倒排索引，RAG 依問題取最相關的 top-k 段落，而不是最新 N 篇
+INDEX_DB_PATH = os.getenv("KNOWLEDGE_INDEX_PATH", "knowledge_index.sqlite3")
+INDEX_ENABLED = os.getenv("KNOWLEDGE_INDEX_ENABLED", "1") == "1"
+INDEX_TTL = int(os.getenv("KNOWLEDGE_INDEX_TTL", "600"))       # 秒，超過才比對鏡像做增量更新
+TOP_K = int(os.getenv("KNOWLEDGE_TOP_K", "12"))
+PASSAGE_CHARS = int(os.getenv("KNOWLEDGE_PASSAGE_CHARS", "400"))
+MAX_PASSAGES_PER_PAGE = 2       # 同一篇筆記最多取幾段，避免單篇長文佔滿結果
+BM25_K1 = 1.2
+BM25_B = 0.75
+
+CJK_RE = re.compile(r"[㐀-鿿豈-﫿]+")
+WORD_RE = re.compile(r"[a-z0-9]+")
+
+_refresh_lock = threading.Lock()
+_build_thread = None
+
+
+def _connect():
+    conn = sqlite3.connect(INDEX_DB_PATH, timeout=30)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("""CREATE TABLE IF NOT EXISTS indexed_pages (
+        page_id TEXT PRIMARY KEY,
+        db_key TEXT NOT NULL,
+        last_edited_time TEXT)""")
+    conn.execute("""CREATE TABLE IF NOT EXISTS passages (
+        doc_id INTEGER PRIMARY KEY AUTOINCREMENT,
+        page_id TEXT NOT NULL,
+        db_key TEXT NOT NULL,
+        title TEXT,
+        created_time TEXT,
+        text TEXT NOT NULL,
+        length INTEGER NOT NULL)""")
+    conn.execute("""CREATE TABLE IF NOT EXISTS postings (
+        term TEXT NOT NULL,
+        doc_id INTEGER NOT NULL,
+        tf INTEGER NOT NULL)""")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_postings_term ON postings (term)")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_postings_doc ON postings (doc_id)")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_passages_page ON passages (page_id)")
+    conn.execute("""CREATE TABLE IF NOT EXISTS index_state (
+        db_key TEXT PRIMARY KEY,
+        refreshed_at REAL)""")
+    return conn
+
+
+# ==========================================
+# 1. 斷詞與切段
+# ==========================================
+def tokenize(text):
+    """中日韓文字取相鄰兩字 (bigram，單字詞保留 unigram)，英數取整個單字"""
+    text = unicodedata.normalize("NFKC", text or "").lower()
+    tokens = []
+    for run in CJK_RE.findall(text):
+        if len(run) == 1: tokens.append(run)
+        else: tokens.extend(run[i:i + 2] for i in range(len(run) - 1))
+    tokens.extend(WORD_RE.findall(CJK_RE.sub(" ", text)))
+    return tokens
+
+
+def split_passages(body):
+    """依行切段，每段約 PASSAGE_CHARS 字 (單行過長時硬切)"""
+    passages, current = [], ""
+    for line in (body or "").splitlines():
+        line = line.strip()
+        while len(line) > PASSAGE_CHARS:
+            if current: passages.append(current); current = ""
+            passages.append(line[:PASSAGE_CHARS]); line = line[PASSAGE_CHARS:]
+        if not line: continue
+        if current and len(current) + len(line) + 1 > PASSAGE_CHARS:
+            passages.append(current); current = ""
+        current = f"{current}\n{line}" if current else line
+    if current: passages.append(current)
+    return passages
+
+
+def page_title(page):
+    for prop in page.get("properties", {}).values():
+        if prop.get("type") == "title":
+            return "".join(t.get("plain_text", "") for t in prop.get("title") or [])
+    return ""
+
+
+# ==========================================
+# 2. 增量更新
+# ==========================================
+def _remove_pages(conn, page_ids):
+    for pid in page_ids:
+        conn.execute("DELETE FROM postings WHERE doc_id IN (SELECT doc_id FROM passages WHERE page_id = ?)", (pid,))
+        conn.execute("DELETE FROM passages WHERE page_id = ?", (pid,))
+        conn.execute("DELETE FROM indexed_pages WHERE page_id = ?", (pid,))
+
+
+def _index_page(conn, db_key, page, body):
+    title = page_title(page)
+    # 標題併入每一段，讓只在標題出現的關鍵字也找得到內文
+    for passage in split_passages(body) or [""]:
+        text = f"{title}\n{passage}".strip()
+        terms = tokenize(text)
+        if not terms: continue
+        cur = conn.execute(
+            "INSERT INTO passages (page_id, db_key, title, created_time, text, length) VALUES (?, ?, ?, ?, ?, ?)",
+            (page["id"], db_key, title, page.get("created_time"), passage, len(terms))
+        )
+        tf = defaultdict(int)
+        for t in terms: tf[t] += 1
+        conn.executemany("INSERT INTO postings (term, doc_id, tf) VALUES (?, ?, ?)", [(t, cur.lastrowid, n) for t, n in tf.items()])
+    conn.execute("INSERT OR REPLACE INTO indexed_pages (page_id, db_key, last_edited_time) VALUES (?, ?, ?)",
+                 (page["id"], db_key, page.get("last_edited_time")))
+
+
+def refresh_db(db_key, force=False):
+    """
+    比對鏡像與索引的 last_edited_time，只重建新增/修改的頁面並移除已刪除的頁面
+    內文透過 get_page_bodies 取得 (同樣以 last_edited_time 快取)
+    """
+    db_id = os.getenv(db_key)
+    if not db_id: return False
+    conn = _connect()
+    try:
+        row = conn.execute("SELECT refreshed_at FROM index_state WHERE db_key = ?", (db_key,)).fetchone()
+        if row and not force and time.time() - row[0] <= INDEX_TTL: return True
+
+        started = time.time()
+        pages = mirror_query(db_id, label=f"index:{db_key}")
+        indexed = dict(conn.execute("SELECT page_id, last_edited_time FROM indexed_pages WHERE db_key = ?", (db_key,)).fetchall())
+        current = {p["id"] for p in pages}
+        changed = [p for p in pages if indexed.get(p["id"]) != p.get("last_edited_time")]
+        removed = [pid for pid in indexed if pid not in current]
+
+        bodies = get_page_bodies(changed, label=f"index:{db_key}")
+        with conn:
+            _remove_pages(conn, removed + [p["id"] for p in changed])
+            for page in changed:
+                # 內文讀取失敗的頁面先只索引標題，不寫 last_edited_time，下次更新會再試
+                _index_page(conn, db_key, page, bodies.get(page["id"], ""))
+                if page["id"] not in bodies:
+                    conn.execute("UPDATE indexed_pages SET last_edited_time = NULL WHERE page_id = ?", (page["id"],))
+            conn.execute("INSERT OR REPLACE INTO index_state (db_key, refreshed_at) VALUES (?, ?)", (db_key, time.time()))
+        print(f"🔎 Index Refresh [{db_key}]: {len(pages)} 頁 / 更新 {len(changed)} / 移除 {len(removed)} / {int((time.time() - started) * 1000)} ms")
+        return True
+    except Exception as e:
+        print(f"❌ Index Refresh Error ({db_key}): {e}")
+        return False
+    finally:
+        conn.close()
+
+
+def refresh_index(db_keys, wait=True):
+    """
+    更新多個資料庫的索引 (同一時間只有一個執行緒在更新)
+    wait=False 時若其他執行緒正在更新就直接略過，查詢改用目前的索引
+    """
+    if not INDEX_ENABLED: return
+    if not _refresh_lock.acquire(blocking=wait): return
+    try:
+        for key in db_keys: refresh_db(key)
+    finally:
+        _refresh_lock.release()
+
+
+def _build_in_background(db_keys):
+    """首次建立索引可能要數分鐘，改在背景執行 (同一時間只有一個建立中的 thread)"""
+    global _build_thread
+    if _build_thread and _build_thread.is_alive(): return
+    _build_thread = threading.Thread(target=refresh_index, args=(list(db_keys),), name="knowledge-index", daemon=True)
+    _build_thread.start()
+
+
+# ==========================================
+# 3. BM25 查詢
+# ==========================================
+def search(query, db_keys, top_k=None, date_filter=None):
+    """
+    回傳最相關的段落 [{db_key, page_id, title, created_time, text, score}]
+    索引停用或尚未建立時回傳 None，由呼叫端改用原本的「最新 N 篇」
+    """
+    if not INDEX_ENABLED: return None
+    top_k = top_k or TOP_K
+    conn = _connect()
+    try:
+        built = {r[0] for r in conn.execute("SELECT db_key FROM index_state").fetchall()}
+    finally:
+        conn.close()
+    # 尚未建立的資料庫在背景建立，這次先回傳 None 改用最新 N 篇；已建立的只在沒人更新時順便檢查是否過期
+    if not set(db_keys) <= built:
+        _build_in_background(db_keys)
+        return None
+    refresh_index(db_keys, wait=False)
+
+    started = time.time()
+    terms = sorted(set(tokenize(query)))
+    marks = ",".join("?" * len(db_keys))
+    conn = _connect()
+    try:
+        n_docs, avg_len = conn.execute(f"SELECT COUNT(*), AVG(length) FROM passages WHERE db_key IN ({marks})", db_keys).fetchone()
+        if not n_docs: return None
+        if not terms: return []
+
+        scores = defaultdict(float)
+        for term in terms:
+            rows = conn.execute(
+                f"SELECT p.doc_id, p.tf, s.length FROM postings p JOIN passages s ON s.doc_id = p.doc_id WHERE p.term = ? AND s.db_key IN ({marks})",
+                [term, *db_keys]
+            ).fetchall()
+            if not rows: continue
+            idf = math.log(1 + (n_docs - len(rows) + 0.5) / (len(rows) + 0.5))
+            for doc_id, tf, length in rows:
+                scores[doc_id] += idf * tf * (BM25_K1 + 1) / (tf + BM25_K1 * (1 - BM25_B + BM25_B * length / avg_len))
+
+        start = (date_filter or {}).get("start") or ""
+        end = (date_filter or {}).get("end") or ""
+        hits, per_page = [], defaultdict(int)
+        for doc_id, score in sorted(scores.items(), key=lambda x: -x[1]):
+            page_id, db_key, title, created, text = conn.execute(
+                "SELECT page_id, db_key, title, created_time, text FROM passages WHERE doc_id = ?", (doc_id,)
+            ).fetchone()
+            created_day = (created or "")[:10]
+            if (start and created_day < start) or (end and created_day > end): continue
+            if per_page[page_id] >= MAX_PASSAGES_PER_PAGE: continue
+            per_page[page_id] += 1
+            hits.append({"db_key": db_key, "page_id": page_id, "title": title, "created_time": created,
+                         "text": text, "score": round(score, 3)})
+            if len(hits) >= top_k: break
+    finally:
+        conn.close()
+    print(f"🔎 Index Search: {len(terms)} 詞 / {len(scores)} 段命中 / 取 {len(hits)} 段 / {int((time.time() - started) * 1000)} ms")
+    return hits
+
+
+def index_status():
+    conn = _connect()
+    try:
+        rows = conn.execute(
+            "SELECT s.db_key, s.refreshed_at, (SELECT COUNT(*) FROM indexed_pages i WHERE i.db_key = s.db_key), "
+            "(SELECT COUNT(*) FROM passages p WHERE p.db_key = s.db_key) FROM index_state s"
+        ).fetchall()
+    finally:
+        conn.close()
+    return [{"db_key": r[0], "refreshed_at": r[1], "pages": r[2], "passages": r[3]} for r in rows]
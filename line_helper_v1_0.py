@@ -0,0 +1,111 @@
+import os
+import time
+import uuid
+from linebot.models import TextSendMessage, FlexSendMessage
+from http_helper_v1_0 import http_post
+from metrics_helper_v1_0 import span
+
+# --- 環境變數 ---
+# 🔥 為了繞過 SDK 直接發送請求，需要讀取這個 Token
+LINE_CHANNEL_ACCESS_TOKEN = os.getenv("LINE_CHANNEL_ACCESS_TOKEN")
+
+# 可改指向本地 stub (壓測用)；LineBotApi 也使用同一組 endpoint
+LINE_API_ENDPOINT = os.getenv("LINE_API_ENDPOINT", "https://api.line.me")
+LINE_DATA_API_ENDPOINT = os.getenv("LINE_DATA_API_ENDPOINT", "https://api-data.line.me")
+LINE_API_BASE = f"{LINE_API_ENDPOINT}/v2/bot"
+
+# Reply Token 有效時間約 1 分鐘，保守抓 50 秒，超過就改用 Push
+REPLY_TOKEN_TTL = int(os.getenv("REPLY_TOKEN_TTL", "50"))
+
+
+def _headers():
+    return {
+        "Content-Type": "application/json",
+        "Authorization": f"Bearer {LINE_CHANNEL_ACCESS_TOKEN}"
+    }
+
+
+def to_line_messages(messages):
+    """將 SDK 的 SendMessage 物件轉為 API 用的 dict"""
+    msg_list = []
+    for msg in messages:
+        if isinstance(msg, FlexSendMessage):
+            # 🔥 關鍵修正：將 BubbleContainer 物件轉為字典
+            content_dict = msg.contents
+            if hasattr(content_dict, 'as_json_dict'):
+                content_dict = content_dict.as_json_dict()
+
+            msg_list.append({
+                "type": "flex",
+                "altText": msg.alt_text,
+                "contents": content_dict
+            })
+        elif isinstance(msg, TextSendMessage):
+            item = {"type": "text", "text": msg.text}
+            if msg.quick_reply: item["quickReply"] = msg.quick_reply.as_json_dict()
+            msg_list.append(item)
+    return msg_list
+
+
+# 🔥 使用 requests 直接發送 LINE 訊息 (繞過 SDK 的 SSL 驗證)
+def reply_line_message(reply_token, messages):
+    """回傳 (是否成功, Reply Token 是否已失效)；只有 400 Invalid reply token 才算失效"""
+    payload = {
+        "replyToken": reply_token,
+        "messages": to_line_messages(messages)
+    }
+    with span("line_reply") as info:
+        try:
+            r = http_post(f"{LINE_API_BASE}/message/reply", headers=_headers(), json=payload, timeout=10)
+            if r.status_code == 200: return True, False
+            print(f"❌ LINE Reply Failed ({r.status_code}): {r.text[:200]}")
+            info["error"] = f"status {r.status_code}"
+            return False, r.status_code == 400 and "invalid reply token" in r.text.lower()
+        except Exception as e:
+            print(f"❌ LINE Reply Failed: {e}")
+            info["error"] = "failed"
+    return False, False
+
+
+def push_line_message(user_id, messages):
+    """帶 X-Line-Retry-Key：重試時 LINE 會以此去重，不會重複推播"""
+    payload = {
+        "to": user_id,
+        "messages": to_line_messages(messages)
+    }
+    with span("line_push") as info:
+        try:
+            headers = {**_headers(), "X-Line-Retry-Key": str(uuid.uuid4())}
+            r = http_post(f"{LINE_API_BASE}/message/push", headers=headers, json=payload, timeout=10)
+            # 409：同一個 retry key 已被接受 (前一次其實已送達)
+            if r.status_code in (200, 409): return True
+            print(f"❌ LINE Push Failed ({r.status_code}): {r.text[:200]}")
+        except Exception as e:
+            print(f"❌ LINE Push Failed: {e}")
+        info["error"] = "failed"
+    return False
+
+
+def reply_token_alive(event_ts):
+    """event_ts 為 LINE event.timestamp (毫秒)；未提供時視為仍有效"""
+    return event_ts is None or (time.time() - event_ts / 1000) < REPLY_TOKEN_TTL
+
+
+def deliver_line_message(reply_token, user_id, messages, event_ts=None):
+    """
+    背景處理用的發送入口
+    - Reply Token 仍有效 → Reply (免費、不計入推播額度)
+    - 已過期 (超過 REPLY_TOKEN_TTL 或 LINE 回 Invalid reply token) → 改用 Push 給 user_id
+    - 其他 Reply 失敗 (5xx、逾時) 訊息可能已送達，不改用 Push 以免使用者收到重複訊息
+    """
+    if not isinstance(messages, (list, tuple)): messages = [messages]
+    reason = "已過期"
+    if reply_token and reply_token_alive(event_ts):
+        ok, expired = reply_line_message(reply_token, messages)
+        if ok: return True
+        if not expired: return False
+        reason = "無效 (Invalid reply token)"
+    if user_id:
+        print(f"📮 Reply Token {reason}，改用 Push 發送給 {user_id}")
+        return push_line_message(user_id, messages)
+    return False
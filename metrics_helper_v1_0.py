@@ -0,0 +1,218 @@
+import os
+import json
+import time
+import uuid
+import bisect
+import functools
+import threading
+import contextvars
+from contextlib import contextmanager
+
+# --- 分段計時與 Prometheus 指標 ---
+# span() 包住每個處理階段 (意圖分析 / 各 DB 撈取 / Gemini / LINE 發送)，http_helper 另外記錄每次對外呼叫；
+# 結果累積成 histogram 由 /metrics 輸出，單一請求超過 SLOW_REQUEST_MS 時印出完整的分段紀錄
+SLOW_REQUEST_MS = int(os.getenv("SLOW_REQUEST_MS", "5000"))
+TRACE_MAX_SPANS = 200          # 單一請求最多保留幾段 (避免大量翻頁時 log 過長)
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 20, 40, 80)   # 秒
+SIZE_BUCKETS = (256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304)               # bytes
+
+_registry = []
+_registry_lock = threading.Lock()
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+class _Metric:
+    kind = None
+
+    def __init__(self, name, help_text, labelnames):
+        self.name = name
+        self.help = help_text
+        self.labelnames = labelnames
+        self._series = {}
+        self._lock = threading.Lock()
+        with _registry_lock: _registry.append(self)
+
+    def _key(self, labels):
+        return tuple(str(labels.get(n) or "") for n in self.labelnames)
+
+    def _labels(self, key, extra=None):
+        pairs = list(zip(self.labelnames, key)) + ([extra] if extra else [])
+        return "{" + ",".join(f'{n}="{_escape(v)}"' for n, v in pairs) + "}" if pairs else ""
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def inc(self, labels, n=1):
+        key = self._key(labels)
+        with self._lock: self._series[key] = self._series.get(key, 0) + n
+
+    def render(self):
+        with self._lock: series = dict(self._series)
+        return [f"{self.name}{self._labels(key)} {value}" for key, value in sorted(series.items())]
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name, help_text, labelnames, buckets):
+        super().__init__(name, help_text, labelnames)
+        self.buckets = buckets
+
+    def observe(self, labels, value):
+        key = self._key(labels)
+        with self._lock:
+            s = self._series.get(key)
+            if s is None: s = self._series[key] = {"counts": [0] * len(self.buckets), "sum": 0.0, "count": 0}
+            i = bisect.bisect_left(self.buckets, value)
+            if i < len(self.buckets): s["counts"][i] += 1
+            s["sum"] += value; s["count"] += 1
+
+    def render(self):
+        with self._lock: series = {k: dict(v, counts=list(v["counts"])) for k, v in self._series.items()}
+        lines = []
+        for key, s in sorted(series.items()):
+            cumulative = 0
+            for bound, n in zip(self.buckets, s["counts"]):
+                cumulative += n
+                lines.append(f"{self.name}_bucket{self._labels(key, ('le', bound))} {cumulative}")
+            lines.append(f"{self.name}_bucket{self._labels(key, ('le', '+Inf'))} {s['count']}")
+            lines.append(f"{self.name}_sum{self._labels(key)} {round(s['sum'], 6)}")
+            lines.append(f"{self.name}_count{self._labels(key)} {s['count']}")
+        return lines
+
+
+REQUEST_SECONDS = Histogram("bot_request_seconds", "Webhook event handling time", ("command", "domain"), LATENCY_BUCKETS)
+REQUEST_ERRORS = Counter("bot_request_errors_total", "Webhook events that raised", ("command",))
+STAGE_SECONDS = Histogram("bot_stage_seconds", "Time spent in each processing stage", ("command", "stage", "domain", "db"), LATENCY_BUCKETS)
+STAGE_BYTES = Histogram("bot_stage_payload_bytes", "Payload size handled by a stage", ("command", "stage", "domain", "db"), SIZE_BUCKETS)
+STAGE_ERRORS = Counter("bot_stage_errors_total", "Stages that raised", ("command", "stage", "domain", "db"))
+UPSTREAM_SECONDS = Histogram("bot_upstream_request_seconds", "Outbound HTTP request time (per attempt)", ("command", "host", "method", "status"), LATENCY_BUCKETS)
+UPSTREAM_BYTES = Histogram("bot_upstream_bytes", "Outbound HTTP payload size", ("host", "direction"), SIZE_BUCKETS)
+UPSTREAM_ERRORS = Counter("bot_upstream_errors_total", "Outbound HTTP errors (status >= 400 or exception)", ("host", "reason"))
+
+
+def render_metrics():
+    """Prometheus text format (0.0.4)"""
+    lines = []
+    with _registry_lock: metrics = list(_registry)
+    for metric in metrics:
+        lines.append(f"# HELP {metric.name} {metric.help}")
+        lines.append(f"# TYPE {metric.name} {metric.kind}")
+        lines.extend(metric.render())
+    return "\n".join(lines) + "\n"
+
+
+# ==========================================
+# 1. 請求追蹤 (trace / span)
+# ==========================================
+class Trace:
+    def __init__(self, command, labels):
+        self.id = uuid.uuid4().hex[:12]
+        self.command = command
+        self.labels = dict(labels)
+        self.started = time.perf_counter()
+        self.spans = []
+        self.dropped = 0
+        self._lock = threading.Lock()
+
+    def add(self, span):
+        with self._lock:
+            if len(self.spans) < TRACE_MAX_SPANS: self.spans.append(span)
+            else: self.dropped += 1
+
+
+_current = contextvars.ContextVar("bot_trace", default=None)
+
+
+def current_trace():
+    return _current.get()
+
+
+def set_trace_label(**labels):
+    """例如意圖分析完成後補上 domain，之後的 span 都會帶這個標籤"""
+    trace = _current.get()
+    if trace: trace.labels.update({k: v for k, v in labels.items() if v})
+
+
+def _span_labels(trace, stage, labels):
+    base = trace.labels if trace else {}
+    return {"command": trace.command if trace else "background", "stage": stage,
+            "domain": labels.get("domain") or base.get("domain"), "db": labels.get("db")}
+
+
+@contextmanager
+def request_trace(command, **labels):
+    """一個 webhook 事件 (或背景工作) 的完整處理；結束時記錄總時間，太慢就印出分段紀錄"""
+    trace = Trace(command, labels)
+    token = _current.set(trace)
+    error = None
+    try:
+        yield trace
+    except Exception as e:
+        error = type(e).__name__
+        raise
+    finally:
+        _current.reset(token)
+        elapsed = time.perf_counter() - trace.started
+        REQUEST_SECONDS.observe({"command": command, "domain": trace.labels.get("domain")}, elapsed)
+        if error: REQUEST_ERRORS.inc({"command": command})
+        if elapsed * 1000 >= SLOW_REQUEST_MS:
+            record = {"trace": trace.id, "command": command, **trace.labels, "total_ms": int(elapsed * 1000),
+                      "error": error, "spans": sorted(trace.spans, key=lambda s: s["start_ms"]), "dropped_spans": trace.dropped}
+            print(f"🐢 Slow Request {json.dumps(record, ensure_ascii=False, default=str)}")
+
+
+@contextmanager
+def span(stage, **labels):
+    """
+    計時一個處理階段；labels 可帶 domain / db 等
+    yield 的 dict 可填入 bytes (處理的資料大小) 或其他欄位，會一併寫進 trace
+    """
+    trace = _current.get()
+    info = {}
+    started = time.perf_counter()
+    error = None
+    try:
+        yield info
+    except Exception as e:
+        error = type(e).__name__
+        raise
+    finally:
+        elapsed = time.perf_counter() - started
+        metric_labels = _span_labels(trace, stage, labels)
+        STAGE_SECONDS.observe(metric_labels, elapsed)
+        if info.get("bytes") is not None: STAGE_BYTES.observe(metric_labels, info["bytes"])
+        if error or info.get("error"): STAGE_ERRORS.inc(metric_labels)
+        if trace:
+            trace.add({"stage": stage, **{k: v for k, v in labels.items() if v}, **info,
+                       "start_ms": int((started - trace.started) * 1000), "ms": int(elapsed * 1000),
+                       **({"error": error} if error else {})})
+
+
+def record_http(method, host, status, seconds, sent=0, received=0, error=None):
+    """http_helper 每次嘗試 (含重試) 呼叫一次"""
+    trace = _current.get()
+    command = trace.command if trace else "background"
+    UPSTREAM_SECONDS.observe({"command": command, "host": host, "method": method, "status": status or "error"}, seconds)
+    UPSTREAM_BYTES.observe({"host": host, "direction": "sent"}, sent)
+    UPSTREAM_BYTES.observe({"host": host, "direction": "received"}, received)
+    if error or (status and status >= 400): UPSTREAM_ERRORS.inc({"host": host, "reason": error or status})
+    if trace:
+        trace.add({"stage": "http", "host": host, "method": method, "status": status or error,
+                   "start_ms": int((time.perf_counter() - seconds - trace.started) * 1000), "ms": int(seconds * 1000),
+                   "sent": sent, "received": received})
+
+
+def traced(fn):
+    """讓丟進 ThreadPoolExecutor 的函式沿用目前的 trace (contextvars 不會自動帶到其他 thread)"""
+    ctx = contextvars.copy_context()
+
+    @functools.wraps(fn)
+    def wrapper(*args, **kwargs):
+        return ctx.copy().run(fn, *args, **kwargs)
+    return wrapper
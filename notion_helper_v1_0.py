@@ -0,0 +1,177 @@
+import os
+import time
+import urllib3
+from http_helper_v1_0 import http_post, http_get
+from cache_helper_v1_0 import SingleFlight, flight_key
+
+# --- 關閉 SSL 警告 ---
+urllib3.disable_warnings(urllib3.exceptions.InsecureRequestWarning)
+
+# --- 環境變數 ---
+NOTION_TOKEN = os.getenv("NOTION_TOKEN")
+
+NOTION_HEADERS = {
+    "Authorization": f"Bearer {NOTION_TOKEN}",
+    "Content-Type": "application/json",
+    "Notion-Version": "2022-06-28"
+}
+
+# 可改指向本地 stub (壓測用)
+NOTION_API_BASE = os.getenv("NOTION_API_BASE", "https://api.notion.com/v1")
+
+# Notion 單次 query 上限為 100 筆
+NOTION_MAX_PAGE_SIZE = 100
+
+# 頁面內文：巢狀區塊最多往下讀幾層 (toggle / 清單縮排)
+NOTION_BLOCK_MAX_DEPTH = int(os.getenv("NOTION_BLOCK_MAX_DEPTH", "3"))
+
+# 最近一次查詢的成本統計 (依 label 分類)，方便觀察每個指令實際花費
+QUERY_STATS = {}
+
+# 同一個 DB + 查詢條件同時只打一次 Notion (例如多位使用者同時查同一張儀表板)
+QUERY_FLIGHT = SingleFlight("notion_query")
+
+
+def iter_query_pages(db_id, payload=None, max_rows=None, label=None, stats=None):
+    """
+    依照 has_more / next_cursor 逐頁查詢 Notion 資料庫 (Generator)
+    - 每次 yield 一頁的 results (list)
+    - max_rows: 累計筆數達上限即停止，不會多撈下一頁
+    - stats: 傳入 dict 則會填入 pages / rows / bytes / ms / error / truncated (因 max_rows 而沒撈完)
+    呼叫端可隨時 break，finally 區塊仍會記錄統計。
+    """
+    url = f"{NOTION_API_BASE}/databases/{db_id}/query"
+    base_payload = dict(payload or {})
+    cursor = None
+    summary = stats if stats is not None else {}
+    summary.update({"pages": 0, "rows": 0, "bytes": 0, "ms": 0, "error": None, "truncated": False})
+    started = time.time()
+
+    try:
+        while True:
+            body = dict(base_payload)
+            page_size = body.get("page_size", NOTION_MAX_PAGE_SIZE)
+            if max_rows is not None:
+                remaining = max_rows - summary["rows"]
+                if remaining <= 0:
+                    summary["truncated"] = True   # has_more 但已達上限
+                    return
+                page_size = min(page_size, remaining)
+            body["page_size"] = min(page_size, NOTION_MAX_PAGE_SIZE)
+            if cursor: body["start_cursor"] = cursor
+
+            r = http_post(url, headers=NOTION_HEADERS, json=body, timeout=30, idempotent=True)
+            summary["pages"] += 1
+            summary["bytes"] += len(r.content)
+            if r.status_code != 200:
+                summary["error"] = r.status_code
+                print(f"❌ Notion Query Error ({r.status_code}) [{label or db_id}]: {r.text[:200]}")
+                return
+
+            data = r.json()
+            results = data.get("results", [])
+            if max_rows is not None and len(results) > max_rows - summary["rows"]:
+                results = results[:max_rows - summary["rows"]]
+                summary["truncated"] = True
+            summary["rows"] += len(results)
+            if results: yield results
+
+            cursor = data.get("next_cursor")
+            if not data.get("has_more") or not cursor: return
+    finally:
+        summary["ms"] = int((time.time() - started) * 1000)
+        QUERY_STATS[label or db_id] = dict(summary)
+        print(f"📊 Notion Query [{label or db_id}]: {summary['pages']} 頁 / {summary['rows']} 筆 / {summary['bytes']:,} bytes / {summary['ms']} ms")
+
+
+def query_database(db_id, payload=None, max_rows=None, label=None, stats=None):
+    """逐筆 yield 查詢結果 (自動翻頁)，呼叫端可提早 break"""
+    for results in iter_query_pages(db_id, payload, max_rows=max_rows, label=label, stats=stats):
+        for page in results:
+            yield page
+
+
+def _query_once(db_id, payload, max_rows, label):
+    summary = {}
+    pages = list(query_database(db_id, payload, max_rows=max_rows, label=label, stats=summary))
+    return pages, summary
+
+
+def query_all(db_id, payload=None, max_rows=None, label=None, stats=None):
+    """
+    一次取回所有結果 (list)，適合資料量可預期的呼叫端
+    相同 db_id + payload + max_rows 的查詢若同時進行，只會實際查詢一次，其餘共用結果 (統計也一併寫入各自的 label)
+    """
+    key = flight_key(db_id, payload or {}, max_rows)
+    pages, summary = QUERY_FLIGHT.do(key, _query_once, db_id, payload, max_rows, label)
+    QUERY_STATS[label or db_id] = dict(summary)
+    if stats is not None: stats.update(summary)
+    return pages
+
+
+def extract_number(prop):
+    """number / formula / rollup 屬性轉成數字 (無法解析時回傳 0)"""
+    if not prop: return 0
+    p_type = prop.get("type")
+    if p_type == "number": return prop.get("number", 0) or 0
+    elif p_type == "formula": return prop.get("formula", {}).get("number", 0) or 0
+    elif p_type == "rollup":
+        rollup = prop.get("rollup", {})
+        r_type = rollup.get("type")
+        if r_type == "number": return rollup.get("number", 0) or 0
+        elif r_type == "array":
+            total = 0
+            for item in rollup.get("array", []):
+                if item.get("type") == "number": total += item.get("number", 0) or 0
+                elif item.get("type") == "formula": total += item.get("formula", {}).get("number", 0) or 0
+            return total
+    return 0
+
+
+def iter_block_children(block_id):
+    """
+    依照 has_more / next_cursor 逐頁讀取區塊的子區塊 (Generator，每次 yield 一個 block)
+    Notion 回傳錯誤時拋出 RuntimeError，讓呼叫端分辨「讀取失敗」與「內容為空」
+    """
+    cursor = None
+    while True:
+        url = f"{NOTION_API_BASE}/blocks/{block_id}/children?page_size={NOTION_MAX_PAGE_SIZE}"
+        if cursor: url += f"&start_cursor={cursor}"
+        r = http_get(url, headers=NOTION_HEADERS, timeout=30)
+        if r.status_code != 200:
+            raise RuntimeError(f"Notion Blocks Error ({r.status_code}): {r.text[:200]}")
+        data = r.json()
+        for block in data.get("results", []):
+            yield block
+        cursor = data.get("next_cursor")
+        if not data.get("has_more") or not cursor: return
+
+
+def block_plain_text(block):
+    """串接區塊內所有 rich_text 片段 (粗體、連結等會被切成多段)"""
+    body = block.get(block.get("type"), {})
+    if not isinstance(body, dict): return ""
+    return "".join(rt.get("plain_text", "") for rt in body.get("rich_text", []))
+
+
+def fetch_page_text(page_id, max_depth=None):
+    """
+    讀取頁面全文 (含巢狀子區塊，子頁面與子資料庫不展開)
+    失敗回傳 None，空白頁面回傳 ""
+    """
+    max_depth = NOTION_BLOCK_MAX_DEPTH if max_depth is None else max_depth
+    lines = []
+
+    def walk(block_id, depth):
+        for block in iter_block_children(block_id):
+            text = block_plain_text(block)
+            if text: lines.append("  " * depth + text)
+            if block.get("has_children") and depth + 1 < max_depth and block.get("type") not in ("child_page", "child_database"):
+                walk(block["id"], depth + 1)
+
+    try:
+        walk(page_id, 0)
+    except Exception as e:
+        print(f"❌ Fetch Page Text Error ({page_id}): {e}")
+        return None
+    return "\n".join(lines)
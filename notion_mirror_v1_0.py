@@ -0,0 +1,453 @@
+import os
+import json
+import time
+import sqlite3
+import threading
+import concurrent.futures
+from datetime import datetime, timezone
+from notion_helper_v1_0 import query_all, fetch_page_text
+
+# --- 本地 SQLite 鏡像設定 ---
+# Notion 資料庫一天只變動幾次，查詢時優先讀本地鏡像，過期才以 last_edited_time 增量同步
+MIRROR_DB_PATH = os.getenv("NOTION_MIRROR_PATH", "notion_mirror.sqlite3")
+MIRROR_ENABLED = os.getenv("NOTION_MIRROR_ENABLED", "1") == "1"
+MIRROR_TTL = int(os.getenv("NOTION_MIRROR_TTL", "600"))               # 秒，超過即視為過期
+FULL_SYNC_INTERVAL = int(os.getenv("NOTION_MIRROR_FULL_SYNC", "21600"))  # 秒，定期全量同步以清除已刪除頁面
+PAGE_BODY_WORKERS = int(os.getenv("NOTION_PAGE_BODY_WORKERS", "8"))    # 同時讀取頁面內文的上限 (Notion 約 3 req/s)
+
+_sync_locks = {}
+_sync_locks_guard = threading.Lock()
+
+# 結構版本：v1 加入 title 欄位與 page_dates (查詢條件在 SQL 先過濾，不必每次解析整個資料庫的 JSON)
+SCHEMA_VERSION = 1
+
+
+def _connect():
+    conn = sqlite3.connect(MIRROR_DB_PATH, timeout=30)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("""CREATE TABLE IF NOT EXISTS pages (
+        db_id TEXT NOT NULL,
+        page_id TEXT NOT NULL,
+        created_time TEXT,
+        last_edited_time TEXT,
+        title TEXT,
+        data TEXT NOT NULL,
+        PRIMARY KEY (db_id, page_id))""")
+    # 每個 date 屬性的 start 一列，供日期範圍過濾與排序使用
+    conn.execute("""CREATE TABLE IF NOT EXISTS page_dates (
+        db_id TEXT NOT NULL,
+        page_id TEXT NOT NULL,
+        prop TEXT NOT NULL,
+        value TEXT NOT NULL,
+        PRIMARY KEY (db_id, page_id, prop))""")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_page_dates_value ON page_dates (db_id, prop, value)")
+    conn.execute("""CREATE TABLE IF NOT EXISTS sync_state (
+        db_id TEXT PRIMARY KEY,
+        watermark TEXT,
+        last_sync_at REAL,
+        last_full_sync_at REAL)""")
+    conn.execute("""CREATE TABLE IF NOT EXISTS page_bodies (
+        page_id TEXT PRIMARY KEY,
+        last_edited_time TEXT,
+        body TEXT NOT NULL,
+        fetched_at REAL)""")
+    if conn.execute("PRAGMA user_version").fetchone()[0] < SCHEMA_VERSION: _migrate(conn)
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_pages_created ON pages (db_id, created_time)")
+    return conn
+
+
+def _migrate(conn):
+    """舊版鏡像沒有 title / page_dates：補欄位後清除同步狀態，下次查詢時全量重建"""
+    with conn:
+        if "title" not in [r[1] for r in conn.execute("PRAGMA table_info(pages)").fetchall()]:
+            conn.execute("ALTER TABLE pages ADD COLUMN title TEXT")
+        conn.execute("DELETE FROM sync_state")
+        conn.execute(f"PRAGMA user_version = {SCHEMA_VERSION}")
+
+
+def _get_lock(db_id):
+    with _sync_locks_guard:
+        if db_id not in _sync_locks: _sync_locks[db_id] = threading.Lock()
+        return _sync_locks[db_id]
+
+
+def _load_state(conn, db_id):
+    row = conn.execute("SELECT watermark, last_sync_at, last_full_sync_at FROM sync_state WHERE db_id = ?", (db_id,)).fetchone()
+    if not row: return None, 0, 0
+    return row[0], row[1] or 0, row[2] or 0
+
+
+def _page_title(page):
+    for prop in (page.get("properties") or {}).values():
+        if prop.get("type") == "title": return "".join(t.get("plain_text", "") for t in prop.get("title") or [])
+    return ""
+
+
+def _page_dates(db_id, page):
+    return [(db_id, page["id"], name, (prop.get("date") or {}).get("start"))
+            for name, prop in (page.get("properties") or {}).items()
+            if prop.get("type") == "date" and (prop.get("date") or {}).get("start")]
+
+
+def _upsert_pages(conn, db_id, pages):
+    conn.executemany(
+        "INSERT OR REPLACE INTO pages (db_id, page_id, created_time, last_edited_time, title, data) VALUES (?, ?, ?, ?, ?, ?)",
+        [(db_id, p["id"], p.get("created_time"), p.get("last_edited_time"), _page_title(p), json.dumps(p, ensure_ascii=False)) for p in pages]
+    )
+    conn.executemany("DELETE FROM page_dates WHERE db_id = ? AND page_id = ?", [(db_id, p["id"]) for p in pages])
+    conn.executemany("INSERT INTO page_dates (db_id, page_id, prop, value) VALUES (?, ?, ?, ?)",
+                     [row for p in pages for row in _page_dates(db_id, p)])
+
+
+# ==========================================
+# 1. 同步
+# ==========================================
+def sync_database(db_id, label=None, force_full=False):
+    """
+    同步單一資料庫到本地鏡像
+    - 首次或超過 FULL_SYNC_INTERVAL：全量同步 (順便移除 Notion 已刪除/封存的頁面)
+    - 其餘情況：只撈 last_edited_time >= 水位線 的頁面
+    成功回傳 True，Notion 回傳錯誤或連線失敗回傳 False。
+    """
+    now = time.time()
+    conn = _connect()
+    try:
+        watermark, _, last_full = _load_state(conn, db_id)
+        full = force_full or not watermark or (now - last_full) > FULL_SYNC_INTERVAL
+
+        payload = {}
+        if not full:
+            # Notion 的 last_edited_time 只精確到分鐘，用 on_or_after 重撈最後一分鐘，upsert 可重複執行
+            payload["filter"] = {"timestamp": "last_edited_time", "last_edited_time": {"on_or_after": watermark}}
+
+        stats = {}
+        pages = query_all(db_id, payload, label=f"mirror:{label or db_id}", stats=stats)
+        if stats.get("error"): return False
+
+        new_watermark = max([p.get("last_edited_time") or "" for p in pages] + [watermark or ""]) or None
+        with conn:
+            if full:
+                conn.execute("DELETE FROM pages WHERE db_id = ?", (db_id,))
+                conn.execute("DELETE FROM page_dates WHERE db_id = ?", (db_id,))
+            _upsert_pages(conn, db_id, pages)
+            conn.execute(
+                "INSERT OR REPLACE INTO sync_state (db_id, watermark, last_sync_at, last_full_sync_at) VALUES (?, ?, ?, ?)",
+                (db_id, new_watermark, now, now if full else last_full)
+            )
+        print(f"🔄 Mirror Sync [{label or db_id}]: {'全量' if full else '增量'} {len(pages)} 筆")
+        return True
+    except Exception as e:
+        print(f"❌ Mirror Sync Error ({label or db_id}): {e}")
+        return False
+    finally:
+        conn.close()
+
+
+def ensure_fresh(db_id, label=None, max_age=None):
+    """確保鏡像在 max_age 秒內同步過；同一個 DB 同時只會有一個執行緒在同步"""
+    max_age = MIRROR_TTL if max_age is None else max_age
+
+    def is_fresh():
+        conn = _connect()
+        try:
+            _, last_sync, _ = _load_state(conn, db_id)
+        finally:
+            conn.close()
+        return (time.time() - last_sync) <= max_age
+
+    if is_fresh(): return True
+    with _get_lock(db_id):
+        # 等鎖期間可能已被其他執行緒同步完成
+        if is_fresh(): return True
+        return sync_database(db_id, label)
+
+
+def sync_all(db_env_keys):
+    """依環境變數名稱批次同步 (啟動預熱用)"""
+    if not MIRROR_ENABLED: return
+    for key in db_env_keys:
+        db_id = os.getenv(key)
+        if db_id: ensure_fresh(db_id, key)
+
+
+def load_pages(db_id):
+    conn = _connect()
+    try:
+        rows = conn.execute("SELECT data FROM pages WHERE db_id = ?", (db_id,)).fetchall()
+    finally:
+        conn.close()
+    return [json.loads(r[0]) for r in rows]
+
+
+# ==========================================
+# 2. 本地執行 Notion query payload (常用子集)
+# ==========================================
+def _prop_value(page, name):
+    """取出可比較/排序的屬性值 (date 取 start、title/rich_text 取純文字)"""
+    prop = page.get("properties", {}).get(name) or {}
+    p_type = prop.get("type")
+    if p_type == "date": return (prop.get("date") or {}).get("start") or ""
+    if p_type in ("title", "rich_text"): return "".join(t.get("plain_text", "") for t in prop.get(p_type) or [])
+    if p_type == "number": return prop.get("number")
+    if p_type in ("select", "status"): return (prop.get(p_type) or {}).get("name") or ""
+    if p_type == "formula":
+        f = prop.get("formula") or {}
+        return f.get(f.get("type"))
+    return None
+
+
+DATE_OPS = ("on_or_after", "on_or_before", "after", "before", "equals")
+TEXT_OPS = ("starts_with", "contains", "equals")
+
+
+def _check_ops(cond, allowed):
+    for op in cond:
+        if op not in allowed: raise ValueError(f"unsupported operator: {op}")
+    return cond
+
+
+def _date_match(value, cond):
+    if not value: return False
+    for op, target in cond.items():
+        # 只給日期時比較日期部分，給完整時間則直接比字串 (ISO 8601 可字典序比較)
+        v = value[:len(target)] if len(target) == 10 else value
+        if op == "on_or_after" and not v >= target: return False
+        if op == "on_or_before" and not v <= target: return False
+        if op == "after" and not v > target: return False
+        if op == "before" and not v < target: return False
+        if op == "equals" and not v == target: return False
+    return True
+
+
+def _text_match(value, cond):
+    value = value or ""
+    for op, target in cond.items():
+        if op == "starts_with" and not value.startswith(target): return False
+        if op == "contains" and target not in value: return False
+        if op == "equals" and value != target: return False
+    return True
+
+
+def _compile_filter(f):
+    """把 Notion filter 轉成 Python 判斷函式，不支援的條件丟出 ValueError (呼叫端改走線上查詢)"""
+    if not f: return lambda page: True
+    if "and" in f:
+        subs = [_compile_filter(x) for x in f["and"]]
+        return lambda page: all(s(page) for s in subs)
+    if "or" in f:
+        subs = [_compile_filter(x) for x in f["or"]]
+        return lambda page: not subs or any(s(page) for s in subs)
+    if f.get("timestamp") in ("created_time", "last_edited_time"):
+        ts = f["timestamp"]
+        cond = _check_ops(f.get(ts, {}), DATE_OPS)
+        return lambda page: _date_match(page.get(ts) or "", cond)
+    if f.get("property"):
+        name = f["property"]
+        if "date" in f:
+            cond = _check_ops(f["date"], DATE_OPS)
+            return lambda page: _date_match(_prop_value(page, name), cond)
+        for kind in ("title", "rich_text"):
+            if kind in f:
+                cond = _check_ops(f[kind], TEXT_OPS)
+                return lambda page: _text_match(_prop_value(page, name), cond)
+    raise ValueError(f"unsupported filter: {f}")
+
+
+# ==========================================
+# 3. 轉成 SQL (查詢時只解析符合條件的頁面)
+# ==========================================
+SQL_DATE_OPS = {"on_or_after": ">=", "on_or_before": "<=", "after": ">", "before": "<", "equals": "="}
+
+
+def _sql_date(column, cond):
+    """與 _date_match 相同語意：只給日期時比較日期部分，空值不符合"""
+    parts, args = [f"{column} IS NOT NULL AND {column} != ''"], []
+    for op, target in cond.items():
+        parts.append(f"{f'substr({column}, 1, 10)' if len(target) == 10 else column} {SQL_DATE_OPS[op]} ?")
+        args.append(target)
+    return " AND ".join(parts), args
+
+
+def _sql_filter(f, db_id):
+    """
+    把 Notion filter 轉成 SQL 條件 (pages 別名為 p)，回傳 (sql, args, exact)
+    exact=False 表示 SQL 只是預先縮小範圍 (例如 rich_text 條件)，仍需以 _compile_filter 逐筆確認；sql 為 None 表示無法縮小
+    """
+    if not f: return None, [], True
+    if "and" in f or "or" in f:
+        # 空的 and / or 視為不限條件 (與 _compile_filter 一致)
+        subs = [_sql_filter(x, db_id) for x in (f["and"] if "and" in f else f["or"]) or []]
+        if "or" in f and not all(s[0] for s in subs): return None, [], False
+        parts = [s for s in subs if s[0]]
+        sql = f" {'AND' if 'and' in f else 'OR'} ".join(f"({s[0]})" for s in parts) or None
+        return sql, [a for s in parts for a in s[1]], all(s[2] for s in subs)
+    if f.get("timestamp") in ("created_time", "last_edited_time"):
+        ts = f["timestamp"]
+        return (*_sql_date(f"p.{ts}", f.get(ts, {})), True)
+    if f.get("property") and "date" in f:
+        cond, args = _sql_date("d.value", f["date"])
+        return (f"p.page_id IN (SELECT d.page_id FROM page_dates d WHERE d.db_id = ? AND d.prop = ? AND {cond})",
+                [db_id, f["property"], *args], True)
+    if f.get("property") and "title" in f:
+        parts, args = [], []
+        for op, target in f["title"].items():
+            if op == "starts_with": parts.append("substr(COALESCE(p.title, ''), 1, length(?)) = ?"); args += [target, target]
+            elif op == "contains": parts.append("instr(COALESCE(p.title, ''), ?) > 0"); args.append(target)
+            elif op == "equals": parts.append("COALESCE(p.title, '') = ?"); args.append(target)
+        return " AND ".join(parts) or None, args, True
+    return None, [], False
+
+
+def _sql_order(conn, db_id, sorts):
+    """沒有排序 / 單一 timestamp 排序 / 單一 date 屬性排序可在 SQL 完成，回傳 (order_by, args)，其餘回傳 None"""
+    if not sorts: return "COALESCE(p.created_time, '') DESC, p.page_id", []
+    if len(sorts) != 1: return None
+    s = sorts[0]
+    direction = "DESC" if s.get("direction") == "descending" else "ASC"
+    if s.get("timestamp") in ("created_time", "last_edited_time"):
+        return f"COALESCE(p.{s['timestamp']}, '') {direction}, p.page_id", []
+    name = s.get("property")
+    if name and conn.execute("SELECT 1 FROM page_dates WHERE db_id = ? AND prop = ? LIMIT 1", (db_id, name)).fetchone():
+        value = "COALESCE((SELECT d.value FROM page_dates d WHERE d.db_id = p.db_id AND d.page_id = p.page_id AND d.prop = ?), '')"
+        return f"{value} != '' {direction}, {value} {direction}, p.page_id", [name, name]
+    return None
+
+
+def _compile_sorts(sorts):
+    """把 Notion sorts 轉成 [(key, reverse)]，不支援時丟出 ValueError"""
+    compiled = []
+    for s in sorts or []:
+        reverse = s.get("direction") == "descending"
+        if s.get("timestamp") in ("created_time", "last_edited_time"):
+            compiled.append((lambda p, ts=s["timestamp"]: p.get(ts) or "", reverse))
+        elif s.get("property"):
+            def key(p, name=s["property"]):
+                v = _prop_value(p, name)
+                return (v is not None and v != "", v if v is not None else "")
+            compiled.append((key, reverse))
+        else:
+            raise ValueError(f"unsupported sort: {s}")
+    return compiled
+
+
+def mirror_query(db_id, payload=None, max_rows=None, label=None, stats=None):
+    """
+    與 notion_helper.query_all 相同介面，但優先從本地鏡像回答
+    - 鏡像過期 → 先做增量同步
+    - 同步失敗 / 不支援的 filter → 退回線上查詢
+    - stats: 傳入 dict 則填入 rows / truncated / error / source，鏡像回答時另有 matched (符合條件的總筆數)
+    """
+    payload = payload or {}
+    summary = stats if stats is not None else {}
+    if not MIRROR_ENABLED or not db_id:
+        return _online_query(db_id, payload, max_rows, label, summary)
+    try:
+        match = _compile_filter(payload.get("filter"))
+        sorts = _compile_sorts(payload.get("sorts"))
+    except ValueError as e:
+        print(f"⚠️ Mirror 不支援此查詢，改走線上 ({label or db_id}): {e}")
+        return _online_query(db_id, payload, max_rows, label, summary)
+
+    if not ensure_fresh(db_id, label):
+        return _online_query(db_id, payload, max_rows, label, summary)
+
+    started = time.time()
+    where, args, exact = _sql_filter(payload.get("filter"), db_id)
+    where_sql = f"p.db_id = ?{f' AND ({where})' if where else ''}"
+    args = [db_id, *args]
+    conn = _connect()
+    try:
+        order = _sql_order(conn, db_id, payload.get("sorts")) if exact else None
+        if order:
+            # 條件與排序都在 SQL 完成：只解析要回傳的頁面
+            order_by, order_args = order
+            limit = -1 if max_rows is None else max_rows
+            rows = conn.execute(f"SELECT p.data FROM pages p WHERE {where_sql} ORDER BY {order_by} LIMIT ?", [*args, *order_args, limit]).fetchall()
+            pages = [json.loads(r[0]) for r in rows]
+            matched = len(pages) if max_rows is None or len(pages) < max_rows else \
+                conn.execute(f"SELECT COUNT(*) FROM pages p WHERE {where_sql}", args).fetchone()[0]
+        else:
+            rows = conn.execute(f"SELECT p.data FROM pages p WHERE {where_sql}", args).fetchall()
+            pages = [page for page in (json.loads(r[0]) for r in rows) if match(page)]
+            if sorts:
+                # 多重排序：由最後一個條件開始做穩定排序
+                for key, reverse in reversed(sorts): pages.sort(key=key, reverse=reverse)
+            else:
+                # 沒指定排序時比照 Notion 預設，最新建立的在前
+                pages.sort(key=lambda p: p.get("created_time") or "", reverse=True)
+            matched = len(pages)
+            if max_rows is not None: pages = pages[:max_rows]
+    finally:
+        conn.close()
+    summary.update({"rows": len(pages), "matched": matched, "truncated": matched > len(pages), "error": None, "source": "mirror"})
+    print(f"💾 Mirror Query [{label or db_id}]: {len(pages)} 筆 / {int((time.time() - started) * 1000)} ms")
+    return pages
+
+
+def _online_query(db_id, payload, max_rows, label, summary):
+    pages = query_all(db_id, payload, max_rows=max_rows, label=label, stats=summary)
+    summary["source"] = "notion"
+    return pages
+
+
+def mirror_status():
+    """各資料庫鏡像的筆數與最後同步時間"""
+    conn = _connect()
+    try:
+        rows = conn.execute(
+            "SELECT s.db_id, s.watermark, s.last_sync_at, (SELECT COUNT(*) FROM pages p WHERE p.db_id = s.db_id) FROM sync_state s"
+        ).fetchall()
+    finally:
+        conn.close()
+    return [{
+        "db_id": r[0], "watermark": r[1], "rows": r[3],
+        "last_sync": datetime.fromtimestamp(r[2], timezone.utc).isoformat() if r[2] else None
+    } for r in rows]
+
+
+# ==========================================
+# 4. 頁面內文快取 (page_id + last_edited_time)
+# ==========================================
+def get_page_bodies(pages, label=None):
+    """
+    取得多個頁面的全文，回傳 {page_id: body}
+    - 快取中 last_edited_time 相同的頁面直接讀本地，不再下載
+    - 其餘頁面以有上限的執行緒池並行讀取，成功後寫回快取 (失敗的頁面不會出現在結果中)
+    """
+    if not pages: return {}
+    started = time.time()
+    edited = {p["id"]: p.get("last_edited_time") or "" for p in pages}
+    bodies = {}
+    conn = _connect()
+    try:
+        ids = list(edited)
+        for i in range(0, len(ids), 500):
+            chunk = ids[i:i + 500]
+            rows = conn.execute(
+                f"SELECT page_id, last_edited_time, body FROM page_bodies WHERE page_id IN ({','.join('?' * len(chunk))})", chunk
+            ).fetchall()
+            for page_id, last_edited, body in rows:
+                if last_edited == edited[page_id]: bodies[page_id] = body
+    finally:
+        conn.close()
+
+    missing = [pid for pid in edited if pid not in bodies]
+    fetched = {}
+    if missing:
+        with concurrent.futures.ThreadPoolExecutor(max_workers=min(PAGE_BODY_WORKERS, len(missing))) as executor:
+            for pid, body in zip(missing, executor.map(fetch_page_text, missing)):
+                if body is not None: fetched[pid] = body
+        if fetched:
+            conn = _connect()
+            try:
+                with conn:
+                    conn.executemany(
+                        "INSERT OR REPLACE INTO page_bodies (page_id, last_edited_time, body, fetched_at) VALUES (?, ?, ?, ?)",
+                        [(pid, edited[pid], body, time.time()) for pid, body in fetched.items()]
+                    )
+            finally:
+                conn.close()
+        bodies.update(fetched)
+
+    print(f"📄 Page Bodies [{label or '-'}]: 快取 {len(pages) - len(missing)} / 下載 {len(fetched)} / 失敗 {len(missing) - len(fetched)} / {int((time.time() - started) * 1000)} ms")
+    return bodies
@@ -0,0 +1,200 @@
+import os
+import sqlite3
+from datetime import datetime, date, timedelta, timezone
+
+# --- 每日營養帳本 ---
+# 每次寫入飲食紀錄時累加到 (user_id, 台灣日期) 的每日合計，查今日 / 本週進度不用再查 Notion
+LEDGER_DB_PATH = os.getenv("NUTRITION_LEDGER_PATH", "nutrition_ledger.sqlite3")
+TW_TZ = timezone(timedelta(hours=8))
+NUTRIENTS = ("calories", "protein", "carbs", "fat")
+
+# Notion 飲食資料庫欄位 → 帳本欄位 (rebuild 用)
+NOTION_PROPS = {"熱量": "calories", "蛋白質": "protein", "碳水化合物": "carbs", "脂肪": "fat"}
+
+
+def _connect():
+    conn = sqlite3.connect(LEDGER_DB_PATH, timeout=30)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("""CREATE TABLE IF NOT EXISTS daily_totals (
+        user_id TEXT NOT NULL,
+        day TEXT NOT NULL,
+        calories REAL NOT NULL DEFAULT 0,
+        protein REAL NOT NULL DEFAULT 0,
+        carbs REAL NOT NULL DEFAULT 0,
+        fat REAL NOT NULL DEFAULT 0,
+        meals INTEGER NOT NULL DEFAULT 0,
+        PRIMARY KEY (user_id, day))""")
+    # rebuild_state: pending (已認領、尚未補完) / done；rebuild_before: 只補這個時間點之前建立的頁面
+    conn.execute("CREATE TABLE IF NOT EXISTS ledger_meta (key TEXT PRIMARY KEY, value TEXT)")
+    return conn
+
+
+def _num(v):
+    try:
+        return float(v or 0)
+    except (TypeError, ValueError):
+        return 0.0
+
+
+def _row_dict(day, row):
+    if not row: return {"day": day, "calories": 0, "protein": 0, "carbs": 0, "fat": 0, "meals": 0}
+    return {"day": day, **{k: round(v, 1) for k, v in zip(NUTRIENTS, row[:4])}, "meals": row[4]}
+
+
+def today_tw():
+    return datetime.now(TW_TZ).date()
+
+
+def _add(conn, user_id, day, data, meals=1):
+    conn.execute(
+        "INSERT INTO daily_totals (user_id, day, calories, protein, carbs, fat, meals) VALUES (?, ?, ?, ?, ?, ?, ?) "
+        "ON CONFLICT (user_id, day) DO UPDATE SET calories = calories + excluded.calories, protein = protein + excluded.protein, "
+        "carbs = carbs + excluded.carbs, fat = fat + excluded.fat, meals = meals + excluded.meals",
+        (user_id, day, *[_num(data.get(k)) for k in NUTRIENTS], meals)
+    )
+
+
+def record_meal(user_id, data, when=None):
+    """累加一餐 (data 為 Gemini 分析結果：calories / protein / carbs / fat)，回傳當日累計"""
+    day = (when or datetime.now(TW_TZ)).astimezone(TW_TZ).date().isoformat()
+    conn = _connect()
+    try:
+        with conn:
+            _add(conn, user_id, day, data)
+        row = conn.execute("SELECT calories, protein, carbs, fat, meals FROM daily_totals WHERE user_id = ? AND day = ?", (user_id, day)).fetchone()
+    finally:
+        conn.close()
+    return _row_dict(day, row)
+
+
+def day_totals(user_id, day=None):
+    day = (day or today_tw()).isoformat() if not isinstance(day, str) else day
+    conn = _connect()
+    try:
+        row = conn.execute("SELECT calories, protein, carbs, fat, meals FROM daily_totals WHERE user_id = ? AND day = ?", (user_id, day)).fetchone()
+    finally:
+        conn.close()
+    return _row_dict(day, row)
+
+
+def daily_rows(user_id, start, end):
+    """start ~ end (含) 每一天的合計，沒有紀錄的日子補 0；以主鍵範圍查詢，筆數只和天數有關"""
+    start, end = date.fromisoformat(str(start)[:10]), date.fromisoformat(str(end)[:10])
+    conn = _connect()
+    try:
+        rows = {r[0]: r[1:] for r in conn.execute(
+            "SELECT day, calories, protein, carbs, fat, meals FROM daily_totals WHERE user_id = ? AND day BETWEEN ? AND ? ORDER BY day",
+            (user_id, start.isoformat(), end.isoformat())
+        ).fetchall()}
+    finally:
+        conn.close()
+    days = [(start + timedelta(days=i)).isoformat() for i in range((end - start).days + 1)]
+    return [_row_dict(d, rows.get(d)) for d in days]
+
+
+def period_totals(user_id, start, end):
+    """期間合計 + 有紀錄天數的每日平均"""
+    rows = daily_rows(user_id, start, end)
+    logged = [r for r in rows if r["meals"]]
+    total = {k: round(sum(r[k] for r in rows), 1) for k in NUTRIENTS}
+    return {
+        "start": rows[0]["day"] if rows else str(start), "end": rows[-1]["day"] if rows else str(end),
+        **total, "meals": sum(r["meals"] for r in rows), "days_logged": len(logged),
+        "daily_avg": {k: round(total[k] / len(logged), 1) for k in NUTRIENTS} if logged else {k: 0 for k in NUTRIENTS},
+    }
+
+
+def week_totals(user_id, day=None):
+    """本週 (週一起算) 至 day 的合計"""
+    day = day or today_tw()
+    return period_totals(user_id, day - timedelta(days=day.weekday()), day)
+
+
+def is_empty():
+    conn = _connect()
+    try:
+        return conn.execute("SELECT 1 FROM daily_totals LIMIT 1").fetchone() is None
+    finally:
+        conn.close()
+
+
+def _meta(conn, key):
+    row = conn.execute("SELECT value FROM ledger_meta WHERE key = ?", (key,)).fetchone()
+    return row[0] if row else None
+
+
+def claim_rebuild():
+    """
+    啟動時 (開始接收 webhook 前) 呼叫：決定是否需要由 Notion 補上歷史紀錄，回傳 cutoff (aware datetime) 或 None
+    - 在同一個 IMMEDIATE 交易內檢查並寫入標記，多個 worker 同時啟動也只會有一個認領
+    - 帳本為空時記下 cutoff (pending)；已有資料 (舊版已補過) 直接標記 done
+    - 尚未補完 (pending，例如補到一半重啟) 時沿用原本的 cutoff，由 rebuild 以交易保證只套用一次
+    """
+    conn = _connect()
+    conn.isolation_level = None
+    try:
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            state, before = _meta(conn, "rebuild_state"), _meta(conn, "rebuild_before")
+            if state is None:
+                empty = conn.execute("SELECT 1 FROM daily_totals LIMIT 1").fetchone() is None
+                state = "pending" if empty else "done"
+                before = datetime.now(timezone.utc).isoformat() if empty else None
+                conn.executemany("INSERT INTO ledger_meta (key, value) VALUES (?, ?)", [("rebuild_state", state), ("rebuild_before", before)])
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+    finally:
+        conn.close()
+    return datetime.fromisoformat(before) if state == "pending" else None
+
+
+def rebuild(pages, before):
+    """
+    由 Notion 飲食資料庫頁面補上歷史紀錄 (claim_rebuild 認領後呼叫)
+    before: claim_rebuild 回傳的 cutoff；之後記錄的餐點已由 record_meal 即時累加
+    (含仍在寫入佇列、尚未送到 Notion 的)，因此只補 created_time 早於此時間的頁面，並以累加方式寫入，不清除現有資料
+    套用與標記 done 在同一個交易內，多個 worker / 重啟後重跑都只會套用一次
+    """
+    # Notion 的 created_time 只到分鐘，取整到分鐘避免把剛記錄的餐點重複計入
+    cutoff = before.astimezone(timezone.utc).replace(second=0, microsecond=0).strftime("%Y-%m-%dT%H:%M")
+    totals = {}
+    count = skipped = 0
+    for page in pages:
+        if (page.get("created_time") or "") >= cutoff:
+            skipped += 1
+            continue
+        props = page.get("properties", {})
+        user_id = "".join(t.get("plain_text", "") for t in (props.get("USER ID", {}).get("rich_text") or []))
+        when = ((props.get("用餐時間", {}).get("date") or {}).get("start")) or page.get("created_time")
+        if not user_id or not when: continue
+        try:
+            day = when[:10] if len(when) <= 10 else datetime.fromisoformat(when.replace("Z", "+00:00")).astimezone(TW_TZ).date().isoformat()
+        except ValueError:
+            day = when[:10]
+        entry = totals.setdefault((user_id, day), {"meals": 0, **{k: 0.0 for k in NUTRIENTS}})
+        for prop, key in NOTION_PROPS.items(): entry[key] += _num(props.get(prop, {}).get("number"))
+        entry["meals"] += 1
+        count += 1
+
+    conn = _connect()
+    conn.isolation_level = None
+    try:
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            if _meta(conn, "rebuild_state") != "pending":
+                conn.execute("ROLLBACK")
+                print("🍱 Nutrition Ledger 已由其他 worker 補完，略過")
+                return 0
+            for (user_id, day), entry in totals.items():
+                _add(conn, user_id, day, entry, meals=entry["meals"])
+            conn.execute("UPDATE ledger_meta SET value = 'done' WHERE key = 'rebuild_state'")
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+    finally:
+        conn.close()
+    print(f"🍱 Nutrition Ledger 重建: {count} 餐 ({len(totals)} 天，略過啟動後建立的 {skipped} 筆)")
+    return count
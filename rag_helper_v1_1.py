@@ -1,12 +1,25 @@
 import os
-import requests
 import json
 import concurrent.futures
 import time
 import re
 import urllib3
-from datetime import datetime
+import random
+import unicodedata
+from datetime import datetime, timedelta, timezone
 from linebot.models import TextSendMessage, FlexSendMessage
+from notion_mirror_v1_0 import mirror_query, get_page_bodies
+from http_helper_v1_0 import http_post
+from line_helper_v1_0 import deliver_line_message, push_line_message, reply_token_alive
+from gemini_helper_v1_0 import gemini_url, stream_generate, JSONFieldStream, SAFETY_SETTINGS, GEMINI_FLIGHT
+from cache_helper_v1_0 import TTLCache, flight_key
+from intent_classifier_v1_0 import classify_domain, record_label, INTENT_LOCAL_THRESHOLD, INTENT_AUDIT_RATE
+from date_parser_v1_0 import parse_date_range, sanitize_date_filter
+from knowledge_index_v1_0 import search as search_knowledge
+from context_helper_v1_0 import pack_context, format_report
+from aggregate_helper_v1_0 import aggregate_raw_data
+from nutrition_ledger_v1_0 import daily_rows, period_totals, week_totals
+from metrics_helper_v1_0 import span, set_trace_label, traced
 
 # --- 關閉 SSL 警告 ---
 urllib3.disable_warnings(urllib3.exceptions.InsecureRequestWarning)
@@ -14,8 +27,6 @@ urllib3.disable_warnings(urllib3.exceptions.InsecureRequestWarning)
 # --- 環境變數 ---
 NOTION_TOKEN = os.getenv("NOTION_TOKEN")
 GOOGLE_API_KEY = os.getenv("GOOGLE_API_KEY")
-# 🔥 為了繞過 SDK 直接發送請求，需要讀取這個 Token
-LINE_CHANNEL_ACCESS_TOKEN = os.getenv("LINE_CHANNEL_ACCESS_TOKEN")
 
 NOTION_HEADERS = {
     "Authorization": f"Bearer {NOTION_TOKEN}",
@@ -44,29 +55,53 @@ DOMAIN_MAP = {
 # 流水帳資料庫中的日期欄位名稱
 FINANCE_DATE_PROP = "日期" 
 
+# 每個 DB 的撈取上限 (有日期範圍時自動翻頁至上限，無範圍只取最新幾筆)
+FILTERED_ROW_LIMIT = 1000
+UNFILTERED_ROW_LIMIT = 40
+
 # 使用的模型
 MODEL_NAME = "gemini-2.5-flash"
 
+# HEALTH 問題附上本地營養帳本 (沒有日期範圍時取最近幾天，範圍過長時只取最後 LEDGER_MAX_DAYS 天)
+LEDGER_DEFAULT_DAYS = 7
+LEDGER_MAX_DAYS = 92
+
+# 串流生成：摘要卡一完成就先 Reply，分析卡之後再 Push (需要 user_id)
+RAG_STREAMING = os.getenv("RAG_STREAMING", "1") == "1"
+
+# --- 台灣時區設定 (UTC+8) ---
+TW_TZ = timezone(timedelta(hours=8))
+
+# --- 意圖快取 ---
+# key = 正規化問題 + 台灣日期 (相對日期每天解析結果不同)，存檔讓重啟後仍可命中
+INTENT_CACHE_PATH = os.getenv("INTENT_CACHE_PATH", "intent_cache.json")
+INTENT_CACHE = TTLCache("intent", ttl=int(os.getenv("INTENT_CACHE_TTL", "86400")), maxsize=int(os.getenv("INTENT_CACHE_SIZE", "500")))
+INTENT_CACHE.load(INTENT_CACHE_PATH)
+
+# 本地日期解析器認不得、但看起來含時間描述的問題，仍需 Gemini 解析日期範圍
+# 數字只在帶時間單位或日期格式時才算 (iphone 15、100 元 不算)
+TIME_EXPRESSION_RE = re.compile(
+    r"(今天|今日|昨天|前天|明天|週|周|禮拜|星期|月|年|日|號|季|最近|近期|today|yesterday|week|month|year|last|this"
+    r"|\d+\s*(?:天|days?|weeks?|months?|years?)|\d{1,4}\s*[/.-]\s*\d{1,2})", re.IGNORECASE)
+
 # --- Gemini API 請求 ---
 def ask_gemini_json(prompt):
-    url = f"https://generativelanguage.googleapis.com/v1beta/models/{MODEL_NAME}:generateContent?key={GOOGLE_API_KEY}"
+    """相同 prompt 同時進行時只呼叫一次 Gemini (例如同一問題連續送出)"""
+    return GEMINI_FLIGHT.do(flight_key("json", MODEL_NAME, prompt), _ask_gemini_json, prompt)
+
+
+def _ask_gemini_json(prompt):
+    url = gemini_url(MODEL_NAME)
     headers = {"Content-Type": "application/json"}
     
-    safety_settings = [
-        {"category": "HARM_CATEGORY_HARASSMENT", "threshold": "BLOCK_NONE"},
-        {"category": "HARM_CATEGORY_HATE_SPEECH", "threshold": "BLOCK_NONE"},
-        {"category": "HARM_CATEGORY_SEXUALLY_EXPLICIT", "threshold": "BLOCK_NONE"},
-        {"category": "HARM_CATEGORY_DANGEROUS_CONTENT", "threshold": "BLOCK_NONE"}
-    ]
-    
     data = {
         "contents": [{"parts": [{"text": prompt}]}],
-        "safetySettings": safety_settings
+        "safetySettings": SAFETY_SETTINGS
     }
     
     try:
-        # Timeout 設為 80 秒
-        r = requests.post(url, headers=headers, json=data, verify=False, timeout=80)
+        # Timeout 設為 80 秒，只重試一次以免超過 gunicorn timeout
+        r = http_post(url, headers=headers, json=data, timeout=80, retries=1, idempotent=True)
         if r.status_code == 200:
             try:
                 raw = r.json()['candidates'][0]['content']['parts'][0]['text']
@@ -87,8 +122,44 @@ def ask_gemini_json(prompt):
     return None
 
 # --- 意圖與日期分析 ---
+def normalize_query(user_query):
+    """全形轉半形、轉小寫、移除空白與標點，讓「這個月花多少？」與「這個月花多少」共用快取"""
+    text = unicodedata.normalize("NFKC", user_query).lower()
+    return "".join(ch for ch in text if not (ch.isspace() or unicodedata.category(ch).startswith("P")))
+
 def analyze_query_intent(user_query):
-    now_str = datetime.now().strftime("%Y-%m-%d")
+    """先查快取，再試本地分類器與日期解析，最後才呼叫 Gemini；失敗結果不快取"""
+    today = datetime.now(TW_TZ).date()
+    now_str = today.strftime("%Y-%m-%d")
+    cache_key = f"{now_str}|{normalize_query(user_query)}"
+    cached = INTENT_CACHE.get(cache_key)
+    if cached:
+        print(f"⚡ Intent Cache Hit: {cache_key}")
+        return cached
+
+    # 日期先由本地解析 (結果固定、不會被 LLM 亂填)；解析不了又像有時間描述時才需要 Gemini
+    local_dates = parse_date_range(user_query, today)
+    needs_llm_dates = local_dates is None and TIME_EXPRESSION_RE.search(user_query)
+
+    # 本地分類器信心足夠、且日期已確定時，直接略過 Gemini
+    local_domain, confidence = classify_domain(user_query)
+    confident = confidence >= INTENT_LOCAL_THRESHOLD and not needs_llm_dates
+    if confident and random.random() >= INTENT_AUDIT_RATE:
+        print(f"⚡ Local Intent: {local_domain} ({confidence:.2f}) | Dates: {local_dates}")
+        intent = {"domain": local_domain, "date_filter": local_dates or {"start": "", "end": ""}}
+    else:
+        intent = ask_gemini_intent(user_query, now_str)
+        if isinstance(intent, dict) and intent.get("domain"):
+            record_label(user_query, local_domain, confidence, intent["domain"])
+            # 本地解析得到日期時以本地為準，否則檢查 Gemini 給的格式
+            intent["date_filter"] = local_dates or sanitize_date_filter(intent.get("date_filter"))
+
+    if isinstance(intent, dict) and intent.get("domain"):
+        INTENT_CACHE.set(cache_key, intent)
+        INTENT_CACHE.save(INTENT_CACHE_PATH)
+    return intent
+
+def ask_gemini_intent(user_query, now_str):
     
     # 🔥 修改重點：明確定義 Investment 與 Finance 的邊界
     prompt = f"""
@@ -141,30 +212,15 @@ def extract_notion_value(prop):
         if prop["rollup"]["type"] == "number": return prop["rollup"]["number"]
     return None
 
-def fetch_page_content(page_id):
-    url = f"https://api.notion.com/v1/blocks/{page_id}/children?page_size=30"
-    try:
-        r = requests.get(url, headers=NOTION_HEADERS, verify=False)
-        data = r.json()
-        content_text = ""
-        for block in data.get("results", []):
-            b_type = block.get("type")
-            if b_type in ["paragraph", "heading_1", "heading_2", "heading_3", "bulleted_list_item", "numbered_list_item", "to_do"]:
-                rich_text = block.get(b_type, {}).get("rich_text", [])
-                if rich_text:
-                    content_text += rich_text[0].get("plain_text", "") + "\n"
-        return content_text
-    except:
-        return ""
-
-def fetch_notion_data(db_env_key, domain, date_filter=None):
+def fetch_notion_data(db_env_key, domain, date_filter=None, stats=None):
+    """stats: 傳入 dict 則填入 limit / truncated / matched (供彙總表判斷是否為完整資料)"""
     db_id = os.getenv(db_env_key)
     if not db_id: return []
     
-    # 動態調整資料量 (有日期範圍撈 100 筆，無範圍撈 40 筆)
-    limit = 100 if (date_filter and date_filter.get("start")) else 40
+    # 動態調整資料量 (有日期範圍時翻頁撈完範圍內資料，無範圍撈 40 筆)
+    limit = FILTERED_ROW_LIMIT if (date_filter and date_filter.get("start")) else UNFILTERED_ROW_LIMIT
     
-    payload = {"page_size": limit}
+    payload = {}
     
     if date_filter and date_filter.get("start"):
         date_prop = FINANCE_DATE_PROP if domain == "FINANCE" else None 
@@ -186,24 +242,30 @@ def fetch_notion_data(db_env_key, domain, date_filter=None):
         payload["sorts"] = [{"timestamp": "created_time", "direction": "descending"}]
 
     try:
-        r = requests.post(f"https://api.notion.com/v1/databases/{db_id}/query", headers=NOTION_HEADERS, json=payload, verify=False)
-        data = r.json()
         results = []
-        fetch_content_flag = (domain == "KNOWLEDGE")
+        with span("notion_fetch", db=db_env_key) as info:
+            query_stats = {}
+            pages = mirror_query(db_id, payload, max_rows=limit, label=db_env_key, stats=query_stats)
+            info["rows"] = len(pages)
+        if stats is not None:
+            stats.update({"limit": limit, "truncated": bool(query_stats.get("truncated")), "matched": query_stats.get("matched")})
+        # 筆記內文：並行讀取，未修改過的頁面直接用本地快取
+        if domain == "KNOWLEDGE":
+            with span("page_bodies", db=db_env_key) as info:
+                bodies = get_page_bodies(pages, label=db_env_key)
+                info["bytes"] = sum(len(b.encode("utf-8")) for b in bodies.values())
+        else:
+            bodies = {}
 
-        for page in data.get("results", []):
+        for page in pages:
             simple = {}
-            if fetch_content_flag: simple["id"] = page["id"]
-
             for k, v in page["properties"].items():
                 val = extract_notion_value(v)
                 if val is not None and val != "": simple[k] = val
             
-            if fetch_content_flag:
-                content = fetch_page_content(page["id"])
-                if content:
-                    simple["content_body"] = content[:500]
-                del simple["id"]
+            content = bodies.get(page["id"])
+            if content:
+                simple["content_body"] = content[:500]
             
             results.append(simple)
         return results
@@ -212,16 +274,20 @@ def fetch_notion_data(db_env_key, domain, date_filter=None):
         return []
 
 # --- RAG 回應生成 ---
-def generate_rag_response(user_query, domain, raw_data):
-    context = json.dumps(raw_data, ensure_ascii=False, indent=2)
-    if len(context) > 60000: context = context[:60000] + "...(略)"
+def build_rag_prompt(user_query, domain, raw_data):
+    # 表格式打包：欄位名稱只出現一次，並在 token 預算內分配給各資料庫
+    context, report = pack_context(raw_data)
+    print(f"📦 RAG Context [{domain}]: {format_report(report)}")
 
     prompt = f"""
     你是 AI 財務與生活助理。使用者問："{user_query}"
-    資料庫 ({domain}) 紀錄：
+    資料庫 ({domain}) 紀錄 (每個資料庫第一行為欄位名稱，之後每行一筆，以 | 分隔)：
     {context}
     
-    請回傳 JSON 物件：
+    註：標示「本地精確計算」的表格 (及同一資料庫的依月 / 依日 / 依分類表) 數字請直接引用，不要再自行加總；
+    標示「部分樣本」的表格只涵蓋最新的部分紀錄，請說明是「最新 N 筆」的統計，不要當成完整期間的總額；「原始樣本」只是部分紀錄。
+    
+    請回傳 JSON 物件 (依序先輸出 card_data 再輸出 detailed_analysis)：
     1. "card_data": UI 摘要
        - title: 標題 (精簡有力)
        - main_stat: 核心數據 (如 "NT$52,597")
@@ -231,7 +297,17 @@ def generate_rag_response(user_query, domain, raw_data):
        - list [{{ "title": "重點標題", "content": "重點內容(建議50字內)" }}]
        - 內容請具體分析數據，不要只列數字。
     """
-    return ask_gemini_json(prompt)
+    return prompt
+
+def generate_rag_response(user_query, domain, raw_data):
+    return ask_gemini_json(build_rag_prompt(user_query, domain, raw_data))
+
+def stream_rag_fields(prompt):
+    """串流呼叫 Gemini，最上層欄位 (card_data / detailed_analysis) 一完成就 yield (key, value)"""
+    parser = JSONFieldStream()
+    for text in stream_generate(MODEL_NAME, prompt):
+        for field in parser.feed(text):
+            yield field
 
 # --- Flex Message 建構 ---
 def create_summary_flex(domain, data):
@@ -304,77 +380,142 @@ def create_analysis_flex(analysis_data):
         }
     }
 
-# 🔥 使用 requests 直接發送 LINE 訊息 (繞過 SDK 的 SSL 驗證)
-def reply_line_message(reply_token, messages):
-    url = "https://api.line.me/v2/bot/message/reply"
-    headers = {
-        "Content-Type": "application/json",
-        "Authorization": f"Bearer {LINE_CHANNEL_ACCESS_TOKEN}"
-    }
-    
-    # 將 FlexSendMessage 物件轉為 dict
-    msg_list = []
-    for msg in messages:
-        if isinstance(msg, FlexSendMessage):
-            # 🔥 關鍵修正：將 BubbleContainer 物件轉為字典
-            content_dict = msg.contents
-            if hasattr(content_dict, 'as_json_dict'):
-                content_dict = content_dict.as_json_dict()
-
-            msg_list.append({
-                "type": "flex",
-                "altText": msg.alt_text,
-                "contents": content_dict
-            })
-        elif isinstance(msg, TextSendMessage):
-            msg_list.append({
-                "type": "text",
-                "text": msg.text
-            })
-            
-    payload = {
-        "replyToken": reply_token,
-        "messages": msg_list
+# --- 營養帳本 ---
+def _ledger_summary(label, p):
+    return {"期間": label, "起": p["start"], "迄": p["end"], "熱量": p["calories"], "蛋白質": p["protein"], "碳水化合物": p["carbs"],
+            "脂肪": p["fat"], "餐數": p["meals"], "有紀錄天數": p["days_logged"], "日均熱量": p["daily_avg"]["calories"],
+            "日均蛋白質": p["daily_avg"]["protein"]}
+
+
+def ledger_context(user_id, date_filter=None):
+    """
+    回傳 {表名: rows}：日期範圍內每天的營養合計 + 期間合計 / 日均 (範圍含今天時另附本週累計)
+    整段期間都沒有紀錄時回傳空 dict
+    """
+    today = datetime.now(TW_TZ).date()
+    try:
+        end = min(today, datetime.strptime((date_filter or {}).get("end") or today.isoformat(), "%Y-%m-%d").date())
+        start = datetime.strptime((date_filter or {}).get("start") or "", "%Y-%m-%d").date() if (date_filter or {}).get("start") else end - timedelta(days=LEDGER_DEFAULT_DAYS - 1)
+        start = max(start, end - timedelta(days=LEDGER_MAX_DAYS - 1))
+        rows = daily_rows(user_id, start, end)
+        if not any(r["meals"] for r in rows): return {}
+        summary = [_ledger_summary("查詢期間", period_totals(user_id, start, end))]
+        if end == today: summary.append(_ledger_summary("本週 (週一起)", week_totals(user_id, today)))
+    except Exception as e:
+        print(f"❌ Ledger Error: {e}")
+        return {}
+    return {
+        "每日營養帳本 (本地累計)": [{"日期": r["day"], "熱量": r["calories"], "蛋白質": r["protein"], "碳水化合物": r["carbs"], "脂肪": r["fat"], "餐數": r["meals"]} for r in rows],
+        "營養帳本 期間合計 (本地精確計算)": summary,
     }
-    
+
+# --- 串流發送 ---
+def deliver_streamed_cards(domain, prompt, reply_token, user_id, event_ts=None):
+    """
+    card_data 完成即以 Reply 送出摘要卡，detailed_analysis 完成後再 Push 分析卡
+    串流失敗且尚未產生任何欄位時回傳 False，由呼叫端改用一般呼叫
+    """
+    started = time.time()
+    card_data, analysis_data, summary_sent = None, None, False
     try:
-        # verify=False 繞過 SSL
-        requests.post(url, headers=headers, json=payload, verify=False, timeout=10)
+        for key, value in stream_rag_fields(prompt):
+            if key == "card_data" and not summary_sent:
+                card_data = value if isinstance(value, dict) else {}
+                summary_msg = FlexSendMessage(alt_text=f"{domain} 查詢摘要", contents=create_summary_flex(domain, card_data))
+                summary_sent = deliver_line_message(reply_token, user_id, [summary_msg], event_ts)
+                print(f"⚡ 摘要卡已送出 ({int((time.time() - started) * 1000)} ms)")
+            elif key == "detailed_analysis":
+                analysis_data = value
     except Exception as e:
-        print(f"❌ LINE Reply Failed: {e}")
+        print(f"❌ Gemini Stream Failed: {e}")
+
+    if not summary_sent:
+        if analysis_data is None: return False
+        # 模型沒有先輸出 card_data：兩張卡一起送
+        deliver_line_message(reply_token, user_id, [
+            FlexSendMessage(alt_text=f"{domain} 查詢摘要", contents=create_summary_flex(domain, card_data or {})),
+            FlexSendMessage(alt_text=f"{domain} 詳細分析", contents=create_analysis_flex(analysis_data))
+        ], event_ts)
+        return True
+
+    if not analysis_data:
+        # 摘要卡已送出但串流中斷：改用一般呼叫補上分析，仍失敗時送簡短錯誤訊息而非空白卡片
+        print("⚠️ 串流未產生 detailed_analysis，改用一般呼叫補送分析卡")
+        analysis_data = (ask_gemini_json(prompt) or {}).get("detailed_analysis")
+    if not analysis_data:
+        push_line_message(user_id, [TextSendMessage(text="⚠️ 詳細分析生成失敗，請稍後再試。")])
+        return True
+    analysis_msg = FlexSendMessage(alt_text=f"{domain} 詳細分析", contents=create_analysis_flex(analysis_data))
+    push_line_message(user_id, [analysis_msg])
+    print(f"⚡ 分析卡已送出 ({int((time.time() - started) * 1000)} ms)")
+    return True
 
 # --- 主入口函式 ---
-def handle_rag_query(user_query, reply_token, line_bot_api):
+def handle_rag_query(user_query, reply_token, line_bot_api, user_id=None, event_ts=None):
+    """在背景 worker 執行：Reply Token 過期時自動改用 Push (需提供 user_id / event_ts)"""
     # 1. 意圖分析
-    intent = analyze_query_intent(user_query)
+    with span("intent"):
+        intent = analyze_query_intent(user_query)
     domain = intent.get("domain") if intent else "OTHER"
     date_filter = intent.get("date_filter")
+    set_trace_label(domain=domain)
     
     if domain == "OTHER":
-        reply_line_message(reply_token, [TextSendMessage(text="🤖 請輸入投資、記帳、健康或筆記相關問題。")])
+        deliver_line_message(reply_token, user_id, [TextSendMessage(text="🤖 請輸入投資、記帳、健康或筆記相關問題。")], event_ts)
         return
 
     # 2. 決定查詢目標
     target_dbs = list(set(DOMAIN_MAP.get(domain, []) + GLOBAL_DBS)) if domain != "KNOWLEDGE" else GLOBAL_DBS
     raw_data = {}
+
+    # 3. 筆記庫改用全文索引取最相關的段落 (索引不可用或沒有命中時仍撈最新 N 篇，例如「這週寫了哪些筆記」)
+    knowledge_dbs = [db for db in target_dbs if db in GLOBAL_DBS]
+    hits = None
+    if knowledge_dbs:
+        with span("knowledge_search") as info:
+            hits = search_knowledge(user_query, knowledge_dbs, date_filter=date_filter)
+            info["hits"] = len(hits) if hits is not None else None
+    if hits:
+        for hit in hits:
+            raw_data.setdefault(hit["db_key"], []).append({
+                "標題": hit["title"], "建立時間": (hit["created_time"] or "")[:10], "content_body": hit["text"]
+            })
+        target_dbs = [db for db in target_dbs if db not in GLOBAL_DBS]
     
-    # 3. 並行撈取資料
+    # 4. 並行撈取資料 (fetch_stats 記錄哪些資料庫因筆數上限而沒撈完)
+    fetch_stats = {db: {} for db in target_dbs}
     with concurrent.futures.ThreadPoolExecutor(max_workers=5) as executor:
-        future_to_db = {executor.submit(fetch_notion_data, db, domain, date_filter): db for db in target_dbs}
+        future_to_db = {executor.submit(traced(fetch_notion_data), db, domain, date_filter, fetch_stats[db]): db for db in target_dbs}
         for future in concurrent.futures.as_completed(future_to_db):
             db_name = future_to_db[future]
             res = future.result()
             if res: raw_data[db_name] = res
 
+    # 飲食問題直接附上使用者的每日營養累計 (本地帳本，數字精確且不需查 Notion)
+    if domain == "HEALTH" and user_id:
+        raw_data.update(ledger_context(user_id, date_filter))
+
     if not raw_data:
-        reply_line_message(reply_token, [TextSendMessage(text=f"⚠️ 在 {domain} 領域查無資料 (日期範圍可能無數據)。")])
+        deliver_line_message(reply_token, user_id, [TextSendMessage(text=f"⚠️ 在 {domain} 領域查無資料 (日期範圍可能無數據)。")], event_ts)
         return
 
-    # 4. 生成 AI 回應
-    ai_result = generate_rag_response(user_query, domain, raw_data)
+    # 5. 記帳 / 飲食先在本地彙總 (合計、分組、期間差異)，Gemini 只需解讀
+    with span("aggregate"):
+        raw_data = aggregate_raw_data(raw_data, domain, truncated={db: s for db, s in fetch_stats.items() if s.get("truncated")})
+
+    # 6. 生成 AI 回應 (可串流時先送摘要卡)
+    with span("build_prompt") as info:
+        prompt = build_rag_prompt(user_query, domain, raw_data)
+        info["bytes"] = len(prompt.encode("utf-8"))
+    if RAG_STREAMING and user_id and reply_token_alive(event_ts):
+        with span("generate_stream"):
+            if deliver_streamed_cards(domain, prompt, reply_token, user_id, event_ts): return
+    with span("generate") as info:
+        ai_result = ask_gemini_json(prompt)
+        if not ai_result: info["error"] = "empty"
     
     if ai_result:
-        # 5. 製作兩張 Flex Message
+        # 7. 製作兩張 Flex Message
         card_data = ai_result.get("card_data", {})
         analysis_data = ai_result.get("detailed_analysis", [])
         
@@ -385,7 +526,7 @@ def handle_rag_query(user_query, reply_token, line_bot_api):
         flex2_msg = FlexSendMessage(alt_text=f"{domain} 詳細分析", contents=flex2_content)
         
         # 發送
-        reply_line_message(reply_token, [flex1_msg, flex2_msg])
+        deliver_line_message(reply_token, user_id, [flex1_msg, flex2_msg], event_ts)
     else:
-        reply_line_message(reply_token, [TextSendMessage(text="⚠️ AI 生成回應失敗。")])
+        deliver_line_message(reply_token, user_id, [TextSendMessage(text="⚠️ AI 生成回應失敗。")], event_ts)
 
@@ -0,0 +1,207 @@
+import os
+import time
+import sqlite3
+import hashlib
+import threading
+from collections import OrderedDict
+
+# --- 飲食對話 Session 儲存 ---
+# 餐前照片要等使用者傳餐後照片 / 按「完食」才會用到，需設定過期時間與容量上限；
+# sqlite 後端可讓多個 gunicorn worker 與重啟後共用同一份 session
+SESSION_BACKEND = os.getenv("DIET_SESSION_BACKEND", "sqlite")        # sqlite / memory
+SESSION_TTL = int(os.getenv("DIET_SESSION_TTL", "10800"))            # 秒，超過視為放棄
+SESSION_MAX_BYTES = int(os.getenv("DIET_SESSION_MAX_BYTES", str(50 * 1024 * 1024)))   # 所有照片合計上限
+SESSION_DB_PATH = os.getenv("DIET_SESSION_PATH", "diet_sessions.sqlite3")
+# memory 後端：記憶體內最多保留多少 bytes，超過的照片改存到 SESSION_SPILL_DIR
+SESSION_MEMORY_BYTES = int(os.getenv("DIET_SESSION_MEMORY_BYTES", str(8 * 1024 * 1024)))
+SESSION_SPILL_DIR = os.getenv("DIET_SESSION_SPILL_DIR", "diet_sessions")
+
+
+class MemorySessionStore:
+    """
+    單一行程用的 session 儲存
+    - 每筆 session 有 TTL，容量超過 max_bytes 時淘汰最舊的 session
+    - 記憶體內照片超過 memory_bytes 時，最舊的照片移到磁碟
+    """
+
+    def __init__(self, ttl, max_bytes, memory_bytes, spill_dir):
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self.memory_bytes = memory_bytes
+        self.spill_dir = spill_dir
+        self._data = OrderedDict()   # user_id -> {step, created_at, expires_at, image, path, size}
+        self._lock = threading.Lock()
+        self.expired = 0
+        self.evicted = 0
+        self.spilled = 0
+
+    def _spill_path(self, user_id):
+        return os.path.join(self.spill_dir, hashlib.sha256(user_id.encode()).hexdigest()[:32] + ".jpg")
+
+    def _drop(self, user_id):
+        entry = self._data.pop(user_id, None)
+        if entry and entry["path"]:
+            try: os.remove(entry["path"])
+            except OSError: pass
+        return entry
+
+    def _read_image(self, entry):
+        if entry["image"] is not None: return entry["image"]
+        try:
+            with open(entry["path"], "rb") as f: return f.read()
+        except OSError:
+            return None
+
+    def _enforce_limits(self):
+        now = time.time()
+        for uid in [u for u, e in self._data.items() if e["expires_at"] < now]:
+            self._drop(uid); self.expired += 1
+        while len(self._data) > 1 and sum(e["size"] for e in self._data.values()) > self.max_bytes:
+            self._drop(next(iter(self._data))); self.evicted += 1
+        in_memory = sum(e["size"] for e in self._data.values() if e["image"] is not None)
+        for uid, entry in self._data.items():
+            if in_memory <= self.memory_bytes: break
+            if entry["image"] is None: continue
+            try:
+                os.makedirs(self.spill_dir, exist_ok=True)
+                path = self._spill_path(uid)
+                with open(path, "wb") as f: f.write(entry["image"])
+            except OSError as e:
+                print(f"❌ Session 照片寫入磁碟失敗: {e}")
+                break
+            entry["path"] = path; entry["image"] = None
+            in_memory -= entry["size"]; self.spilled += 1
+
+    def put(self, user_id, step, image):
+        with self._lock:
+            self._drop(user_id)
+            now = time.time()
+            self._data[user_id] = {"step": step, "created_at": now, "expires_at": now + self.ttl,
+                                   "image": image, "path": None, "size": len(image or b"")}
+            self._enforce_limits()
+
+    def pop(self, user_id):
+        """取出並刪除 session；不存在或已過期回傳 None"""
+        with self._lock:
+            entry = self._data.get(user_id)
+            if entry is None: return None
+            if entry["expires_at"] < time.time():
+                self._drop(user_id); self.expired += 1
+                return None
+            image = self._read_image(entry)
+            self._drop(user_id)
+        return {"step": entry["step"], "created_at": entry["created_at"], "image": image}
+
+    def peek_step(self, user_id):
+        with self._lock:
+            entry = self._data.get(user_id)
+            return entry["step"] if entry and entry["expires_at"] >= time.time() else None
+
+    def stats(self):
+        with self._lock:
+            self._enforce_limits()
+            return {
+                "backend": "memory", "sessions": len(self._data),
+                "bytes_memory": sum(e["size"] for e in self._data.values() if e["image"] is not None),
+                "bytes_disk": sum(e["size"] for e in self._data.values() if e["image"] is None),
+                "max_bytes": self.max_bytes, "ttl": self.ttl,
+                "expired": self.expired, "evicted": self.evicted, "spilled": self.spilled,
+            }
+
+
+class SQLiteSessionStore:
+    """
+    多個 worker / 重啟後共用的 session 儲存 (照片以 BLOB 存在 SQLite 檔)
+    pop() 在同一個交易內讀取並刪除，兩個 worker 不會同時拿到同一份餐前照片
+    """
+
+    def __init__(self, path, ttl, max_bytes):
+        self.path = path
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self.expired = 0
+        self.evicted = 0
+        conn = self._connect()
+        try:
+            conn.execute("""CREATE TABLE IF NOT EXISTS diet_sessions (
+                user_id TEXT PRIMARY KEY,
+                step TEXT NOT NULL,
+                created_at REAL NOT NULL,
+                expires_at REAL NOT NULL,
+                image BLOB,
+                size INTEGER NOT NULL)""")
+        finally:
+            conn.close()
+
+    def _connect(self):
+        conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+        conn.execute("PRAGMA journal_mode=WAL")
+        return conn
+
+    def _enforce_limits(self, conn):
+        self.expired += conn.execute("DELETE FROM diet_sessions WHERE expires_at < ?", (time.time(),)).rowcount
+        total = conn.execute("SELECT COALESCE(SUM(size), 0) FROM diet_sessions").fetchone()[0]
+        if total <= self.max_bytes: return
+        # 由最舊的開始淘汰，至少保留剛寫入的那一筆
+        for user_id, size in conn.execute("SELECT user_id, size FROM diet_sessions ORDER BY created_at").fetchall()[:-1]:
+            conn.execute("DELETE FROM diet_sessions WHERE user_id = ?", (user_id,))
+            self.evicted += 1; total -= size
+            if total <= self.max_bytes: break
+
+    def put(self, user_id, step, image):
+        now = time.time()
+        conn = self._connect()
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            conn.execute("INSERT OR REPLACE INTO diet_sessions (user_id, step, created_at, expires_at, image, size) VALUES (?, ?, ?, ?, ?, ?)",
+                         (user_id, step, now, now + self.ttl, image, len(image or b"")))
+            self._enforce_limits(conn)
+            conn.execute("COMMIT")
+        finally:
+            conn.close()
+
+    def pop(self, user_id):
+        conn = self._connect()
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            row = conn.execute("SELECT step, created_at, expires_at, image FROM diet_sessions WHERE user_id = ?", (user_id,)).fetchone()
+            if row: conn.execute("DELETE FROM diet_sessions WHERE user_id = ?", (user_id,))
+            conn.execute("COMMIT")
+        finally:
+            conn.close()
+        if row is None: return None
+        if row[2] < time.time():
+            self.expired += 1
+            return None
+        return {"step": row[0], "created_at": row[1], "image": row[3]}
+
+    def peek_step(self, user_id):
+        conn = self._connect()
+        try:
+            row = conn.execute("SELECT step FROM diet_sessions WHERE user_id = ? AND expires_at >= ?", (user_id, time.time())).fetchone()
+        finally:
+            conn.close()
+        return row[0] if row else None
+
+    def stats(self):
+        conn = self._connect()
+        try:
+            self._enforce_limits(conn)
+            sessions, total = conn.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM diet_sessions").fetchone()
+        finally:
+            conn.close()
+        return {
+            "backend": "sqlite", "sessions": sessions, "bytes_disk": total,
+            "max_bytes": self.max_bytes, "ttl": self.ttl,
+            "expired": self.expired, "evicted": self.evicted,   # 本 worker 的累計
+        }
+
+
+def create_session_store():
+    if SESSION_BACKEND == "memory":
+        return MemorySessionStore(SESSION_TTL, SESSION_MAX_BYTES, SESSION_MEMORY_BYTES, SESSION_SPILL_DIR)
+    try:
+        return SQLiteSessionStore(SESSION_DB_PATH, SESSION_TTL, SESSION_MAX_BYTES)
+    except sqlite3.Error as e:
+        print(f"⚠️ Session SQLite 無法使用，改用記憶體: {e}")
+        return MemorySessionStore(SESSION_TTL, SESSION_MAX_BYTES, SESSION_MEMORY_BYTES, SESSION_SPILL_DIR)
@@ -0,0 +1,195 @@
+import os
+import json
+import time
+import random
+import sqlite3
+import threading
+import requests
+from urllib3.exceptions import NewConnectionError
+from http_helper_v1_0 import http_post
+from notion_helper_v1_0 import NOTION_API_BASE, NOTION_HEADERS
+
+# --- Notion 寫入佇列 (write-behind) ---
+# 新增頁面先寫進本地 SQLite 立即返回，背景 thread 依速率限制送出，確定沒送出的失敗會重試，多次失敗移到 dead-letter
+WRITE_QUEUE_PATH = os.getenv("NOTION_WRITE_QUEUE_PATH", "notion_writes.sqlite3")
+WRITE_RATE = float(os.getenv("NOTION_WRITE_RATE", "2"))              # 每秒最多幾筆 (Notion 平均上限約 3 req/s)
+WRITE_MAX_ATTEMPTS = int(os.getenv("NOTION_WRITE_MAX_ATTEMPTS", "8"))
+WRITE_BATCH = 10              # drain_once 最多連續送出幾筆 (每筆送出前才認領，避免整批卡在 inflight 超過 INFLIGHT_TIMEOUT)
+WRITE_BACKOFF_BASE = 5        # 秒，第 n 次失敗後等待 5 * 2^(n-1) 秒 (上限 WRITE_BACKOFF_MAX)
+WRITE_BACKOFF_MAX = 600
+INFLIGHT_TIMEOUT = 120        # 秒，認領後太久沒有結果 (worker 中途被砍) 視為可重新認領
+POLL_INTERVAL = 5
+
+# 建立頁面不是冪等操作：只有確定 Notion 沒收到請求 (429、連線建立失敗) 才自動重試；
+# 5xx / 讀取逾時 / 409 時頁面可能已建立，標記為 unknown 移到 dead-letter，確認 Notion 後再以 retry_dead 重送
+# 其餘 4xx (欄位錯誤等) 重送也不會成功，直接移到 dead-letter
+RETRYABLE_STATUS = {429}
+
+_wakeup = threading.Event()
+_drainer = None
+_drainer_lock = threading.Lock()
+
+
+def _connect():
+    conn = sqlite3.connect(WRITE_QUEUE_PATH, timeout=30, isolation_level=None)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("""CREATE TABLE IF NOT EXISTS notion_writes (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        label TEXT,
+        payload TEXT NOT NULL,
+        status TEXT NOT NULL DEFAULT 'pending',
+        attempts INTEGER NOT NULL DEFAULT 0,
+        next_attempt_at REAL NOT NULL,
+        claimed_at REAL,
+        last_error TEXT,
+        created_at REAL NOT NULL)""")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_notion_writes_status ON notion_writes (status, next_attempt_at)")
+    return conn
+
+
+def _ensure_drainer():
+    global _drainer
+    if _drainer and _drainer.is_alive(): return
+    with _drainer_lock:
+        if _drainer and _drainer.is_alive(): return
+        _drainer = threading.Thread(target=_drain_loop, name="notion-writes", daemon=True)
+        _drainer.start()
+
+
+def enqueue_page(payload, label=None):
+    """將 /v1/pages 的建立請求寫入佇列後立即返回 (回傳佇列 id)"""
+    now = time.time()
+    conn = _connect()
+    try:
+        cur = conn.execute("INSERT INTO notion_writes (label, payload, next_attempt_at, created_at) VALUES (?, ?, ?, ?)",
+                           (label, json.dumps(payload, ensure_ascii=False), now, now))
+        write_id = cur.lastrowid
+    finally:
+        conn.close()
+    _ensure_drainer()
+    _wakeup.set()
+    return write_id
+
+
+def _claim(conn):
+    """
+    認領一筆到期的寫入 (同一交易內標記為 inflight，多個 worker 不會重複送出)
+    回傳 (id, label, payload, attempts, claimed_at)，沒有到期的寫入時回傳 None
+    """
+    now = time.time()
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        row = conn.execute(
+            "SELECT id, label, payload, attempts FROM notion_writes "
+            "WHERE (status = 'pending' AND next_attempt_at <= ?) OR (status = 'inflight' AND claimed_at < ?) "
+            "ORDER BY id LIMIT 1", (now, now - INFLIGHT_TIMEOUT)
+        ).fetchone()
+        if row: conn.execute("UPDATE notion_writes SET status = 'inflight', claimed_at = ? WHERE id = ?", (now, row[0]))
+        conn.execute("COMMIT")
+    except Exception:
+        conn.execute("ROLLBACK")
+        raise
+    return (*row, now) if row else None
+
+
+def _not_sent(e):
+    """連線根本沒建立 (逾時 / 拒絕 / DNS 失敗)：請求一定沒送到 Notion"""
+    if isinstance(e, requests.exceptions.ConnectTimeout): return True
+    reason = getattr(e.args[0], "reason", None) if isinstance(e, requests.exceptions.ConnectionError) and e.args else None
+    return isinstance(reason, NewConnectionError)
+
+
+def _send(payload):
+    """回傳 (結果, 錯誤訊息)；結果為 ok / retry (確定沒送出) / unknown (可能已建立) / dead"""
+    try:
+        r = http_post(f"{NOTION_API_BASE}/pages", headers=NOTION_HEADERS, json=payload, retries=0)
+    except Exception as e:
+        return ("retry" if _not_sent(e) else "unknown"), str(e)[:300]
+    if r.status_code == 200: return "ok", None
+    error = f"{r.status_code}: {r.text[:300]}"
+    if r.status_code in RETRYABLE_STATUS: return "retry", error
+    return ("unknown" if r.status_code >= 500 or r.status_code == 409 else "dead"), error
+
+
+def drain_once():
+    """逐筆認領並送出到期的寫入 (最多 WRITE_BATCH 筆)，回傳處理筆數"""
+    conn = _connect()
+    count = 0
+    try:
+        while count < WRITE_BATCH:
+            claimed = _claim(conn)
+            if not claimed: break
+            write_id, label, payload, attempts, claimed_at = claimed
+            count += 1
+            started = time.time()
+            outcome, error = _send(json.loads(payload))
+            attempts += 1
+            # 結果只寫回仍由自己認領的列 (claimed_at 相同)，已被其他 worker 重新認領時不覆蓋
+            mine = "id = ? AND claimed_at = ?"
+            if outcome == "ok":
+                conn.execute(f"DELETE FROM notion_writes WHERE {mine}", (write_id, claimed_at))
+                print(f"✅ Notion 寫入成功 [{label}] #{write_id} (第 {attempts} 次)")
+            elif outcome == "unknown":
+                conn.execute(f"UPDATE notion_writes SET status = 'unknown', attempts = ?, last_error = ? WHERE {mine}", (attempts, error, write_id, claimed_at))
+                print(f"❓ Notion 寫入結果不明 [{label}] #{write_id} (可能已建立，不自動重送): {error}")
+            elif outcome == "retry" and attempts < WRITE_MAX_ATTEMPTS:
+                delay = min(WRITE_BACKOFF_MAX, WRITE_BACKOFF_BASE * 2 ** (attempts - 1)) * random.uniform(0.8, 1.2)
+                conn.execute(f"UPDATE notion_writes SET status = 'pending', attempts = ?, next_attempt_at = ?, last_error = ? WHERE {mine}",
+                             (attempts, time.time() + delay, error, write_id, claimed_at))
+                print(f"⚠️ Notion 寫入失敗 [{label}] #{write_id}，{delay:.0f}s 後重試 ({attempts}/{WRITE_MAX_ATTEMPTS}): {error}")
+            else:
+                conn.execute(f"UPDATE notion_writes SET status = 'dead', attempts = ?, last_error = ? WHERE {mine}", (attempts, error, write_id, claimed_at))
+                print(f"❌ Notion 寫入放棄 [{label}] #{write_id} (移到 dead-letter): {error}")
+            # 速率限制：每筆之間至少間隔 1 / WRITE_RATE 秒
+            time.sleep(max(0.0, 1 / WRITE_RATE - (time.time() - started)))
+        return count
+    finally:
+        conn.close()
+
+
+def _drain_loop():
+    while True:
+        try:
+            if drain_once(): continue
+        except Exception as e:
+            print(f"❌ Notion 寫入佇列錯誤: {e}")
+        _wakeup.wait(POLL_INTERVAL)
+        _wakeup.clear()
+
+
+def start_drainer():
+    """啟動時呼叫：送出上次關機前尚未完成的寫入"""
+    _ensure_drainer()
+    _wakeup.set()
+
+
+def retry_dead(write_id=None):
+    """將 dead-letter (含結果不明的 unknown，請先確認 Notion 沒有該筆) 重新排入佇列 (不指定 id 時全部重試)"""
+    conn = _connect()
+    try:
+        sql = "UPDATE notion_writes SET status = 'pending', attempts = 0, next_attempt_at = ? WHERE status IN ('dead', 'unknown')"
+        args = [time.time()]
+        if write_id is not None:
+            sql += " AND id = ?"; args.append(write_id)
+        count = conn.execute(sql, args).rowcount
+    finally:
+        conn.close()
+    if count: start_drainer()
+    return count
+
+
+def write_queue_status(limit=10):
+    conn = _connect()
+    try:
+        counts = dict(conn.execute("SELECT status, COUNT(*) FROM notion_writes GROUP BY status").fetchall())
+        oldest = conn.execute("SELECT MIN(created_at) FROM notion_writes WHERE status IN ('pending', 'inflight')").fetchone()[0]
+        dead = conn.execute("SELECT id, label, attempts, last_error, created_at, status FROM notion_writes WHERE status IN ('dead', 'unknown') ORDER BY id DESC LIMIT ?", (limit,)).fetchall()
+        retrying = conn.execute("SELECT id, label, attempts, last_error, next_attempt_at FROM notion_writes WHERE status = 'pending' AND attempts > 0 ORDER BY id LIMIT ?", (limit,)).fetchall()
+    finally:
+        conn.close()
+    return {
+        "pending": counts.get("pending", 0), "inflight": counts.get("inflight", 0), "dead": counts.get("dead", 0), "unknown": counts.get("unknown", 0),
+        "oldest_pending_age_s": round(time.time() - oldest, 1) if oldest else 0,
+        "retrying": [{"id": r[0], "label": r[1], "attempts": r[2], "error": r[3], "next_attempt_in_s": round(r[4] - time.time(), 1)} for r in retrying],
+        "dead_letters": [{"id": r[0], "label": r[1], "status": r[5], "attempts": r[2], "error": r[3], "created_at": r[4]} for r in dead],
+    }